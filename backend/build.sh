@@ -11,3 +11,6 @@ python manage.py collectstatic --no-input
 
 # Run migrations
 python manage.py migrate
+
+# Create the database cache table (used when no Redis cache is configured)
+python manage.py createcachetable
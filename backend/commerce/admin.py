@@ -1,7 +1,9 @@
 from django.contrib import admin
+from . import caching
+from .exports import ORDER_COLUMNS, ORDER_ITEM_COLUMNS, PRODUCT_COLUMNS, export_response
 from .models import (
     Category, Product, ProductImage, Order, OrderItem, Cart, CartItem, Wishlist,
-    Project, ProductAlert, Kit, Flag, Dispute
+    Project, ProductAlert, AlertMatch, Kit, KitReservation, Flag, Dispute
 )
 
 
@@ -68,19 +70,30 @@ class ProductAdmin(admin.ModelAdmin):
         }),
     )
     
-    actions = ['mark_as_sold', 'mark_as_active', 'mark_as_inactive']
+    actions = ['mark_as_sold', 'mark_as_active', 'mark_as_inactive', 'export_csv', 'export_ndjson']
     
     def mark_as_sold(self, request, queryset):
         queryset.update(status='sold')
+        caching.invalidate_on_commit()
     mark_as_sold.short_description = 'Mark selected products as sold'
     
     def mark_as_active(self, request, queryset):
         queryset.update(status='active')
+        caching.invalidate_on_commit()
     mark_as_active.short_description = 'Mark selected products as active'
     
     def mark_as_inactive(self, request, queryset):
         queryset.update(status='inactive')
+        caching.invalidate_on_commit()
     mark_as_inactive.short_description = 'Mark selected products as inactive'
+    
+    def export_csv(self, request, queryset):
+        return export_response(queryset, PRODUCT_COLUMNS, 'csv', 'products')
+    export_csv.short_description = 'Export selected products as CSV'
+    
+    def export_ndjson(self, request, queryset):
+        return export_response(queryset, PRODUCT_COLUMNS, 'ndjson', 'products')
+    export_ndjson.short_description = 'Export selected products as NDJSON'
 
 
 @admin.register(Order)
@@ -88,7 +101,7 @@ class OrderAdmin(admin.ModelAdmin):
     list_display = ['id', 'buyer', 'seller', 'project', 'total_amount', 'delivery_method', 'delivery_status', 'escrow_status', 'created_at']
     list_filter = ['delivery_status', 'escrow_status', 'delivery_method', 'created_at']
     search_fields = ['buyer__username', 'seller__username', 'project__name']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['escrow_released_at', 'created_at', 'updated_at']
     inlines = [OrderItemInline]
     
     fieldsets = (
@@ -102,12 +115,27 @@ class OrderAdmin(admin.ModelAdmin):
             'fields': ('delivery_method', 'delivery_status')
         }),
         ('Payment', {
-            'fields': ('escrow_status',)
+            'fields': ('escrow_status', 'escrow_released_at')
         }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at')
         }),
     )
+    
+    actions = ['export_csv', 'export_ndjson', 'export_items_csv']
+    
+    def export_csv(self, request, queryset):
+        return export_response(queryset, ORDER_COLUMNS, 'csv', 'orders')
+    export_csv.short_description = 'Export selected orders as CSV'
+    
+    def export_ndjson(self, request, queryset):
+        return export_response(queryset, ORDER_COLUMNS, 'ndjson', 'orders')
+    export_ndjson.short_description = 'Export selected orders as NDJSON'
+    
+    def export_items_csv(self, request, queryset):
+        items = OrderItem.objects.filter(order__in=queryset.values('pk'))
+        return export_response(items, ORDER_ITEM_COLUMNS, 'csv', 'order-items')
+    export_items_csv.short_description = 'Export line items of selected orders as CSV'
 
 
 @admin.register(Cart)
@@ -153,6 +181,18 @@ class ProjectAdmin(admin.ModelAdmin):
             'fields': ('created_at', 'updated_at')
         }),
     )
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_totals()
+    
+    # Unsaved projects (the add form) have no totals annotated yet
+    def total_spent(self, obj):
+        return getattr(obj, 'total_spent', None)
+    total_spent.admin_order_field = 'total_spent'
+    
+    def order_count(self, obj):
+        return getattr(obj, 'order_count', None)
+    order_count.admin_order_field = 'order_count'
 
 
 @admin.register(ProductAlert)
@@ -181,6 +221,15 @@ class ProductAlertAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(AlertMatch)
+class AlertMatchAdmin(admin.ModelAdmin):
+    list_display = ['id', 'alert', 'product', 'notified_at', 'created_at']
+    list_filter = ['notified_at', 'created_at']
+    search_fields = ['alert__user__username', 'alert__keywords', 'product__title']
+    raw_id_fields = ['alert', 'product']
+    readonly_fields = ['created_at']
+
+
 @admin.register(Kit)
 class KitAdmin(admin.ModelAdmin):
     list_display = ['title', 'kit_type', 'status', 'price', 'quantity_available', 'quantity_sold', 'start_date', 'end_date', 'is_available']
@@ -210,6 +259,15 @@ class KitAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(KitReservation)
+class KitReservationAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kit', 'buyer', 'quantity', 'status', 'expires_at', 'created_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['kit__title', 'buyer__username']
+    # Stock moves with the status, so reservations only change through commerce.kits
+    readonly_fields = ['kit', 'buyer', 'quantity', 'status', 'expires_at', 'created_at', 'updated_at']
+
+
 @admin.register(Flag)
 class FlagAdmin(admin.ModelAdmin):
     list_display = ['id', 'flag_type', 'reason', 'status', 'flagged_by', 'get_target', 'created_at']
@@ -0,0 +1,179 @@
+"""
+Push matching of newly listed products against instant ProductAlerts.
+
+Active instant alerts are kept in an inverted index, the ``AlertPosting``
+table. Each alert is posted under the keys of its most selective criterion:
+
+* keyword phrases of 3+ characters under one of their trigrams (every
+  substring match of the phrase must contain it),
+* otherwise the geo cells covering the alert radius,
+* otherwise its category, then its condition,
+* otherwise its price ceiling (an indexed range lookup),
+* alerts with no criteria at all match everything.
+
+Postings follow ProductAlert saves and deletes (see ``commerce.signals``),
+so every process reads the same index and nothing is rebuilt. A new product
+only reads the postings under its own trigrams, cell, category, condition
+and price, and the few candidates found are verified with the same semantics
+as ``check_matches``.
+"""
+from collections import defaultdict
+from math import asin, cos, radians, sin, sqrt
+
+from django.db.models import Count, Q
+
+from .geo import EARTH_RADIUS_KM, bounding_box, cell_ranges, geo_cell
+from .models import AlertMatch, AlertPosting, ProductAlert
+
+# Alerts whose radius covers more cells than this are posted under another key
+MAX_POSTED_CELLS = 2000
+ANY_KEY = 'any'
+PRICE_KEY = 'price'
+# Posting keys looked up per query, well below SQLite's bound parameter limit
+KEYS_PER_QUERY = 500
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(radians, (lat1, lng1, lat2, lng2))
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * asin(min(sqrt(a), 1.0))
+
+
+def alert_matches(alert, product):
+    """Full match test of one alert against one product."""
+    if product.status != 'active':
+        return False
+    if alert.category_id and alert.category_id != product.category_id:
+        return False
+    if alert.condition and alert.condition != product.condition:
+        return False
+    if alert.max_price and product.price > alert.max_price:
+        return False
+    if alert.location_lat is not None and alert.location_long is not None:
+        if product.location_lat is None or product.location_long is None:
+            return False
+        distance = _haversine_km(
+            float(alert.location_lat), float(alert.location_long),
+            float(product.location_lat), float(product.location_long)
+        )
+        if distance > alert.radius_km:
+            return False
+    keywords = alert.keywords.strip().lower()
+    if keywords and keywords not in f'{product.title}\n{product.description}'.lower():
+        return False
+    return True
+
+
+def _covering_cells(alert):
+    box = bounding_box(float(alert.location_lat), float(alert.location_long), alert.radius_km)
+    ranges = cell_ranges(box)
+    if ranges is None or sum(last - first + 1 for first, last in ranges) > MAX_POSTED_CELLS:
+        return None
+    return [cell for first, last in ranges for cell in range(first, last + 1)]
+
+
+def instant_alerts():
+    return ProductAlert.objects.filter(is_active=True, notification_frequency='instant')
+
+
+def alert_postings(alert):
+    """Return the (unsaved) postings of ``alert``; none unless it is an active instant alert."""
+    if not alert.is_active or alert.notification_frequency != 'instant':
+        return []
+    keywords = alert.keywords.strip().lower()
+    if len(keywords) >= 3:
+        # Post under the currently least crowded trigram of the phrase
+        keys = sorted(f'gram:{gram}' for gram in trigrams(keywords))
+        crowding = dict(
+            AlertPosting.objects.filter(key__in=keys).values_list('key').annotate(count=Count('id')).order_by()
+        )
+        return [AlertPosting(alert=alert, key=min(keys, key=lambda key: crowding.get(key, 0)))]
+    if alert.location_lat is not None and alert.location_long is not None:
+        cells = _covering_cells(alert)
+        if cells is not None:
+            return [AlertPosting(alert=alert, key=f'cell:{cell}') for cell in cells]
+    if alert.category_id:
+        return [AlertPosting(alert=alert, key=f'category:{alert.category_id}')]
+    if alert.condition:
+        return [AlertPosting(alert=alert, key=f'condition:{alert.condition}')]
+    if alert.max_price:
+        return [AlertPosting(alert=alert, key=PRICE_KEY, max_price=alert.max_price)]
+    return [AlertPosting(alert=alert, key=ANY_KEY)]
+
+
+def post_alert(alert):
+    """Replace the postings of a saved alert."""
+    AlertPosting.objects.filter(alert=alert).delete()
+    AlertPosting.objects.bulk_create(alert_postings(alert))
+
+
+def rebuild():
+    """Repost every active instant alert; returns the number of postings written."""
+    AlertPosting.objects.all().delete()
+    written = 0
+    for alert in instant_alerts().order_by('id').iterator(chunk_size=1000):
+        written += len(AlertPosting.objects.bulk_create(alert_postings(alert)))
+    return written
+
+
+def product_keys(product):
+    """The posting keys an alert matching ``product`` can be found under, besides its price."""
+    keys = {f'gram:{gram}' for gram in trigrams(f'{product.title}\n{product.description}'.lower())}
+    cell = geo_cell(product.location_lat, product.location_long)
+    if cell is not None:
+        keys.add(f'cell:{cell}')
+    keys.update([f'category:{product.category_id}', f'condition:{product.condition}', ANY_KEY])
+    return keys
+
+
+def match_products(products):
+    """Return the list of matching instant alerts for each of ``products``."""
+    if not products:
+        return []
+    product_key_sets = [product_keys(product) for product in products]
+    keys = sorted(set().union(*product_key_sets))
+    posted = defaultdict(set)
+    priced = []
+    for start in range(0, len(keys), KEYS_PER_QUERY):
+        lookup = Q(key__in=keys[start:start + KEYS_PER_QUERY])
+        if not start:
+            lookup |= Q(key=PRICE_KEY, max_price__gte=min(product.price for product in products))
+        for key, alert_id, max_price in AlertPosting.objects.filter(lookup).values_list('key', 'alert_id', 'max_price'):
+            if key == PRICE_KEY:
+                priced.append((max_price, alert_id))
+            else:
+                posted[key].add(alert_id)
+
+    alerts = ProductAlert.objects.in_bulk(
+        set().union(*posted.values(), (alert_id for _price, alert_id in priced))
+    )
+    matches = []
+    for product, lookup_keys in zip(products, product_key_sets):
+        ids = set().union(*(posted.get(key, ()) for key in lookup_keys))
+        ids.update(alert_id for max_price, alert_id in priced if max_price >= product.price)
+        matches.append([alerts[alert_id] for alert_id in ids if alert_matches(alerts[alert_id], product)])
+    return matches
+
+
+def record_matches(product):
+    """Match a new product against instant alerts and record the hits."""
+    hits = match_products([product])[0]
+    AlertMatch.objects.bulk_create(
+        [AlertMatch(alert_id=alert.id, product_id=product.pk) for alert in hits],
+        ignore_conflicts=True
+    )
+    return hits
+
+
+def record_batch_matches(products):
+    """``record_matches`` for many new products at once; returns the number of matches."""
+    matches = [
+        AlertMatch(alert_id=alert.id, product_id=product.pk)
+        for product, hits in zip(products, match_products(products)) for alert in hits
+    ]
+    AlertMatch.objects.bulk_create(matches, ignore_conflicts=True)
+    return len(matches)
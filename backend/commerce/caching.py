@@ -0,0 +1,99 @@
+"""
+Versioned response cache for catalog read endpoints.
+
+Responses are stored in the ``catalog`` cache alias (Redis via
+``CATALOG_CACHE_URL``, else the database cache in production and local memory
+in development) under keys made of the current catalog version, the view, its
+URL kwargs and the normalized query string. Catalog writes bump the version once their transaction commits,
+so every previously cached page becomes unreachable at once and simply ages
+out. The version lives in the same cache, so with several worker processes
+the backend must be shared for one worker's bump to reach the others.
+"""
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+CACHE_ALIAS = 'catalog'
+VERSION_KEY = 'catalog:version'
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def current_version():
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Seed from the clock so an evicted version never reuses old keys
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    cache = get_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, int(time.time() * 1000), None)
+
+
+def invalidate_on_commit():
+    """Bump the catalog version after the current transaction commits."""
+    transaction.on_commit(bump_version)
+
+
+def normalized_query(query_params):
+    return urlencode(sorted((key, value) for key in query_params for value in query_params.getlist(key)))
+
+
+class CachedResponseMixin:
+    """
+    Serve ``cache_actions`` from the catalog cache.
+
+    Views narrow what is cacheable by overriding ``is_cacheable``.
+    """
+    cache_actions = ('list', 'retrieve')
+
+    def is_cacheable(self, request):
+        return request.method == 'GET' and self.action in self.cache_actions
+
+    def get_cache_key(self, request):
+        # Host is part of the key because pagination links are absolute URLs
+        raw = '|'.join([
+            request.get_host(),
+            type(self).__name__,
+            self.action,
+            normalized_query(request.query_params),
+            urlencode(sorted(self.kwargs.items())),
+        ])
+        digest = hashlib.md5(raw.encode()).hexdigest()
+        return f'catalog:v{current_version()}:{digest}'
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return handler(request, *args, **kwargs)
+        cache = get_cache()
+        key = self.get_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
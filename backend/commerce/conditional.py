@@ -0,0 +1,115 @@
+"""
+ETag / Last-Modified validators for product and kit reads.
+
+Validators are derived without serializing anything: a detail view uses the
+object's ``updated_at``, a list view ``max(updated_at)`` and ``count`` over
+the filtered queryset plus the query string. Matching ``If-None-Match`` /
+``If-Modified-Since`` headers get a bodiless 304.
+
+Lists only carry an ETag. Deleting a row or filtering it out never moves
+``max(updated_at)``, so a Last-Modified date would claim nothing changed.
+
+Some fields change without ``updated_at`` moving. Buffered counters
+(``validator_counters``) are flushed without touching it, so their stored
+values (plus, on a detail view, this process's pending deltas) go into the
+ETag. Fields computed from a sale window (``validator_window``) flip as the
+clock passes its start or end. The latest boundary passed so far goes into
+the validators.
+"""
+import hashlib
+
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from . import counters
+from .caching import CachedResponseMixin, get_cache, normalized_query
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def _latest(*moments):
+    return max((moment for moment in moments if moment is not None), default=None)
+
+
+class ConditionalGetMixin:
+    """Adds validators and 304 handling to ``list`` and ``retrieve``."""
+    # Buffered counters in the representation (see commerce.counters)
+    validator_counters = ()
+    # (start, end) fields of a sale window the representation depends on
+    validator_window = None
+
+    def list_validators(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        now = timezone.now()
+        aggregates = {'last_modified': Max('updated_at'), 'count': Count('pk')}
+        aggregates.update({field: Sum(field) for field in self.validator_counters})
+        if self.validator_window:
+            start, end = self.validator_window
+            aggregates['started'] = Max(start, filter=Q(**{f'{start}__lte': now}))
+            aggregates['ended'] = Max(end, filter=Q(**{f'{end}__lt': now}))
+        state = queryset.order_by().aggregate(**aggregates)
+        last_modified = _latest(state['last_modified'], state.get('started'), state.get('ended'))
+        etag = make_etag(
+            queryset.model._meta.label, last_modified, state['count'],
+            *(state[field] for field in self.validator_counters),
+            normalized_query(request.query_params)
+        )
+        return etag, None
+
+    def retrieve_validators(self, request):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset())
+        fields = ['pk', 'updated_at', *self.validator_counters, *(self.validator_window or ())]
+        try:
+            row = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]}).values(*fields).first()
+        except (TypeError, ValueError):
+            row = None
+        if row is None:
+            # Let the regular handler produce the 404
+            return None, None
+        last_modified = row['updated_at']
+        if self.validator_window:
+            now = timezone.now()
+            start, end = (row[field] for field in self.validator_window)
+            last_modified = _latest(last_modified, start if start <= now else None, end if end < now else None)
+        counts = [
+            row[field] + counters.pending(queryset.model, row['pk'], field) for field in self.validator_counters
+        ]
+        etag = make_etag(queryset.model._meta.label, self.kwargs[lookup_url_kwarg], last_modified.isoformat(), *counts)
+        return etag, last_modified
+
+    def get_validators(self, request, compute):
+        # Validators of cacheable responses are cached alongside them
+        if isinstance(self, CachedResponseMixin) and self.is_cacheable(request):
+            key = f'{self.get_cache_key(request)}:validators'
+            validators = get_cache().get(key)
+            if validators is None:
+                validators = compute(request)
+                get_cache().set(key, validators)
+            return validators
+        return compute(request)
+
+    def conditional_response(self, compute, handler, request, *args, **kwargs):
+        etag, last_modified = self.get_validators(request, compute)
+        if etag is None:
+            return handler(request, *args, **kwargs)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request._request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+            patch_cache_control(response, no_cache=True)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(self.list_validators, super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(self.retrieve_validators, super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,123 @@
+"""
+Write-behind buffering for hot counters such as ``Product.views``.
+
+Increments are accumulated in process memory and flushed every
+``COUNTER_FLUSH_INTERVAL`` seconds by a daemon thread, started in a process
+the first time it buffers an increment, as one
+``UPDATE ... SET field = field + delta`` per distinct (model, field, delta)
+group. Because flushes only ever add deltas, several worker processes can
+buffer the same counters independently. ``pending()`` exposes the unflushed
+delta so reads can include it. An interval of 0 writes through immediately.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 5
+# Flush early once this many distinct counters are buffered
+MAX_BUFFERED_KEYS = 10000
+
+
+class CounterBuffer:
+    """
+    Thread-safe map of ``(model, pk, field) -> delta`` with periodic flushing.
+    Without ``background``, no flusher thread is started and deltas wait for
+    an explicit ``flush()``.
+    """
+
+    def __init__(self, interval=None, background=True):
+        self.interval = interval
+        self.background = background
+        self.deltas = defaultdict(int)
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.pid = None
+
+    def get_interval(self):
+        if self.interval is not None:
+            return self.interval
+        return getattr(settings, 'COUNTER_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+
+    def incr(self, model, pk, field, amount=1):
+        with self.lock:
+            self.deltas[(model, pk, field)] += amount
+            size = len(self.deltas)
+        if self.get_interval() <= 0:
+            self.flush()
+            return
+        if self.background:
+            self._ensure_thread()
+        if size >= MAX_BUFFERED_KEYS:
+            self.wakeup.set()
+
+    def pending(self, model, pk, field):
+        with self.lock:
+            return self.deltas.get((model, pk, field), 0)
+
+    def flush(self):
+        """Write all buffered deltas; returns the number of UPDATE statements run."""
+        with self.lock:
+            deltas, self.deltas = self.deltas, defaultdict(int)
+        groups = defaultdict(list)
+        for (model, pk, field), delta in deltas.items():
+            if delta:
+                groups[(model, field, delta)].append(pk)
+        try:
+            for (model, field, delta), pks in groups.items():
+                model.objects.filter(pk__in=pks).update(**{field: F(field) + delta})
+        except Exception:
+            # Put the deltas back so a transient DB error does not lose counts
+            with self.lock:
+                for key, delta in deltas.items():
+                    self.deltas[key] += delta
+            raise
+        return len(groups)
+
+    def _ensure_thread(self):
+        # Threads do not survive a fork, so restart the flusher in each worker process
+        if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self._run, name='counter-flush', daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(self.get_interval())
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Counter flush failed; deltas kept for the next attempt')
+            finally:
+                close_old_connections()
+
+
+buffer = CounterBuffer()
+atexit.register(lambda: buffer.deltas and buffer.flush())
+
+
+def incr(model, pk, field, amount=1):
+    """Buffer ``amount`` for ``field`` of the ``model`` row ``pk``."""
+    buffer.incr(model, pk, field, amount)
+
+
+def pending(model, pk, field):
+    """Increments for ``field`` of row ``pk`` not yet written to the database."""
+    return buffer.pending(model, pk, field)
+
+
+def flush():
+    return buffer.flush()
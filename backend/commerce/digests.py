@@ -0,0 +1,155 @@
+"""
+Batch digests for daily and weekly ProductAlerts.
+
+Due alerts are streamed in id-ordered chunks. Each chunk loads only the
+products created since its alerts were last notified, matches them with
+``commerce.matching`` and, in one transaction, records the hits as AlertMatch
+rows and bumps ``last_notified_at`` with a single UPDATE.
+
+Chunks can be fanned out over a process pool. Progress is written to a JSON
+checkpoint after every contiguous prefix of finished chunks, so an interrupted
+run resumes with the same cut-off time and skips chunks already done.
+"""
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import reduce
+from multiprocessing import get_context
+
+import django
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .matching import ProductFrame, candidate_queryset, match_alerts
+from .models import AlertMatch, Product, ProductAlert
+
+FREQUENCY_PERIODS = {
+    'daily': timedelta(days=1),
+    'weekly': timedelta(weeks=1),
+}
+
+
+class Checkpoint:
+    """Small JSON progress file, replaced atomically on every save."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return None
+        with open(self.path) as handle:
+            return json.load(handle)
+
+    def save(self, state):
+        if not self.path:
+            return
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as handle:
+            json.dump(state, handle)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def due_alerts(frequencies, now):
+    """Active alerts of the given frequencies whose digest period has elapsed."""
+    due = [
+        Q(notification_frequency=frequency)
+        & (Q(last_notified_at__isnull=True) | Q(last_notified_at__lte=now - FREQUENCY_PERIODS[frequency]))
+        for frequency in frequencies
+    ]
+    return ProductAlert.objects.filter(is_active=True).filter(reduce(lambda a, b: a | b, due))
+
+
+def process_chunk(alert_ids, run_started):
+    """Match one chunk of alerts and record the results; returns the match count."""
+    alerts = list(ProductAlert.objects.filter(id__in=alert_ids))
+    if not alerts:
+        return 0
+    since = {alert.id: alert.last_notified_at or alert.created_at for alert in alerts}
+    products = Product.objects.filter(
+        status='active',
+        created_at__gt=min(since.values()),
+        created_at__lte=run_started,
+    )
+    frame = ProductFrame.load(candidate_queryset(alerts, products))
+    matched = match_alerts(alerts, frame, since=since)
+    hits = [
+        AlertMatch(alert_id=alert_id, product_id=product_id)
+        for alert_id, product_ids in matched.items()
+        for product_id in product_ids.tolist()
+    ]
+    with transaction.atomic():
+        AlertMatch.objects.bulk_create(hits, batch_size=1000, ignore_conflicts=True)
+        ProductAlert.objects.filter(id__in=alert_ids).update(last_notified_at=run_started)
+    return len(hits)
+
+
+def _id_chunks(queryset, size, after_id):
+    """
+    Stream ids of ``queryset`` in ascending chunks using keyset pagination.
+
+    Each chunk is a short query rather than one long-lived ``iterator()``
+    cursor, whose open read transaction would block pool workers' writes
+    on SQLite.
+    """
+    while True:
+        chunk = list(queryset.filter(id__gt=after_id).order_by('id').values_list('id', flat=True)[:size])
+        if not chunk:
+            return
+        yield chunk
+        after_id = chunk[-1]
+
+
+def run_digests(frequencies, chunk_size=500, workers=1, checkpoint_path=None):
+    """
+    Process every due digest alert and return ``{'alerts': n, 'matches': m}``.
+
+    With ``workers > 1`` chunks are processed by a pool of spawned processes.
+    """
+    checkpoint = Checkpoint(checkpoint_path)
+    state = checkpoint.load()
+    if state:
+        run_started = datetime.fromisoformat(state['run_started'])
+        frequencies = state['frequencies']
+    else:
+        state = {'run_started': timezone.now().isoformat(), 'frequencies': list(frequencies), 'after_id': 0}
+        run_started = datetime.fromisoformat(state['run_started'])
+        checkpoint.save(state)
+
+    chunks = _id_chunks(due_alerts(frequencies, run_started), chunk_size, state['after_id'])
+    totals = {'alerts': 0, 'matches': 0}
+
+    def finish(chunk, matches):
+        totals['alerts'] += len(chunk)
+        totals['matches'] += matches
+        state['after_id'] = chunk[-1]
+        checkpoint.save(state)
+
+    if workers <= 1:
+        for chunk in chunks:
+            finish(chunk, process_chunk(chunk, run_started))
+    else:
+        # Spawned workers start without inherited DB connections
+        connections.close_all()
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'), initializer=django.setup)
+        with pool:
+            in_flight = deque()
+            for chunk in chunks:
+                in_flight.append((chunk, pool.submit(process_chunk, chunk, run_started)))
+                # Checkpoint only advances over chunks finished in submission order
+                while in_flight and (len(in_flight) > 2 * workers or in_flight[0][1].done()):
+                    done_chunk, future = in_flight.popleft()
+                    finish(done_chunk, future.result())
+            while in_flight:
+                done_chunk, future = in_flight.popleft()
+                finish(done_chunk, future.result())
+
+    checkpoint.clear()
+    return totals
@@ -0,0 +1,75 @@
+"""
+Streaming CSV/NDJSON exports of products, orders and order items.
+
+Each export is a list of ``(column, lookup)`` pairs read with
+``values_list(*lookups).iterator(chunk_size)``: related names come from JOINs
+in the same query, no model instances are built, and the response starts
+sending rows as soon as the first chunk arrives.
+"""
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .streaming import iter_csv, iter_ndjson
+
+FORMATS = {
+    'csv': (iter_csv, 'text/csv', 'csv'),
+    'ndjson': (iter_ndjson, 'application/x-ndjson', 'ndjson'),
+}
+CHUNK_SIZE = 2000
+
+PRODUCT_COLUMNS = [
+    ('id', 'id'),
+    ('title', 'title'),
+    ('category', 'category__name'),
+    ('seller', 'seller__username'),
+    ('condition', 'condition'),
+    ('quantity', 'quantity'),
+    ('unit_of_measure', 'unit_of_measure'),
+    ('price', 'price'),
+    ('market_price', 'market_price'),
+    ('location_name', 'location_name'),
+    ('location_lat', 'location_lat'),
+    ('location_long', 'location_long'),
+    ('status', 'status'),
+    ('views', 'views'),
+    ('saves', 'saves'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+]
+
+ORDER_COLUMNS = [
+    ('id', 'id'),
+    ('buyer', 'buyer__username'),
+    ('seller', 'seller__username'),
+    ('project', 'project__name'),
+    ('total_amount', 'total_amount'),
+    ('tax_amount', 'tax_amount'),
+    ('delivery_method', 'delivery_method'),
+    ('delivery_status', 'delivery_status'),
+    ('escrow_status', 'escrow_status'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+]
+
+ORDER_ITEM_COLUMNS = [
+    ('id', 'id'),
+    ('order_id', 'order_id'),
+    ('order_created_at', 'order__created_at'),
+    ('buyer', 'order__buyer__username'),
+    ('seller', 'order__seller__username'),
+    ('product_id', 'product_id'),
+    ('product_title', 'product__title'),
+    ('quantity', 'quantity'),
+    ('price_at_purchase', 'price_at_purchase'),
+]
+
+
+def export_response(queryset, columns, fmt, name):
+    """Stream ``queryset`` as ``fmt`` ('csv' or 'ndjson') with the given columns."""
+    writer, content_type, extension = FORMATS[fmt]
+    header = [column for column, lookup in columns]
+    rows = queryset.order_by('pk').values_list(*(lookup for column, lookup in columns)).iterator(chunk_size=CHUNK_SIZE)
+    response = StreamingHttpResponse(writer(header, rows), content_type=content_type)
+    filename = f"{name}-{timezone.now():%Y%m%d-%H%M%S}.{extension}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
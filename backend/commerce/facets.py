@@ -0,0 +1,69 @@
+"""
+Facet counts for the product catalog sidebar.
+
+All facets come from one ``GROUP BY category, condition, unit, price bucket``
+query over the already filtered queryset. Its result has at most one row per
+combination actually present, which is small enough to roll up into the
+individual facets in Python.
+"""
+from collections import Counter
+from decimal import Decimal
+
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from .models import Product
+
+# Upper bounds of the price buckets; the last bucket is open-ended
+PRICE_BUCKET_BOUNDS = [Decimal(bound) for bound in ('10', '50', '100', '500', '1000')]
+
+
+def price_bucket_expression():
+    return Case(
+        *[When(price__lt=bound, then=Value(index)) for index, bound in enumerate(PRICE_BUCKET_BOUNDS)],
+        default=Value(len(PRICE_BUCKET_BOUNDS)),
+        output_field=IntegerField(),
+    )
+
+
+def price_bucket_range(index):
+    # Rendered as strings, like the serializers' price fields
+    low = str(PRICE_BUCKET_BOUNDS[index - 1]) if index else '0'
+    high = str(PRICE_BUCKET_BOUNDS[index]) if index < len(PRICE_BUCKET_BOUNDS) else None
+    return low, high
+
+
+def product_facets(queryset):
+    """Return total and per-facet counts for the products in ``queryset``."""
+    rows = (
+        queryset.order_by()
+        .annotate(price_bucket=price_bucket_expression())
+        .values('category_id', 'category__name', 'condition', 'unit_of_measure', 'price_bucket')
+        .annotate(count=Count('pk'))
+    )
+    categories, conditions, units, prices = Counter(), Counter(), Counter(), Counter()
+    for row in rows:
+        categories[(row['category_id'], row['category__name'])] += row['count']
+        conditions[row['condition']] += row['count']
+        units[row['unit_of_measure']] += row['count']
+        prices[row['price_bucket']] += row['count']
+
+    return {
+        'count': sum(conditions.values()),
+        'category': [
+            {'id': category_id, 'name': name, 'count': count}
+            for (category_id, name), count in sorted(categories.items(), key=lambda item: item[0][1])
+        ],
+        'condition': [
+            {'value': value, 'label': label, 'count': conditions[value]}
+            for value, label in Product.CONDITION_CHOICES if conditions[value]
+        ],
+        'unit_of_measure': [
+            {'value': value, 'label': label, 'count': units[value]}
+            for value, label in Product.UNIT_CHOICES if units[value]
+        ],
+        'price': [
+            {'min': low, 'max': high, 'count': prices[index]}
+            for index in range(len(PRICE_BUCKET_BOUNDS) + 1) if prices[index]
+            for low, high in [price_bucket_range(index)]
+        ],
+    }
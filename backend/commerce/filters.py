@@ -0,0 +1,18 @@
+"""Small query-parameter filters shared by the catalog viewsets."""
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+class MinSavingsFilter(BaseFilterBackend):
+    """``?min_savings=N`` keeps rows saving at least N percent (indexed ``savings_percentage`` column)."""
+    param = 'min_savings'
+
+    def filter_queryset(self, request, queryset, view):
+        value = request.query_params.get(self.param)
+        if value in (None, ''):
+            return queryset
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValidationError({self.param: 'Must be a whole number of percent.'})
+        return queryset.filter(savings_percentage__gte=value)
@@ -0,0 +1,136 @@
+"""
+Geospatial helpers for "near me" queries on products and kits.
+
+Locations are bucketed into a fixed grid of ``CELL_SIZE`` degree cells stored
+in an indexed ``geo_cell`` column. Cells are numbered row by row, so the cells
+of one latitude band covering a bounding box form a contiguous integer range
+and a radius query becomes a handful of index range scans followed by an exact
+haversine distance computed in SQL. The grid does not wrap at the antimeridian.
+"""
+from functools import reduce
+from math import cos, floor, radians
+
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cast, Cos, Least, Power, Radians, Sin, Sqrt
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+CELL_SIZE = 0.1
+CELLS_PER_ROW = int(360 / CELL_SIZE)
+# Beyond this many latitude bands the bounding box alone is a better filter
+MAX_CELL_ROWS = 200
+
+
+def _row(lat):
+    return int(floor((min(max(lat, -90.0), 90.0) + 90.0) / CELL_SIZE))
+
+
+def _col(lng):
+    return min(int(floor((min(max(lng, -180.0), 180.0) + 180.0) / CELL_SIZE)), CELLS_PER_ROW - 1)
+
+
+def geo_cell(lat, lng):
+    """Return the grid cell id for a coordinate pair, or None if either is missing."""
+    if lat is None or lng is None:
+        return None
+    return _row(float(lat)) * CELLS_PER_ROW + _col(float(lng))
+
+
+def bounding_box(lat, lng, radius_km):
+    """Return ``(min_lat, max_lat, min_lng, max_lng)`` enclosing the radius."""
+    dlat = radius_km / KM_PER_DEGREE
+    lat_scale = cos(radians(min(abs(lat) + dlat, 89.9)))
+    dlng = min(radius_km / (KM_PER_DEGREE * lat_scale), 180.0)
+    return (
+        max(lat - dlat, -90.0), min(lat + dlat, 90.0),
+        max(lng - dlng, -180.0), min(lng + dlng, 180.0),
+    )
+
+
+def cell_ranges(box):
+    """
+    Return ``(first, last)`` cell id ranges, one per latitude band, covering
+    ``box``, or None if it spans too many bands to be worth it.
+    """
+    min_lat, max_lat, min_lng, max_lng = box
+    rows = range(_row(min_lat), _row(max_lat) + 1)
+    if len(rows) > MAX_CELL_ROWS:
+        return None
+    first, last = _col(min_lng), _col(max_lng)
+    return [(row * CELLS_PER_ROW + first, row * CELLS_PER_ROW + last) for row in rows]
+
+
+def cell_filter(box):
+    """Return a Q matching the grid cells that cover ``box``, or None if too wide."""
+    ranges = cell_ranges(box)
+    if ranges is None:
+        return None
+    return reduce(lambda a, b: a | b, [Q(geo_cell__range=cell_range) for cell_range in ranges])
+
+
+def distance_expression(lat, lng):
+    """Haversine distance in km from ``(lat, lng)`` to the row's location."""
+    row_lat = Radians(Cast(F('location_lat'), FloatField()))
+    row_lng = Radians(Cast(F('location_long'), FloatField()))
+    origin_lat, origin_lng = radians(lat), radians(lng)
+    a = (
+        Power(Sin((row_lat - Value(origin_lat)) / 2), 2)
+        + Value(cos(origin_lat)) * Cos(row_lat) * Power(Sin((row_lng - Value(origin_lng)) / 2), 2)
+    )
+    return Value(2 * EARTH_RADIUS_KM) * ASin(Least(Sqrt(a), Value(1.0)), output_field=FloatField())
+
+
+def filter_nearby(queryset, lat, lng, radius_km=None):
+    """Annotate ``distance`` and, given a radius, restrict to locations within it."""
+    if radius_km is not None:
+        box = bounding_box(lat, lng, radius_km)
+        cells = cell_filter(box)
+        if cells is not None:
+            queryset = queryset.filter(cells)
+        queryset = queryset.filter(
+            location_lat__range=(box[0], box[1]),
+            location_long__range=(box[2], box[3]),
+        )
+    queryset = queryset.annotate(distance=distance_expression(lat, lng))
+    if radius_km is not None:
+        queryset = queryset.filter(distance__lte=radius_km)
+    return queryset
+
+
+class NearbyFilter(BaseFilterBackend):
+    """
+    ``?lat=&lng=&radius_km=`` radius filtering and ``ordering=distance``.
+
+    Must run after ``OrderingFilter`` so a distance ordering replaces the default.
+    """
+
+    def _parse(self, request, name, low, high):
+        raw = request.query_params.get(name)
+        if raw in (None, ''):
+            return None
+        try:
+            value = float(raw)
+        except ValueError:
+            raise ValidationError({name: 'A number is required.'})
+        if not low <= value <= high:
+            raise ValidationError({name: f'Must be between {low} and {high}.'})
+        return value
+
+    def filter_queryset(self, request, queryset, view):
+        lat = self._parse(request, 'lat', -90, 90)
+        lng = self._parse(request, 'lng', -180, 180)
+        radius_km = self._parse(request, 'radius_km', 0, 20000)
+        if lat is None or lng is None:
+            if radius_km is not None:
+                raise ValidationError({'radius_km': 'lat and lng are required for radius filtering.'})
+            return queryset
+
+        queryset = filter_nearby(queryset, lat, lng, radius_km)
+        ordering = request.query_params.get(api_settings.ORDERING_PARAM, '')
+        if ordering in ('distance', '-distance'):
+            # Listings without a location have no distance; NULLs would sort first on some databases
+            queryset = queryset.filter(distance__isnull=False).order_by(ordering, '-created_at')
+        return queryset
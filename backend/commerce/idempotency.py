@@ -0,0 +1,109 @@
+"""
+``Idempotency-Key`` support for non-repeatable POST endpoints.
+
+A request carrying the header first inserts an ``IdempotencyKey`` row for
+(user, key) holding a fingerprint of the request. The unique constraint makes
+that insert a single-flight lock: of several concurrent duplicates exactly one
+runs the handler, and the others get 409 while it is in flight. When the
+handler returns, its status and body are stored on the row. A retry then
+replays them with one lookup instead of executing again. A handler that raises
+leaves nothing behind (the row is deleted), so the retry runs for real.
+
+Reusing a key for a different request (another fingerprint) is rejected
+with 422. Keys live for ``IDEMPOTENCY_KEY_TTL`` hours; ``purge_idempotency_keys``
+deletes expired rows. An in-flight row older than ``LOCK_TIMEOUT`` belongs to
+a worker that died, and may be taken over.
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+DEFAULT_TTL_HOURS = 24
+LOCK_TIMEOUT = timedelta(minutes=1)
+
+
+def request_fingerprint(request):
+    """SHA-256 of the method, path and (canonicalised) body of ``request``."""
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    raw = json.dumps([request.method, request.path, data], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def acquire(user, key, fingerprint):
+    """
+    Insert the key's row. Returns ``(True, row)`` if this request now owns the
+    key, else ``(False, row)`` with the existing row (None if it just vanished).
+    """
+    now = timezone.now()
+    ttl = timedelta(hours=getattr(settings, 'IDEMPOTENCY_KEY_TTL', DEFAULT_TTL_HOURS))
+    for _attempt in range(2):
+        try:
+            with transaction.atomic():
+                return True, IdempotencyKey.objects.create(
+                    user=user, key=key, fingerprint=fingerprint, expires_at=now + ttl
+                )
+        except IntegrityError:
+            pass
+        existing = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if existing is None:
+            continue
+        abandoned = existing.status_code is None and existing.created_at <= now - LOCK_TIMEOUT
+        if existing.expires_at > now and not abandoned:
+            return False, existing
+        # Conditional, so two requests taking over the same key cannot both succeed
+        IdempotencyKey.objects.filter(pk=existing.pk, created_at=existing.created_at).delete()
+    return False, IdempotencyKey.objects.filter(user=user, key=key).first()
+
+
+class IdempotencyMixin:
+    """Make handlers wrapped in ``idempotent_response`` safe to retry with an Idempotency-Key."""
+
+    def idempotent_response(self, handler, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+        if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            return Response({'error': f'{HEADER} is too long'}, status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = request_fingerprint(request)
+        owned, record = acquire(request.user, key, fingerprint)
+        if not owned:
+            if record is not None and record.fingerprint != fingerprint:
+                return Response(
+                    {'error': 'This Idempotency-Key was used for a different request'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+            if record is None or record.status_code is None:
+                response = Response(
+                    {'error': 'A request with this Idempotency-Key is still being processed'},
+                    status=status.HTTP_409_CONFLICT
+                )
+                response['Retry-After'] = 1
+                return response
+            response = Response(record.response_body, status=record.status_code)
+            response['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = handler(request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+        if response.status_code >= 500:
+            record.delete()
+        else:
+            IdempotencyKey.objects.filter(pk=record.pk).update(
+                status_code=response.status_code, response_body=response.data
+            )
+        return response
@@ -0,0 +1,131 @@
+"""
+Resized WebP variants of product images.
+
+Uploads are stored as-is; once the upload's transaction commits, a thread
+pool renders a ``thumbnail`` (list pages, cart) and a ``medium`` (detail
+pages) variant with Pillow and records their paths on the ProductImage with
+an ``UPDATE``. Until then, and if rendering fails, serializers fall back to
+the original file, so the upload request never waits for resizing.
+
+Variant names are derived from the source name, so a replaced upload is
+detected by its variant names no longer matching. ``IMAGE_PROCESSING_WORKERS``
+sets the pool size; 0 renders inline after commit.
+"""
+import logging
+import os
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from . import caching
+from .models import Product, ProductImage
+
+logger = logging.getLogger(__name__)
+
+# Bounding boxes; images are only ever scaled down
+VARIANTS = {
+    'thumbnail': (320, 320),
+    'medium': (1024, 1024),
+}
+VARIANT_FORMAT = 'WEBP'
+VARIANT_QUALITY = 80
+VARIANT_DIR = 'products/variants'
+DEFAULT_WORKERS = 2
+
+
+def variant_name(source_name, variant):
+    # Keep the source extension in the stem: a.jpg and a.png must not share variants
+    stem = posixpath.basename(source_name).replace('.', '_')
+    return f'{VARIANT_DIR}/{stem}-{variant}.webp'
+
+
+def variants_current(image):
+    """Whether ``image`` has variants rendered from its current upload."""
+    return bool(image.image) and all(
+        getattr(image, variant).name == variant_name(image.image.name, variant) for variant in VARIANTS
+    )
+
+
+def render_variant(source, size):
+    """Return WebP bytes of ``source`` (an open PIL image) scaled to fit ``size``."""
+    image = source.copy()
+    image.thumbnail(size, Image.LANCZOS)
+    output = BytesIO()
+    image.save(output, VARIANT_FORMAT, quality=VARIANT_QUALITY, method=4)
+    return output.getvalue()
+
+
+def generate_variants(image_id):
+    """Render and store every variant of one ProductImage; returns False if there was nothing to do."""
+    image = ProductImage.objects.filter(pk=image_id).first()
+    if image is None or not image.image:
+        return False
+    storage = image.image.storage
+    with image.image.open('rb') as source_file, Image.open(source_file) as source:
+        # Honour camera orientation, and flatten palette/CMYK modes WebP cannot take
+        source = ImageOps.exif_transpose(source)
+        if source.mode not in ('RGB', 'RGBA'):
+            has_alpha = source.mode in ('LA', 'PA') or 'transparency' in source.info
+            source = source.convert('RGBA' if has_alpha else 'RGB')
+        names = {}
+        for variant, size in VARIANTS.items():
+            name = variant_name(image.image.name, variant)
+            # Overwrite in place so the stored name stays the derived one
+            if storage.exists(name):
+                storage.delete(name)
+            names[variant] = storage.save(name, ContentFile(render_variant(source, size)))
+
+    # UPDATE rather than save() so the post_save handlers do not run again
+    updated = ProductImage.objects.filter(pk=image_id, image=image.image.name).update(**names)
+    if updated:
+        Product.objects.filter(pk=image.product_id).update(updated_at=timezone.now())
+        caching.bump_version()
+    return bool(updated)
+
+
+def _render(image_id):
+    try:
+        generate_variants(image_id)
+    except Exception:
+        # The original keeps being served; generate_image_variants can retry later
+        logger.exception('Rendering variants of ProductImage %s failed', image_id)
+
+
+def _run(image_id):
+    try:
+        _render(image_id)
+    finally:
+        close_old_connections()
+
+
+_lock = threading.Lock()
+_pool = {'pid': None, 'executor': None}
+
+
+def get_executor():
+    # Pools do not survive a fork, so each worker process starts its own
+    with _lock:
+        if _pool['pid'] != os.getpid():
+            workers = getattr(settings, 'IMAGE_PROCESSING_WORKERS', DEFAULT_WORKERS)
+            _pool['executor'] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-variants')
+            _pool['pid'] = os.getpid()
+        return _pool['executor']
+
+
+def process(image_id):
+    if getattr(settings, 'IMAGE_PROCESSING_WORKERS', DEFAULT_WORKERS) <= 0:
+        _render(image_id)
+    else:
+        get_executor().submit(_run, image_id)
+
+
+def schedule_variants(image_id):
+    """Render the variants of ``image_id`` once the current transaction commits."""
+    transaction.on_commit(lambda: process(image_id))
@@ -0,0 +1,153 @@
+"""
+Bulk product import from CSV or NDJSON manifests.
+
+Records are parsed as a stream and handled in batches: each batch is
+validated row by row with one ``ProductImportSerializer``, categories are
+resolved from one name/id map built up front, and the valid rows are written
+with a single ``bulk_create`` in their own transaction. An invalid row only
+costs its own entry in the error report; rows from batches already committed
+stay imported if a later batch fails.
+
+``bulk_create`` skips ``Product.save()`` and the model signals, so what they
+maintain is done here per batch: ``geo_cell``, the search index, instant
+alert matches and the catalog cache version.
+"""
+import csv
+import io
+import json
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from . import alert_index, caching, search
+from .geo import geo_cell
+from .models import Category, Product
+from .serializers import ProductImportSerializer
+
+FORMATS = ('csv', 'ndjson')
+DEFAULT_BATCH_SIZE = 500
+# Keep the report bounded when a manifest is broken throughout
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportFileError(Exception):
+    """The manifest itself could not be read (bad encoding, broken CSV)."""
+
+
+def detect_format(filename):
+    name = (filename or '').lower()
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    if name.endswith('.csv'):
+        return 'csv'
+    return None
+
+
+def iter_records(stream, fmt):
+    """Yield ``(row_number, record)`` from a text stream; ``record`` is an error message if unparseable."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row_number, row in enumerate(reader, start=1):
+            # Empty cells mean "not given" so model defaults and nullable fields apply
+            yield row_number, {key: value for key, value in row.items() if key and value not in ('', None)}
+    elif fmt == 'ndjson':
+        row_number = 0
+        for line in stream:
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                yield row_number, f'Invalid JSON: {exc}'
+                continue
+            yield row_number, record if isinstance(record, dict) else 'Each line must be a JSON object'
+    else:
+        raise ValueError(f'Unsupported import format: {fmt}')
+
+
+def text_stream(fileobj):
+    """Wrap a binary upload for streaming text parsing (a BOM is dropped)."""
+    return io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+
+
+class ProductImporter:
+    """Imports product records for one seller and collects a per-row report."""
+
+    def __init__(self, seller, batch_size=DEFAULT_BATCH_SIZE):
+        self.seller = seller
+        self.batch_size = batch_size
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        self.alert_matches = 0
+        # One instance validates every row, so its fields are only built once
+        self.row_serializer = ProductImportSerializer()
+        self.categories = {}
+        for category_id, name in Category.objects.values_list('id', 'name'):
+            self.categories[str(category_id)] = category_id
+            self.categories[name.strip().lower()] = category_id
+
+    def add_error(self, row_number, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'errors': errors})
+
+    def build(self, row_number, record):
+        """Return an unsaved Product for a valid record, else record the error and return None."""
+        if isinstance(record, str):
+            self.add_error(row_number, {'non_field_errors': [record]})
+            return None
+        try:
+            data = dict(self.row_serializer.run_validation(record))
+        except ValidationError as exc:
+            self.add_error(row_number, exc.detail)
+            return None
+        category_id = self.categories.get(data.pop('category').strip().lower())
+        if category_id is None:
+            self.add_error(row_number, {'category': ['Unknown category.']})
+            return None
+        return Product(
+            seller=self.seller, category_id=category_id,
+            geo_cell=geo_cell(data.get('location_lat'), data.get('location_long')),
+            **data
+        )
+
+    def write_batch(self, products):
+        with transaction.atomic():
+            Product.objects.bulk_create(products)
+            ids = [product.pk for product in products]
+            search.index_products(ids)
+            caching.invalidate_on_commit()
+        self.alert_matches += alert_index.record_batch_matches(products)
+        self.created += len(products)
+
+    def run(self, records):
+        """Import ``records``; on ImportFileError the batches before it stay imported."""
+        batch = []
+        try:
+            for row_number, record in records:
+                product = self.build(row_number, record)
+                if product is not None:
+                    batch.append(product)
+                if len(batch) >= self.batch_size:
+                    self.write_batch(batch)
+                    batch = []
+        except (csv.Error, UnicodeDecodeError) as exc:
+            raise ImportFileError(f'Could not parse file: {exc}') from exc
+        if batch:
+            self.write_batch(batch)
+        return self.report()
+
+    def report(self):
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'alert_matches': self.alert_matches,
+            'errors': self.errors,
+        }
+
+
+def import_products(stream, fmt, seller, batch_size=DEFAULT_BATCH_SIZE):
+    """Import a CSV/NDJSON text stream of products for ``seller``; returns the report."""
+    return ProductImporter(seller, batch_size).run(iter_records(stream, fmt))
@@ -0,0 +1,184 @@
+"""
+Flash-sale purchasing of limited-time Kits.
+
+Stock is claimed with one conditional ``UPDATE``::
+
+    UPDATE kits SET quantity_available = quantity_available - n
+    WHERE id = ? AND status = 'active' AND start_date <= now AND end_date >= now
+      AND quantity_available >= n
+
+The database applies it atomically to the row, so however many buyers race
+for the last units, at most the available stock is handed out. A claim is a
+``KitReservation`` held for ``KIT_RESERVATION_MINUTES``. Purchasing it moves
+the quantity to ``quantity_sold``. Releasing it, or letting it expire, puts
+the quantity back. Expired holds are swept by ``expire_kit_reservations`` and,
+lazily, by a claim that finds the kit empty.
+
+Every claim on a kit queues on the same row lock. An ``AdmissionGate`` caps the
+claims in flight per kit (``KIT_ADMISSION_LIMIT``) with a counter in the
+default cache. Buyers over the cap get a 429 with ``Retry-After`` instead of
+piling up on the lock. Once a kit is known to be sold out, claims are turned
+away from the cache without touching the database. The cap only holds across
+worker processes if the default cache is shared between them.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from rest_framework.exceptions import Throttled
+
+from .models import Kit, KitReservation
+
+DEFAULT_RESERVATION_MINUTES = 10
+DEFAULT_ADMISSION_LIMIT = 16
+# Seconds a buyer turned away by the gate is asked to wait
+RETRY_AFTER = 1
+# Frees slots leaked by a worker that died while holding them
+ADMISSION_TTL = 60
+# Lets restocks outside this module show up within a few seconds
+SOLD_OUT_TTL = 5
+
+
+class KitUnavailable(Exception):
+    """The kit cannot be claimed, or the reservation can no longer be used."""
+
+
+def get_cache():
+    return caches['default']
+
+
+def sold_out_key(kit_id):
+    return f'kits:{kit_id}:sold_out'
+
+
+class AdmissionGate:
+    """Admits at most ``limit`` concurrent claims per kit; raises ``Throttled`` beyond that."""
+
+    def __init__(self, kit_id, limit=None):
+        self.key = f'kits:{kit_id}:admitted'
+        self.limit = getattr(settings, 'KIT_ADMISSION_LIMIT', DEFAULT_ADMISSION_LIMIT) if limit is None else limit
+
+    def __enter__(self):
+        if self.limit <= 0:
+            return self
+        cache = get_cache()
+        cache.add(self.key, 0, ADMISSION_TTL)
+        try:
+            admitted = cache.incr(self.key)
+        except ValueError:
+            # The counter expired between add() and incr()
+            cache.set(self.key, 1, ADMISSION_TTL)
+            admitted = 1
+        if admitted > self.limit:
+            self._leave()
+            raise Throttled(wait=RETRY_AFTER)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.limit > 0:
+            self._leave()
+
+    def _leave(self):
+        try:
+            get_cache().decr(self.key)
+        except ValueError:
+            pass
+
+
+def take_stock(kit_id, quantity, now):
+    """Claim ``quantity`` units of an on-sale kit in one conditional UPDATE; returns whether it did."""
+    return bool(Kit.objects.filter(
+        pk=kit_id, status='active', start_date__lte=now, end_date__gte=now, quantity_available__gte=quantity
+    ).update(
+        quantity_available=F('quantity_available') - quantity,
+        status=Case(When(quantity_available=quantity, then=Value('sold_out')), default=F('status')),
+        updated_at=now,
+    ))
+
+
+def return_stock(kit_id, quantity, now):
+    """Put ``quantity`` units back; a kit sold out by holds becomes active again while its sale runs."""
+    Kit.objects.filter(pk=kit_id).update(
+        quantity_available=F('quantity_available') + quantity,
+        status=Case(
+            When(status='sold_out', start_date__lte=now, end_date__gt=now, then=Value('active')),
+            default=F('status'),
+        ),
+        updated_at=now,
+    )
+    transaction.on_commit(lambda: get_cache().delete(sold_out_key(kit_id)))
+
+
+def claim(kit_id, buyer, quantity=1):
+    """Hold ``quantity`` units of a kit for ``buyer``; returns the KitReservation."""
+    if get_cache().get(sold_out_key(kit_id)):
+        raise KitUnavailable('This kit is sold out.')
+    with AdmissionGate(kit_id):
+        now = timezone.now()
+        with transaction.atomic():
+            taken = take_stock(kit_id, quantity, now)
+            if not taken and release_expired(kit_id, now):
+                taken = take_stock(kit_id, quantity, now)
+            if not taken:
+                remaining = Kit.objects.filter(pk=kit_id).values_list('quantity_available', flat=True).first()
+                if remaining is None:
+                    raise Kit.DoesNotExist
+                if remaining <= 0:
+                    get_cache().set(sold_out_key(kit_id), True, SOLD_OUT_TTL)
+                raise KitUnavailable('Not enough of this kit is on sale right now.')
+            minutes = getattr(settings, 'KIT_RESERVATION_MINUTES', DEFAULT_RESERVATION_MINUTES)
+            return KitReservation.objects.create(
+                kit_id=kit_id, buyer=buyer, quantity=quantity, expires_at=now + timedelta(minutes=minutes)
+            )
+
+
+def _finish(reservation, status, now, **conditions):
+    # Only one of purchase/release/expiry can move a reservation out of 'held'
+    return KitReservation.objects.filter(pk=reservation.pk, status='held', **conditions).update(
+        status=status, updated_at=now
+    )
+
+
+def purchase(reservation):
+    """Turn an unexpired hold into a sale."""
+    now = timezone.now()
+    with transaction.atomic():
+        if not _finish(reservation, 'purchased', now, expires_at__gt=now):
+            raise KitUnavailable('This reservation has expired or was already used.')
+        Kit.objects.filter(pk=reservation.kit_id).update(
+            quantity_sold=F('quantity_sold') + reservation.quantity, updated_at=now
+        )
+    reservation.refresh_from_db()
+    return reservation
+
+
+def release(reservation):
+    """Give a held reservation up, putting its units back on sale."""
+    now = timezone.now()
+    with transaction.atomic():
+        if not _finish(reservation, 'released', now):
+            raise KitUnavailable('This reservation is no longer held.')
+        return_stock(reservation.kit_id, reservation.quantity, now)
+    reservation.refresh_from_db()
+    return reservation
+
+
+def release_expired(kit_id=None, now=None):
+    """Expire overdue holds (of one kit, or all) and return their units; returns the units returned."""
+    now = now or timezone.now()
+    overdue = KitReservation.objects.filter(status='held', expires_at__lte=now)
+    if kit_id is not None:
+        overdue = overdue.filter(kit_id=kit_id)
+    returned = defaultdict(int)
+    with transaction.atomic():
+        for pk, reservation_kit_id, quantity in overdue.values_list('pk', 'kit_id', 'quantity'):
+            # Row by row, so a hold purchased meanwhile is never also returned
+            if KitReservation.objects.filter(pk=pk, status='held').update(status='expired', updated_at=now):
+                returned[reservation_kit_id] += quantity
+        for reservation_kit_id, quantity in returned.items():
+            return_stock(reservation_kit_id, quantity, now)
+    return sum(returned.values())
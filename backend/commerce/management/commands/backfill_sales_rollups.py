@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from commerce.sales import backfill
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the seller sales rollup tables from orders.'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild days from this date (YYYY-MM-DD) on')
+    
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = parse_date(options['since'])
+            except ValueError:
+                since = None
+            if since is None:
+                raise CommandError('--since must be a date (YYYY-MM-DD)')
+        rows = backfill(since)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {rows} sales rollup rows.'))
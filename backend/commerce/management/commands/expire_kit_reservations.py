@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from commerce.kits import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Expire kit reservations past their deadline and put their units back on sale.'
+    
+    def handle(self, *args, **options):
+        returned = release_expired()
+        self.stdout.write(self.style.SUCCESS(f'Returned {returned} kit units from expired reservations.'))
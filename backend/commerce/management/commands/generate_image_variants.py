@@ -0,0 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from commerce.images import generate_variants, variants_current
+from commerce.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Render missing or outdated thumbnail/medium variants of product images.'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-render every image, not only outdated ones')
+        parser.add_argument('--workers', type=int, default=4, help='Rendering threads')
+    
+    def handle(self, *args, **options):
+        images = ProductImage.objects.exclude(image='').only('id', 'image', 'thumbnail', 'medium')
+        pending = [
+            image.pk for image in images.iterator(chunk_size=2000)
+            if options['all'] or not variants_current(image)
+        ]
+        
+        def render(image_id):
+            try:
+                return generate_variants(image_id)
+            except Exception as exc:
+                self.stderr.write(f'ProductImage {image_id}: {exc}')
+                return False
+            finally:
+                close_old_connections()
+        
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as executor:
+            rendered = sum(executor.map(render, pending))
+        self.stdout.write(self.style.SUCCESS(f'Rendered variants for {rendered} of {len(pending)} images.'))
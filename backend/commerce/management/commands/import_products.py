@@ -0,0 +1,43 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from commerce.imports import DEFAULT_BATCH_SIZE, FORMATS, ImportFileError, ProductImporter, detect_format, iter_records
+
+
+class Command(BaseCommand):
+    help = 'Bulk import products for a seller from a CSV or NDJSON manifest.'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Manifest file')
+        parser.add_argument('--seller', required=True, help='Username of the seller the products belong to')
+        parser.add_argument('--format', choices=FORMATS, help='Manifest format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Rows per transaction')
+        parser.add_argument('--errors', help='Write the per-row error report to this JSON file')
+    
+    def handle(self, *args, **options):
+        fmt = options['format'] or detect_format(options['path'])
+        if fmt is None:
+            raise CommandError('Cannot tell the manifest format from its name; pass --format')
+        try:
+            seller = get_user_model().objects.get(username=options['seller'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"Unknown seller: {options['seller']}")
+        
+        importer = ProductImporter(seller, options['batch_size'])
+        with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+            try:
+                report = importer.run(iter_records(stream, fmt))
+            except ImportFileError as exc:
+                raise CommandError(f"{exc} ({importer.created} products were imported before the error)")
+        
+        if options['errors']:
+            with open(options['errors'], 'w') as out:
+                json.dump(report['errors'], out, indent=2)
+        for error in report['errors'][:20]:
+            self.stderr.write(f"Row {error['row']}: {json.dumps(error['errors'])}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report['created']} products, {report['failed']} rows failed, "
+            f"{report['alert_matches']} instant alert matches."
+        ))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from commerce.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Delete stored Idempotency-Key responses past their TTL.'
+    
+    def handle(self, *args, **options):
+        deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired idempotency keys.'))
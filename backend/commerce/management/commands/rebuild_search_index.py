@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from commerce import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product full-text search index from scratch.'
+    
+    def handle(self, *args, **options):
+        if search.rebuild_index():
+            self.stdout.write(self.style.SUCCESS('Product search index rebuilt.'))
+        else:
+            self.stdout.write(self.style.WARNING('No full-text search backend for this database; nothing to do.'))
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from commerce.pricing import PriceListSource, get_sources, refresh_market_prices
+
+
+class Command(BaseCommand):
+    help = 'Estimate market prices per category, condition and unit and fill Product.market_price.'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--quantile', type=float, help='Quantile of observed prices to use (default: MARKET_PRICE_QUANTILE)')
+        parser.add_argument('--price-list', help='CSV price list to use as an extra source')
+    
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        sources = get_sources()
+        if options['price_list']:
+            sources.append(PriceListSource(options['price_list']))
+        updated = refresh_market_prices(sources, options['quantile'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated market prices of {updated} products in {time.monotonic() - started:.1f}s.'
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from commerce.similarity import TOP_K, refresh
+
+
+class Command(BaseCommand):
+    help = 'Update the precomputed similar-products table for new, changed and removed listings.'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every category instead of only stale products')
+        parser.add_argument('--top-k', type=int, default=TOP_K, help='Neighbours kept per product')
+    
+    def handle(self, *args, **options):
+        totals = refresh(full=options['full'], k=options['top_k'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Refreshed {totals['products']} products in {totals['categories']} categories."
+        ))
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from commerce.digests import FREQUENCY_PERIODS, Checkpoint, run_digests
+
+
+class Command(BaseCommand):
+    help = 'Match daily/weekly product alerts against new listings and record digest matches.'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--frequency', choices=list(FREQUENCY_PERIODS), action='append',
+            help='Digest frequency to process (repeatable, default: all)'
+        )
+        parser.add_argument('--chunk-size', type=int, default=500, help='Alerts per chunk')
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes (1 = in-process)')
+        parser.add_argument(
+            '--checkpoint', default=str(settings.BASE_DIR / 'alert_digests.checkpoint.json'),
+            help='Checkpoint file used to resume an interrupted run'
+        )
+        parser.add_argument('--restart', action='store_true', help='Discard any existing checkpoint first')
+    
+    def handle(self, *args, **options):
+        if options['restart']:
+            Checkpoint(options['checkpoint']).clear()
+        totals = run_digests(
+            options['frequency'] or list(FREQUENCY_PERIODS),
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+            checkpoint_path=options['checkpoint'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {totals['alerts']} alerts, recorded {totals['matches']} matches."
+        ))
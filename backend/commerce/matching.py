@@ -0,0 +1,129 @@
+"""
+Batched matching of ProductAlerts against the product catalog.
+
+Candidate products are loaded once into NumPy column arrays and every alert is
+evaluated against all of them in a single alerts x products boolean mask.
+Category, condition, price and distance tests are fully vectorised; keyword
+tests (substring matches, like the previous ``icontains`` lookups) only visit
+the products that survived the cheaper tests.
+"""
+from functools import reduce
+
+import numpy as np
+from django.db.models import Q
+
+from .geo import EARTH_RADIUS_KM, bounding_box, cell_filter
+from .models import Product
+
+PRODUCT_FIELDS = (
+    'id', 'category_id', 'condition', 'price',
+    'location_lat', 'location_long', 'title', 'description', 'created_at',
+)
+CONDITION_CODES = {code: index for index, (code, _label) in enumerate(Product.CONDITION_CHOICES)}
+
+
+def _floats(values):
+    return np.array([np.nan if value is None else float(value) for value in values], dtype=float)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Vectorised great-circle distance; all arguments in radians."""
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(np.sqrt(a), 1.0))
+
+
+class ProductFrame:
+    """Column arrays for a set of candidate products."""
+
+    def __init__(self, rows):
+        columns = list(zip(*rows)) if rows else [()] * len(PRODUCT_FIELDS)
+        ids, categories, conditions, prices, lats, lngs, titles, descriptions, created = columns
+        self.ids = np.array(ids, dtype=np.int64)
+        self.category = np.array(categories, dtype=np.int64)
+        self.condition = np.array([CONDITION_CODES.get(c, -1) for c in conditions], dtype=np.int64)
+        self.price = _floats(prices)
+        self.lat = np.radians(_floats(lats))
+        self.lng = np.radians(_floats(lngs))
+        self.created_at = np.array([c.timestamp() for c in created], dtype=float)
+        self.text = [f'{title}\n{description}'.lower() for title, description in zip(titles, descriptions)]
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, queryset):
+        return cls(list(queryset.values_list(*PRODUCT_FIELDS)))
+
+
+def _has_location(alert):
+    return alert.location_lat is not None and alert.location_long is not None
+
+
+def candidate_queryset(alerts, queryset=None):
+    """
+    Narrow ``queryset`` (active products by default) in SQL using criteria
+    shared by every alert, so fewer rows need to be loaded.
+    """
+    if queryset is None:
+        queryset = Product.objects.filter(status='active')
+    queryset = queryset.order_by('-created_at')
+    if not alerts:
+        return queryset.none()
+    if all(alert.category_id for alert in alerts):
+        queryset = queryset.filter(category_id__in={alert.category_id for alert in alerts})
+    if all(alert.max_price for alert in alerts):
+        queryset = queryset.filter(price__lte=max(alert.max_price for alert in alerts))
+    if all(_has_location(alert) for alert in alerts):
+        cells = [
+            cell_filter(bounding_box(float(alert.location_lat), float(alert.location_long), alert.radius_km))
+            for alert in alerts
+        ]
+        if None not in cells:
+            queryset = queryset.filter(reduce(lambda a, b: a | b, cells))
+    return queryset
+
+
+def match_alerts(alerts, frame, since=None):
+    """
+    Match ``alerts`` against ``frame`` and return ``{alert_id: product_ids}``.
+
+    ``since`` optionally maps alert ids to a datetime; only products created
+    after it are matched for that alert.
+    """
+    if not alerts or not len(frame):
+        return {alert.id: frame.ids[:0] for alert in alerts}
+
+    category = np.array([alert.category_id or -1 for alert in alerts], dtype=np.int64)[:, None]
+    mask = (category == -1) | (category == frame.category)
+
+    condition = np.array([CONDITION_CODES.get(alert.condition, -1) for alert in alerts], dtype=np.int64)[:, None]
+    mask &= (condition == -1) | (condition == frame.condition)
+
+    # A max_price of 0 means no limit, as it always has for alerts
+    max_price = _floats(alert.max_price or None for alert in alerts)[:, None]
+    mask &= np.isnan(max_price) | (frame.price <= max_price)
+
+    if since:
+        cutoff = _floats(
+            since[alert.id].timestamp() if since.get(alert.id) else None for alert in alerts
+        )[:, None]
+        mask &= np.isnan(cutoff) | (frame.created_at > cutoff)
+
+    located = [index for index, alert in enumerate(alerts) if _has_location(alert)]
+    if located:
+        lat = np.radians(_floats(alerts[i].location_lat for i in located))[:, None]
+        lng = np.radians(_floats(alerts[i].location_long for i in located))[:, None]
+        radius = np.array([alerts[i].radius_km for i in located], dtype=float)[:, None]
+        # NaN distances (products without a location) compare False and drop out
+        with np.errstate(invalid='ignore'):
+            mask[located] &= haversine_km(lat, lng, frame.lat, frame.lng) <= radius
+
+    for index, alert in enumerate(alerts):
+        keywords = alert.keywords.strip().lower()
+        if not keywords:
+            continue
+        remaining = np.flatnonzero(mask[index])
+        hits = np.fromiter((keywords in frame.text[j] for j in remaining), dtype=bool, count=len(remaining))
+        mask[index, remaining[~hits]] = False
+
+    return {alert.id: frame.ids[mask[index]] for index, alert in enumerate(alerts)}
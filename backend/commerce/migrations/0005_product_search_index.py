@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from commerce.search import rebuild_index
+    rebuild_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    from commerce.search import get_backend
+    backend = get_backend(schema_editor.connection)
+    if backend:
+        with schema_editor.connection.cursor() as cursor:
+            backend.drop(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0004_kit_productalert_project_order_project_dispute_flag'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
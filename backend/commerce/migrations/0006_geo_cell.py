@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:50
+
+from django.db import migrations, models
+
+
+def backfill_geo_cells(apps, schema_editor):
+    from commerce.geo import geo_cell
+    for model_name in ('Product', 'Kit'):
+        model = apps.get_model('commerce', model_name)
+        located = model.objects.filter(location_lat__isnull=False, location_long__isnull=False)
+        batch = []
+        for obj in located.only('id', 'location_lat', 'location_long').iterator(chunk_size=2000):
+            obj.geo_cell = geo_cell(obj.location_lat, obj.location_long)
+            batch.append(obj)
+            if len(batch) >= 2000:
+                model.objects.bulk_update(batch, ['geo_cell'])
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, ['geo_cell'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0005_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='kit',
+            name='geo_cell',
+            field=models.IntegerField(blank=True, db_index=True, editable=False, help_text='Spatial grid cell, see commerce.geo', null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='geo_cell',
+            field=models.IntegerField(blank=True, db_index=True, editable=False, help_text='Spatial grid cell, see commerce.geo', null=True),
+        ),
+        migrations.RunPython(backfill_geo_cells, migrations.RunPython.noop),
+    ]
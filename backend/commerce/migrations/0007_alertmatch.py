@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0006_geo_cell'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notified_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('alert', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='matches', to='commerce.productalert')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alert_matches', to='commerce.product')),
+            ],
+            options={
+                'db_table': 'alert_matches',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['alert', '-created_at'], name='alert_match_alert_i_2b3f08_idx'), models.Index(fields=['notified_at'], name='alert_match_notifie_ea60a7_idx')],
+                'unique_together': {('alert', 'product')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_primary_images(apps, schema_editor):
+    Product = apps.get_model('commerce', 'Product')
+    ProductImage = apps.get_model('commerce', 'ProductImage')
+    primary = ProductImage.objects.filter(
+        product_id=models.OuterRef('pk')
+    ).order_by('-is_primary', 'order', 'id').values('id')[:1]
+    Product.objects.update(primary_image=models.Subquery(primary))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0007_alertmatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='primary_image',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='commerce.productimage'),
+        ),
+        migrations.RunPython(backfill_primary_images, migrations.RunPython.noop),
+    ]
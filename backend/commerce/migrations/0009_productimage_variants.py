@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0008_product_primary_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='medium',
+            field=models.ImageField(blank=True, editable=False, max_length=255, upload_to='products/variants/'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, max_length=255, upload_to='products/variants/'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0009_productimage_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('computed_at', models.DateTimeField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_products', to='commerce.product')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_to', to='commerce.product')),
+            ],
+            options={
+                'db_table': 'similar_products',
+                'ordering': ['product', 'rank'],
+                'unique_together': {('product', 'similar')},
+            },
+        ),
+    ]
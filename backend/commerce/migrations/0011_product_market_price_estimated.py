@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0010_similarproduct'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='market_price_estimated',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
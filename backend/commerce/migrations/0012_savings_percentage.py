@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:18
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+import django.db.models.functions.math
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0011_product_market_price_estimated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='kit',
+            name='savings_percentage',
+            field=models.GeneratedField(db_index=True, db_persist=True, expression=models.Case(models.When(market_price__gt=0, then=django.db.models.functions.comparison.Cast(django.db.models.functions.math.Round(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('market_price'), '-', models.F('price')), '*', models.Value(100.0)), '/', models.F('market_price'))), models.IntegerField())), default=models.Value(0), output_field=models.IntegerField()), output_field=models.IntegerField()),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='savings_percentage',
+            field=models.GeneratedField(db_index=True, db_persist=True, expression=models.Case(models.When(market_price__gt=0, then=django.db.models.functions.comparison.Cast(django.db.models.functions.math.Round(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('market_price'), '-', models.F('price')), '*', models.Value(100.0)), '/', models.F('market_price'))), models.IntegerField())), default=models.Value(0), output_field=models.IntegerField()), output_field=models.IntegerField()),
+        ),
+    ]
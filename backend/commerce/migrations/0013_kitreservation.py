@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0012_savings_percentage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KitReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('status', models.CharField(choices=[('held', 'Held'), ('purchased', 'Purchased'), ('released', 'Released'), ('expired', 'Expired')], default='held', max_length=20)),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('buyer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='kit_reservations', to=settings.AUTH_USER_MODEL)),
+                ('kit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='commerce.kit')),
+            ],
+            options={
+                'db_table': 'kit_reservations',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'expires_at'], name='kit_reserva_status_f774af_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0014_idempotencykey'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['buyer', '-created_at'], name='orders_buyer_i_bfe3d2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['seller', '-created_at'], name='orders_seller__706a34_idx'),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_release_times(apps, schema_editor):
+    # The best record of earlier releases is the order's last update
+    Order = apps.get_model('commerce', 'Order')
+    Order.objects.filter(escrow_status='released').update(escrow_released_at=models.F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0015_order_role_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SellerCategorySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('orders', models.IntegerField(default=0, help_text='Orders with at least one line in the category')),
+                ('units', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seller_sales', to='commerce.category')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_sales', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'seller_category_sales',
+                'ordering': ['seller', 'day'],
+                'unique_together': {('seller', 'day', 'category')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SellerDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('orders', models.IntegerField(default=0)),
+                ('units', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('released_orders', models.IntegerField(default=0)),
+                ('released_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'seller_daily_sales',
+                'ordering': ['seller', 'day'],
+                'unique_together': {('seller', 'day')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SellerProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('orders', models.IntegerField(default=0)),
+                ('units', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='commerce.product')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_sales', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'seller_product_sales',
+                'ordering': ['seller', 'day'],
+                'unique_together': {('seller', 'day', 'product')},
+            },
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='escrow_released_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_release_times, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def post_alerts(apps, schema_editor):
+    from commerce.alert_index import rebuild
+    rebuild()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0016_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=40)),
+                ('max_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('alert', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='commerce.productalert')),
+            ],
+            options={
+                'db_table': 'alert_postings',
+                'indexes': [models.Index(fields=['key', 'max_price'], name='alert_posti_key_c65e02_idx')],
+            },
+        ),
+        migrations.RunPython(post_alerts, migrations.RunPython.noop),
+    ]
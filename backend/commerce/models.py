@@ -1,5 +1,38 @@
 from django.db import models
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.functions import Cast, Coalesce, Round
+from django.utils import timezone
+
+from .geo import geo_cell
+
+
+def savings_expression():
+    """
+    Savings vs market price in whole percent; 0 without a market price.
+    Halves round away from zero (SQL ``ROUND``), so 2.5% shows as 3%.
+    """
+    # 100.0 keeps SQLite from integer division when both prices are whole numbers
+    return models.Case(
+        models.When(
+            market_price__gt=0,
+            then=Cast(Round((models.F('market_price') - models.F('price')) * 100.0 / models.F('market_price')), models.IntegerField())
+        ),
+        default=models.Value(0),
+        output_field=models.IntegerField(),
+    )
+
+
+def save_with_savings(instance, save, *args, **kwargs):
+    """
+    Save ``instance`` and reload ``savings_percentage`` if an UPDATE may have
+    changed it; the database returns generated columns on INSERT only.
+    """
+    updating = not instance._state.adding
+    save(*args, **kwargs)
+    update_fields = kwargs.get('update_fields')
+    if updating and (update_fields is None or {'price', 'market_price'} & set(update_fields)):
+        instance.refresh_from_db(fields=['savings_percentage'])
 
 
 class Category(models.Model):
@@ -54,6 +87,12 @@ class Product(models.Model):
     # Pricing
     price = models.DecimalField(max_digits=10, decimal_places=2)  # Price per unit
     market_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # Set when market_price came from commerce.pricing; seller-entered prices are left alone
+    market_price_estimated = models.BooleanField(default=False, editable=False)
+    # Computed and stored by the database so deals can be filtered/ordered through an index
+    savings_percentage = models.GeneratedField(
+        expression=savings_expression(), output_field=models.IntegerField(), db_persist=True, db_index=True
+    )
     
     # Physical properties
     weight_per_unit = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="Weight in kg")
@@ -63,6 +102,12 @@ class Product(models.Model):
     location_lat = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     location_long = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     location_name = models.CharField(max_length=100)
+    geo_cell = models.IntegerField(null=True, blank=True, editable=False, db_index=True, help_text="Spatial grid cell, see commerce.geo")
+    
+    # Denormalized list thumbnail, maintained by commerce.signals on ProductImage writes
+    primary_image = models.ForeignKey(
+        'ProductImage', on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='+'
+    )
     
     # Status & metadata
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
@@ -76,12 +121,9 @@ class Product(models.Model):
     def __str__(self):
         return self.title
     
-    @property
-    def savings_percentage(self):
-        """Calculate savings percentage vs market price."""
-        if self.market_price and self.market_price > 0:
-            return round(((self.market_price - self.price) / self.market_price) * 100)
-        return 0
+    def save(self, *args, **kwargs):
+        self.geo_cell = geo_cell(self.location_lat, self.location_long)
+        save_with_savings(self, super().save, *args, **kwargs)
     
     class Meta:
         db_table = 'products'
@@ -97,9 +139,19 @@ class ProductImage(models.Model):
     """Product images."""
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='products/')
+    # Resized WebP renditions of image, filled in by commerce.images after upload
+    thumbnail = models.ImageField(upload_to='products/variants/', max_length=255, blank=True, editable=False)
+    medium = models.ImageField(upload_to='products/variants/', max_length=255, blank=True, editable=False)
     is_primary = models.BooleanField(default=False)
     order = models.IntegerField(default=0)
     
+    @classmethod
+    def refresh_primary(cls, product_id):
+        """Point the product's primary_image at its flagged image, else its first one."""
+        primary = cls.objects.filter(product_id=product_id).order_by('-is_primary', 'order', 'id').values('id')[:1]
+        # Touch updated_at too: the product's ETag / Last-Modified derive from it
+        Product.objects.filter(pk=product_id).update(primary_image=models.Subquery(primary), updated_at=timezone.now())
+    
     class Meta:
         db_table = 'product_images'
         ordering = ['order']
@@ -142,6 +194,7 @@ class Order(models.Model):
     
     # Payment
     escrow_status = models.CharField(max_length=20, choices=ESCROW_STATUS_CHOICES, default='funds_held')
+    escrow_released_at = models.DateTimeField(null=True, blank=True, editable=False)
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -153,6 +206,11 @@ class Order(models.Model):
     class Meta:
         db_table = 'orders'
         ordering = ['-created_at']
+        indexes = [
+            # Each side of an order list is one range scan in list order
+            models.Index(fields=['buyer', '-created_at']),
+            models.Index(fields=['seller', '-created_at']),
+        ]
 
 
 class OrderItem(models.Model):
@@ -224,6 +282,32 @@ class Wishlist(models.Model):
         unique_together = ['user', 'product']
 
 
+class ProjectQuerySet(models.QuerySet):
+    
+    def with_totals(self):
+        """
+        Annotate ``total_spent``, ``order_count`` and, for projects with a
+        budget, ``budget_remaining`` and ``budget_used_percent`` (whole
+        percent), all in the same aggregate query.
+        """
+        money = models.DecimalField(max_digits=12, decimal_places=2)
+        return self.annotate(
+            total_spent=Coalesce(models.Sum('orders__total_amount'), models.Value(0), output_field=money),
+            order_count=models.Count('orders'),
+        ).annotate(
+            budget_remaining=models.ExpressionWrapper(models.F('budget') - models.F('total_spent'), output_field=money),
+            # 100.0 keeps SQLite from integer division, as in savings_expression()
+            budget_used_percent=models.Case(
+                models.When(
+                    budget__gt=0,
+                    then=Cast(Round(models.F('total_spent') * 100.0 / models.F('budget')), models.IntegerField())
+                ),
+                default=None,
+                output_field=models.IntegerField(),
+            ),
+        )
+
+
 class Project(models.Model):
     """Buyer projects to organize orders and materials."""
     
@@ -245,19 +329,12 @@ class Project(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Totals come from ProjectQuerySet.with_totals()
+    objects = ProjectQuerySet.as_manager()
+    
     def __str__(self):
         return f"{self.name} - {self.buyer.username}"
     
-    @property
-    def total_spent(self):
-        """Calculate total spent on this project."""
-        return sum(order.total_amount for order in self.orders.all())
-    
-    @property
-    def order_count(self):
-        """Get number of orders in this project."""
-        return self.orders.count()
-    
     class Meta:
         db_table = 'projects'
         ordering = ['-created_at']
@@ -303,6 +380,60 @@ class ProductAlert(models.Model):
         ordering = ['-created_at']
 
 
+class AlertMatch(models.Model):
+    """A product that matched a ProductAlert, pending notification."""
+    alert = models.ForeignKey(ProductAlert, on_delete=models.CASCADE, related_name='matches')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='alert_matches')
+    notified_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.alert} -> {self.product}"
+    
+    class Meta:
+        db_table = 'alert_matches'
+        ordering = ['-created_at']
+        unique_together = ['alert', 'product']
+        indexes = [
+            models.Index(fields=['alert', '-created_at']),
+            models.Index(fields=['notified_at']),
+        ]
+
+
+class AlertPosting(models.Model):
+    """An inverted-index entry of an active instant ProductAlert, maintained by commerce.alert_index."""
+    alert = models.ForeignKey(ProductAlert, on_delete=models.CASCADE, related_name='postings')
+    key = models.CharField(max_length=40)
+    # Only set on price postings, which match products priced at or below it
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.key} -> {self.alert_id}"
+    
+    class Meta:
+        db_table = 'alert_postings'
+        indexes = [
+            models.Index(fields=['key', 'max_price']),
+        ]
+
+
+class SimilarProduct(models.Model):
+    """A precomputed nearest neighbour of a product, maintained by commerce.similarity."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='similar_products')
+    similar = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='similar_to')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    computed_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"{self.product} ~ {self.similar} ({self.score:.2f})"
+    
+    class Meta:
+        db_table = 'similar_products'
+        ordering = ['product', 'rank']
+        unique_together = ['product', 'similar']
+
+
 class Kit(models.Model):
     """Limited-time niche kits from construction site excess materials."""
     
@@ -340,11 +471,16 @@ class Kit(models.Model):
     # Pricing
     price = models.DecimalField(max_digits=10, decimal_places=2)
     market_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # Computed and stored by the database so deals can be filtered/ordered through an index
+    savings_percentage = models.GeneratedField(
+        expression=savings_expression(), output_field=models.IntegerField(), db_persist=True, db_index=True
+    )
     
     # Location
     location_name = models.CharField(max_length=100)
     location_lat = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     location_long = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    geo_cell = models.IntegerField(null=True, blank=True, editable=False, db_index=True, help_text="Spatial grid cell, see commerce.geo")
     
     # Status
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='upcoming')
@@ -363,10 +499,13 @@ class Kit(models.Model):
     def __str__(self):
         return self.title
     
+    def save(self, *args, **kwargs):
+        self.geo_cell = geo_cell(self.location_lat, self.location_long)
+        save_with_savings(self, super().save, *args, **kwargs)
+    
     @property
     def is_available(self):
         """Check if kit is currently available."""
-        from django.utils import timezone
         now = timezone.now()
         return (
             self.status == 'active' and
@@ -374,18 +513,43 @@ class Kit(models.Model):
             self.quantity_available > 0
         )
     
-    @property
-    def savings_percentage(self):
-        """Calculate savings percentage vs market price."""
-        if self.market_price and self.market_price > 0:
-            return round(((self.market_price - self.price) / self.market_price) * 100)
-        return 0
-    
     class Meta:
         db_table = 'kits'
         ordering = ['-created_at']
 
 
+class KitReservation(models.Model):
+    """Kit stock held for a buyer until purchased, released or expired; see commerce.kits."""
+    
+    STATUS_CHOICES = [
+        ('held', 'Held'),
+        ('purchased', 'Purchased'),
+        ('released', 'Released'),
+        ('expired', 'Expired'),
+    ]
+    
+    kit = models.ForeignKey(Kit, on_delete=models.CASCADE, related_name='reservations')
+    buyer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='kit_reservations')
+    quantity = models.PositiveIntegerField(default=1)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='held')
+    expires_at = models.DateTimeField()
+    
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.quantity}x {self.kit} for {self.buyer.username} ({self.status})"
+    
+    class Meta:
+        db_table = 'kit_reservations'
+        ordering = ['-created_at']
+        indexes = [
+            # Expiry sweeps look for held reservations past their deadline
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+
 class Flag(models.Model):
     """Flags for reporting products, orders, or users."""
     
@@ -525,3 +689,72 @@ class Dispute(models.Model):
             models.Index(fields=['order', 'status']),
             models.Index(fields=['status', '-created_at']),
         ]
+
+
+class IdempotencyKey(models.Model):
+    """A client's Idempotency-Key and the response it produced; see commerce.idempotency."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64, help_text="SHA-256 of method, path and body")
+    
+    # Empty while the first request is still running
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    def __str__(self):
+        return f"{self.key} ({self.user.username})"
+    
+    class Meta:
+        db_table = 'idempotency_keys'
+        unique_together = ['user', 'key']
+
+
+class SellerDailySales(models.Model):
+    """A seller's sales on one day, maintained by commerce.sales."""
+    seller = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='daily_sales')
+    day = models.DateField()
+    orders = models.IntegerField(default=0)
+    units = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Escrow released on this day, whenever the orders were placed
+    released_orders = models.IntegerField(default=0)
+    released_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        db_table = 'seller_daily_sales'
+        ordering = ['seller', 'day']
+        unique_together = ['seller', 'day']
+
+
+class SellerCategorySales(models.Model):
+    """A seller's sales in one category on one day, maintained by commerce.sales."""
+    seller = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='category_sales')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='seller_sales')
+    day = models.DateField()
+    orders = models.IntegerField(default=0, help_text="Orders with at least one line in the category")
+    units = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        db_table = 'seller_category_sales'
+        ordering = ['seller', 'day']
+        unique_together = ['seller', 'day', 'category']
+
+
+class SellerProductSales(models.Model):
+    """Sales of one product on one day, maintained by commerce.sales."""
+    seller = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='product_sales')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    day = models.DateField()
+    orders = models.IntegerField(default=0)
+    units = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        db_table = 'seller_product_sales'
+        ordering = ['seller', 'day']
+        unique_together = ['seller', 'day', 'product']
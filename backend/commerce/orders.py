@@ -0,0 +1,99 @@
+"""
+Order placement, shared by single-seller orders and cart checkout.
+
+Lines are grouped by the seller of their product and placed with a fixed
+number of queries however many sellers and lines there are: stock of every
+line is reserved with one conditional ``UPDATE``, the orders (one per seller)
+are written with one ``bulk_create`` and their items with another, and the
+seller sales rollups are updated with them (see ``sales``). Callers run
+``place_orders`` inside their own transaction, so a failed reservation leaves
+neither orders nor stock changes behind.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import models
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from . import caching, sales
+from .models import Order, OrderItem, Product, Project
+
+# Example VAT rate applied to every order
+TAX_RATE = Decimal('0.21')
+
+
+def merge_lines(lines):
+    """Sum the quantities of ``(product_id, quantity)`` pairs naming the same product."""
+    quantities = {}
+    for product_id, quantity in lines:
+        quantities[product_id] = quantities.get(product_id, Decimal('0')) + quantity
+    return quantities
+
+
+def line_errors(quantities, products):
+    """Messages for lines whose product is missing, inactive or short of stock."""
+    errors = []
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
+        if product is None or product.status != 'active':
+            errors.append(f"Product {product_id} is not available.")
+        elif product.quantity < quantity:
+            errors.append(f"Only {product.quantity} left of product {product_id}.")
+    return errors
+
+
+def reserve_stock(quantities):
+    """
+    Decrement stock of all ``{product_id: quantity}`` lines in one conditional
+    UPDATE. Fails unless every line still had enough left, so concurrent buyers
+    cannot both get the last units; listings that run out are marked sold.
+    """
+    wanted = Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        output_field=models.DecimalField(max_digits=10, decimal_places=2)
+    )
+    now = timezone.now()
+    reserved = Product.objects.filter(pk__in=quantities, status='active', quantity__gte=wanted).update(
+        quantity=F('quantity') - wanted, updated_at=now
+    )
+    if reserved != len(quantities):
+        raise ValidationError({'items': ['Some items sold out while you were checking out.']})
+    Product.objects.filter(pk__in=quantities, quantity__lte=0).update(status='sold', updated_at=now)
+    caching.invalidate_on_commit()
+
+
+def place_orders(buyer, quantities, products, delivery_method, project_id=None):
+    """
+    Create one order per seller for ``{product_id: quantity}`` lines and
+    return them in seller order. ``products`` maps the product ids to the
+    instances checked by the caller; must run inside a transaction.
+    """
+    project = Project.objects.filter(id=project_id, buyer=buyer).first() if project_id else None
+    lines = defaultdict(list)
+    for product_id, quantity in quantities.items():
+        product = products[product_id]
+        lines[product.seller_id].append((product, quantity))
+    lines = sorted(lines.items())
+
+    reserve_stock(quantities)
+    orders = []
+    for seller_id, seller_lines in lines:
+        total_amount = sum((product.price * quantity for product, quantity in seller_lines), Decimal('0.00'))
+        orders.append(Order(
+            buyer=buyer,
+            seller_id=seller_id,
+            project=project,
+            total_amount=total_amount,
+            tax_amount=total_amount * TAX_RATE,
+            delivery_method=delivery_method,
+        ))
+    Order.objects.bulk_create(orders)
+    items = OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=product, quantity=quantity, price_at_purchase=product.price)
+        for order, (seller_id, seller_lines) in zip(orders, lines)
+        for product, quantity in seller_lines
+    ])
+    sales.record_items(items)
+    return orders
@@ -0,0 +1,190 @@
+"""
+Pagination for the catalog and order lists.
+
+Page numbers stay the default. ``?pagination=cursor`` (or any ``?cursor=``)
+switches a request to keyset pagination, which seeks past the last row of the
+previous page on the list ordering (``-created_at, -id`` by default) instead
+of counting the whole result set and scanning past an OFFSET.
+"""
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date
+from functools import reduce
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def _encode_value(value):
+    # Full-precision ISO timestamps; DjangoJSONEncoder would drop microseconds
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+class KeysetPagination(BasePagination):
+    """Seek-method pagination on the queryset's ordering plus an ``id`` tie-breaker."""
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    default_ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_ordering(self, queryset):
+        ordering = [str(term) for term in queryset.query.order_by] or list(self.default_ordering)
+        if not any(term.lstrip('-') in ('id', 'pk') for term in ordering):
+            ordering.append('-id' if ordering[0].startswith('-') else 'id')
+        return ordering
+
+    def _field(self, queryset, name):
+        """Return the model field for ``name``, or None for an annotation."""
+        if name in queryset.query.annotations:
+            return None
+        try:
+            field = queryset.model._meta.get_field('id' if name == 'pk' else name)
+        except FieldDoesNotExist:
+            raise ValidationError({self.cursor_query_param: f'Cursor pagination is not available when ordering by {name}.'})
+        return field
+
+    def encode_cursor(self, values, reverse):
+        payload = json.dumps({'v': values, 'r': reverse}, default=_encode_value)
+        return urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, request, queryset, names):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(token.encode()).decode())
+            values, reverse = payload['v'], bool(payload['r'])
+            if len(values) != len(names):
+                raise ValueError
+            values = [
+                None if value is None else float(value) if field is None else field.to_python(value)
+                for value, field in zip(values, (self._field(queryset, name) for name in names))
+            ]
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def seek_filter(self, ordering, values, reverse, nulls_largest=False):
+        """
+        Rows strictly after ``values`` in ``ordering`` (before them if ``reverse``).
+        NULLs sort above every value if ``nulls_largest``, else below, as the
+        database orders them.
+        """
+        clauses = []
+        for index, term in enumerate(ordering):
+            name = term.lstrip('-')
+            descending = term.startswith('-') != reverse
+            nulls_after = nulls_largest != descending
+            if values[index] is None:
+                if nulls_after:
+                    # Nothing follows a NULL on this column
+                    continue
+                clause = Q(**{f'{name}__isnull': False})
+            else:
+                clause = Q(**{f"{name}__{'lt' if descending else 'gt'}": values[index]})
+                if nulls_after:
+                    clause |= Q(**{f'{name}__isnull': True})
+            for previous_term, value in zip(ordering[:index], values):
+                previous = previous_term.lstrip('-')
+                clause &= Q(**{f'{previous}__isnull': True} if value is None else {previous: value})
+            clauses.append(clause)
+        return reduce(lambda a, b: a | b, clauses)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        ordering = self.get_ordering(queryset)
+        self.names = [term.lstrip('-') for term in ordering]
+        for name in self.names:
+            self._field(queryset, name)
+        values, reverse = self.decode_cursor(request, queryset, self.names)
+
+        if reverse:
+            ordering_used = [term[1:] if term.startswith('-') else f'-{term}' for term in ordering]
+        else:
+            ordering_used = ordering
+        queryset = queryset.order_by(*ordering_used)
+        if values is not None:
+            nulls_largest = connections[queryset.db].features.nulls_order_largest
+            queryset = queryset.filter(self.seek_filter(ordering, values, reverse, nulls_largest))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        page = rows[:self.page_size]
+        if reverse:
+            page.reverse()
+            self.has_next, self.has_previous = values is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, values is not None
+        self.page = page
+        return page
+
+    def _position(self, obj):
+        return [getattr(obj, 'id' if name == 'pk' else name) for name in self.names]
+
+    def _link(self, obj, reverse):
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, self.encode_cursor(self._position(obj), reverse)
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self._link(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class CatalogPagination(PageNumberPagination):
+    """Page-number pagination that switches to ``KeysetPagination`` on request."""
+    mode_query_param = 'pagination'
+    keyset_class = KeysetPagination
+
+    def use_keyset(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.keyset_class.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.keyset_class() if self.use_keyset(request) else None
+        if self.keyset:
+            self.keyset.page_size = self.get_page_size(request) or self.page_size
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,195 @@
+"""
+Market price estimation for ``Product.market_price``.
+
+Price observations ``(category_id, condition, unit_of_measure, price)`` are
+collected from the configured sources (``MARKET_PRICE_SOURCES``; by default
+our own recent sales and active listings) into NumPy arrays. Each
+(category, condition, unit) group is encoded as one integer key, and every
+group's quantile comes from a single sort, without a Python loop over
+groups. Groups with fewer than ``MIN_OBSERVATIONS`` observations fall back to
+their (category, unit) group.
+
+Estimates are written with one ``UPDATE`` per group. It only touches active
+products whose market price is missing or was estimated before, and whose
+value actually changes.
+
+External price feeds plug in as further sources. ``PriceListSource`` is the
+local stand-in: it reads the same observation shape from a CSV file
+(``MARKET_PRICE_LIST``) that an external feed would provide.
+"""
+import csv
+import math
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import caching
+from .models import Category, OrderItem, Product
+
+DEFAULT_SOURCES = [
+    'commerce.pricing.OrderHistorySource',
+    'commerce.pricing.ActiveListingSource',
+    'commerce.pricing.PriceListSource',
+]
+DEFAULT_QUANTILE = 0.5
+MIN_OBSERVATIONS = 3
+SALES_LOOKBACK_DAYS = 365
+
+CONDITIONS = [code for code, _label in Product.CONDITION_CHOICES]
+UNITS = [code for code, _label in Product.UNIT_CHOICES]
+CONDITION_CODES = {code: index for index, code in enumerate(CONDITIONS)}
+UNIT_CODES = {code: index for index, code in enumerate(UNITS)}
+# Placeholder condition code of the (category, unit) fallback groups
+ANY_CONDITION = len(CONDITIONS)
+
+
+class PriceSource:
+    """A provider of ``(category_id, condition, unit_of_measure, price)`` observations."""
+
+    def observations(self):
+        raise NotImplementedError
+
+
+class OrderHistorySource(PriceSource):
+    """Prices paid on this marketplace over the last ``SALES_LOOKBACK_DAYS`` days."""
+
+    def observations(self):
+        since = timezone.now() - timedelta(days=SALES_LOOKBACK_DAYS)
+        return OrderItem.objects.filter(order__created_at__gte=since).values_list(
+            'product__category_id', 'product__condition', 'product__unit_of_measure', 'price_at_purchase'
+        ).iterator(chunk_size=5000)
+
+
+class ActiveListingSource(PriceSource):
+    """Asking prices of the current catalog."""
+
+    def observations(self):
+        return Product.objects.filter(status='active').values_list(
+            'category_id', 'condition', 'unit_of_measure', 'price'
+        ).iterator(chunk_size=5000)
+
+
+class PriceListSource(PriceSource):
+    """
+    Local stand-in for an external price feed: a CSV file with ``category``
+    (name or id), ``condition`` (optional), ``unit_of_measure`` and ``price``
+    columns. Does nothing unless ``MARKET_PRICE_LIST`` names a file.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or getattr(settings, 'MARKET_PRICE_LIST', None)
+
+    def observations(self):
+        if not self.path:
+            return
+        categories = {}
+        for category_id, name in Category.objects.values_list('id', 'name'):
+            categories[str(category_id)] = categories[name.strip().lower()] = category_id
+        with open(self.path, newline='', encoding='utf-8-sig') as stream:
+            for row in csv.DictReader(stream):
+                category_id = categories.get((row.get('category') or '').strip().lower())
+                if category_id is None:
+                    continue
+                try:
+                    price = float(row['price'])
+                except (KeyError, ValueError, TypeError):
+                    continue
+                # Rows without a condition count towards every condition
+                for condition in [row['condition']] if row.get('condition') else CONDITIONS:
+                    yield category_id, condition, row.get('unit_of_measure'), price
+
+
+def get_sources():
+    return [import_string(path)() for path in getattr(settings, 'MARKET_PRICE_SOURCES', DEFAULT_SOURCES)]
+
+
+def encode(category, condition, unit):
+    """Integer group keys for the given code arrays."""
+    return (category * (len(CONDITIONS) + 1) + condition) * len(UNITS) + unit
+
+
+def decode(keys):
+    keys, unit = np.divmod(keys, len(UNITS))
+    category, condition = np.divmod(keys, len(CONDITIONS) + 1)
+    return category, condition, unit
+
+
+def load_observations(sources):
+    """Return ``(category, condition, unit, price)`` arrays of the known-code observations."""
+    rows = [
+        (category_id, CONDITION_CODES[condition], UNIT_CODES[unit], float(price))
+        for source in sources
+        for category_id, condition, unit, price in source.observations()
+        if condition in CONDITION_CODES and unit in UNIT_CODES and price is not None
+        # NaN/Infinity (e.g. from a price list) would raise on comparison
+        and math.isfinite(price) and price > 0
+    ]
+    if not rows:
+        return tuple(np.empty(0, dtype=dtype) for dtype in (np.int64, np.int64, np.int64, float))
+    category, condition, unit, price = (np.array(column) for column in zip(*rows))
+    return category.astype(np.int64), condition.astype(np.int64), unit.astype(np.int64), price.astype(float)
+
+
+def group_quantiles(keys, values, quantile):
+    """Per distinct key: ``(keys, linear-interpolated quantile of values, counts)``."""
+    if not len(keys):
+        return keys, values, keys
+    order = np.lexsort((values, keys))
+    keys, values = keys[order], values[order]
+    unique, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+    position = starts + quantile * (counts - 1)
+    low = np.floor(position).astype(np.int64)
+    high = np.ceil(position).astype(np.int64)
+    estimate = values[low] + (values[high] - values[low]) * (position - low)
+    return unique, estimate, counts
+
+
+def estimate_prices(sources=None, quantile=None, min_observations=MIN_OBSERVATIONS):
+    """
+    Return ``{(category_id, condition, unit_of_measure): Decimal}`` for every
+    group with an estimate, using the fallback group where needed.
+    """
+    quantile = getattr(settings, 'MARKET_PRICE_QUANTILE', DEFAULT_QUANTILE) if quantile is None else quantile
+    category, condition, unit, price = load_observations(get_sources() if sources is None else sources)
+
+    keys, estimates, counts = group_quantiles(encode(category, condition, unit), price, quantile)
+    exact = dict(zip(keys[counts >= min_observations].tolist(), estimates[counts >= min_observations].tolist()))
+    keys, estimates, counts = group_quantiles(encode(category, ANY_CONDITION, unit), price, quantile)
+    fallback = dict(zip(keys[counts >= min_observations].tolist(), estimates[counts >= min_observations].tolist()))
+
+    result = {}
+    categories = set(decode(np.array(list(fallback), dtype=np.int64))[0].tolist())
+    for category_id in categories:
+        for condition_code, condition_name in enumerate(CONDITIONS):
+            for unit_code, unit_name in enumerate(UNITS):
+                value = exact.get(
+                    encode(category_id, condition_code, unit_code),
+                    fallback.get(encode(category_id, ANY_CONDITION, unit_code))
+                )
+                if value is not None:
+                    result[(category_id, condition_name, unit_name)] = Decimal(value).quantize(Decimal('0.01'), ROUND_HALF_UP)
+    return result
+
+
+def refresh_market_prices(sources=None, quantile=None):
+    """Write current estimates into ``Product.market_price``; returns the number of products updated."""
+    estimates = estimate_prices(sources, quantile)
+    now = timezone.now()
+    updated = 0
+    with transaction.atomic():
+        for (category_id, condition, unit), value in estimates.items():
+            updated += Product.objects.filter(
+                Q(market_price__isnull=True) | Q(market_price_estimated=True),
+                status='active', category_id=category_id, condition=condition, unit_of_measure=unit,
+            ).exclude(market_price=value, market_price_estimated=True).update(
+                market_price=value, market_price_estimated=True, updated_at=now
+            )
+        if updated:
+            caching.invalidate_on_commit()
+    return updated
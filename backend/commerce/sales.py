@@ -0,0 +1,205 @@
+"""
+Seller sales rollups.
+
+Three daily tables hold what seller dashboards show. ``SellerDailySales``
+holds the orders, units, revenue and released escrow of each seller per day.
+``SellerCategorySales`` and ``SellerProductSales`` break the same figures
+down by category and by product. ``summary()`` reads only these tables, so
+its cost follows the days (and categories/products) in the requested range,
+not the size of the order history.
+
+The tables are kept up to date incrementally. ``orders.place_orders`` adds
+each new order's lines with one ``INSERT ... ON CONFLICT DO UPDATE`` per
+table, and escrow moving into (or out of) ``released`` adjusts the release
+columns via the Order signals. Orders written any other way (the admin,
+fixtures) are picked up by ``backfill_sales_rollups``, which rebuilds the
+tables from ``Order``/``OrderItem``.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, models, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Order, OrderItem, SellerCategorySales, SellerDailySales, SellerProductSales
+
+DAILY_VALUES = ('orders', 'units', 'revenue', 'released_orders', 'released_revenue')
+BREAKDOWN_VALUES = ('orders', 'units', 'revenue')
+TOP_PRODUCTS = 10
+CENTS = Decimal('0.01')
+
+
+def increment(model, key_fields, value_fields, rows):
+    """
+    Add ``{key values: increments}`` to the rollup ``model`` with a single
+    upsert; rows missing so far are inserted.
+    """
+    if not rows:
+        return
+    opts = model._meta
+    quote = connection.ops.quote_name
+    fields = [opts.get_field(name) for name in (*key_fields, *value_fields)]
+    table = quote(opts.db_table)
+    columns = ', '.join(quote(field.column) for field in fields)
+    keys = ', '.join(quote(field.column) for field in fields[:len(key_fields)])
+    updates = ', '.join(
+        f'{quote(field.column)} = {table}.{quote(field.column)} + excluded.{quote(field.column)}'
+        for field in fields[len(key_fields):]
+    )
+    row_sql = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    params = [
+        field.get_db_prep_save(value, connection)
+        for key, values in rows.items()
+        for field, value in zip(fields, (*key, *values))
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) VALUES {", ".join([row_sql] * len(rows))} '
+            f'ON CONFLICT ({keys}) DO UPDATE SET {updates}',
+            params
+        )
+
+
+def _accumulate(totals, key, order_id, units, revenue):
+    orders, total_units, total_revenue = totals.get(key, (set(), Decimal('0'), Decimal('0')))
+    orders.add(order_id)
+    totals[key] = (orders, total_units + units, total_revenue + revenue)
+
+
+def record_items(items):
+    """Add new OrderItems (with ``order`` and ``product`` loaded) to the rollups."""
+    days, categories, products = {}, {}, {}
+    for item in items:
+        order = item.order
+        day = timezone.localdate(order.created_at)
+        revenue = item.quantity * item.price_at_purchase
+        _accumulate(days, (order.seller_id, day), order.pk, item.quantity, revenue)
+        _accumulate(categories, (order.seller_id, day, item.product.category_id), order.pk, item.quantity, revenue)
+        _accumulate(products, (order.seller_id, day, item.product_id), order.pk, item.quantity, revenue)
+
+    increment(SellerDailySales, ('seller', 'day'), DAILY_VALUES, {
+        key: (len(orders), units, revenue, 0, Decimal('0')) for key, (orders, units, revenue) in days.items()
+    })
+    increment(SellerCategorySales, ('seller', 'day', 'category'), BREAKDOWN_VALUES, {
+        key: (len(orders), units, revenue) for key, (orders, units, revenue) in categories.items()
+    })
+    increment(SellerProductSales, ('seller', 'day', 'product'), BREAKDOWN_VALUES, {
+        key: (len(orders), units, revenue) for key, (orders, units, revenue) in products.items()
+    })
+
+
+def record_release(order, released=True):
+    """Count ``order``'s escrow as released on its release day, or take the release back."""
+    sign = 1 if released else -1
+    day = timezone.localdate(order.escrow_released_at) if order.escrow_released_at else timezone.localdate()
+    increment(SellerDailySales, ('seller', 'day'), DAILY_VALUES, {
+        (order.seller_id, day): (0, Decimal('0'), Decimal('0'), sign, sign * order.total_amount)
+    })
+
+
+def _line_totals(items, *group_by):
+    return items.values(*group_by).annotate(
+        order_count=Count('order_id', distinct=True),
+        unit_total=Sum('quantity'),
+        revenue_total=Sum(F('quantity') * F('price_at_purchase'), output_field=models.DecimalField()),
+    ).order_by()
+
+
+def backfill(since=None):
+    """
+    Rebuild the rollups from the order tables, from the date ``since`` on or
+    entirely. Releases are dated by ``Order.escrow_released_at``. Returns
+    the number of rows written.
+    """
+    items = OrderItem.objects.annotate(day=TruncDate('order__created_at'))
+    released = Order.objects.filter(escrow_status='released').annotate(day=TruncDate('escrow_released_at'))
+    rollups = [SellerDailySales, SellerCategorySales, SellerProductSales]
+    if since is not None:
+        items = items.filter(day__gte=since)
+        released = released.filter(day__gte=since)
+
+    # One transaction, so dashboards never see the tables half rebuilt
+    with transaction.atomic():
+        daily = defaultdict(SellerDailySales)
+        for row in _line_totals(items, 'order__seller_id', 'day'):
+            rollup = daily[(row['order__seller_id'], row['day'])]
+            rollup.orders, rollup.units, rollup.revenue = row['order_count'], row['unit_total'], row['revenue_total']
+        for row in released.values('seller_id', 'day').annotate(count=Count('pk'), total=Sum('total_amount')).order_by():
+            rollup = daily[(row['seller_id'], row['day'])]
+            rollup.released_orders, rollup.released_revenue = row['count'], row['total']
+        for (seller_id, day), rollup in daily.items():
+            rollup.seller_id, rollup.day = seller_id, day
+
+        categories = [
+            SellerCategorySales(
+                seller_id=row['order__seller_id'], day=row['day'], category_id=row['product__category_id'],
+                orders=row['order_count'], units=row['unit_total'], revenue=row['revenue_total'],
+            )
+            for row in _line_totals(items, 'order__seller_id', 'day', 'product__category_id')
+        ]
+        products = [
+            SellerProductSales(
+                seller_id=row['order__seller_id'], day=row['day'], product_id=row['product_id'],
+                orders=row['order_count'], units=row['unit_total'], revenue=row['revenue_total'],
+            )
+            for row in _line_totals(items, 'order__seller_id', 'day', 'product_id')
+        ]
+
+        for model in rollups:
+            stale = model.objects.all() if since is None else model.objects.filter(day__gte=since)
+            stale.delete()
+        SellerDailySales.objects.bulk_create(daily.values(), batch_size=1000)
+        SellerCategorySales.objects.bulk_create(categories, batch_size=1000)
+        SellerProductSales.objects.bulk_create(products, batch_size=1000)
+        return len(daily) + len(categories) + len(products)
+
+
+def _figures(row, fields=BREAKDOWN_VALUES, suffix=''):
+    # Decimals as strings, like the rest of the API renders money
+    return {
+        field: row[field + suffix] if field.endswith('orders') else str(Decimal(row[field + suffix]).quantize(CENTS))
+        for field in fields
+    }
+
+
+def summary(seller, start, end, top=TOP_PRODUCTS):
+    """Sales of ``seller`` from ``start`` to ``end`` (inclusive), read from the rollups only."""
+    rows = {
+        row['day']: row for row in
+        SellerDailySales.objects.filter(seller=seller, day__range=(start, end)).values('day', *DAILY_VALUES)
+    }
+    zero = {field: Decimal('0') if not field.endswith('orders') else 0 for field in DAILY_VALUES}
+    days = []
+    totals = dict(zero)
+    day = start
+    while day <= end:
+        row = rows.get(day, zero)
+        days.append({'day': day.isoformat(), **_figures(row, DAILY_VALUES)})
+        for field in DAILY_VALUES:
+            totals[field] += row[field]
+        day += timedelta(days=1)
+
+    sums = {f'{field}_sum': Sum(field) for field in BREAKDOWN_VALUES}
+    categories = (
+        SellerCategorySales.objects.filter(seller=seller, day__range=(start, end))
+        .values('category_id', 'category__name').annotate(**sums).order_by('-revenue_sum', 'category_id')
+    )
+    products = (
+        SellerProductSales.objects.filter(seller=seller, day__range=(start, end))
+        .values('product_id', 'product__title').annotate(**sums).order_by('-revenue_sum', 'product_id')[:top]
+    )
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'totals': _figures(totals, DAILY_VALUES),
+        'days': days,
+        'categories': [
+            {'id': row['category_id'], 'name': row['category__name'], **_figures(row, suffix='_sum')} for row in categories
+        ],
+        'products': [
+            {'id': row['product_id'], 'title': row['product__title'], **_figures(row, suffix='_sum')} for row in products
+        ],
+    }
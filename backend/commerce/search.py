@@ -0,0 +1,213 @@
+"""
+Full-text search index for products.
+
+SQLite keeps an FTS5 virtual table and PostgreSQL a tsvector side table with a
+GIN index. Both live in ``products_search``, are keyed by product id and are
+kept in sync by the signal handlers in ``commerce.signals``. Other database
+backends fall back to ``icontains`` matching.
+"""
+import re
+from functools import reduce
+
+from django.db import connection as default_connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
+
+SEARCH_TABLE = 'products_search'
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Selects the indexed columns of every product matching ``{where}``.
+SOURCE_SQL = (
+    'SELECT p.id, p.title, p.description, c.name '
+    'FROM products p INNER JOIN categories c ON c.id = p.category_id '
+    'WHERE {where}'
+)
+
+
+def tokenize(text):
+    """Split free text into lowercase search tokens."""
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def _in_clause(column, ids):
+    return f"{column} IN ({', '.join(['%s'] * len(ids))})"
+
+
+class SQLiteSearchBackend:
+    """FTS5 index ranked with BM25 (title > category > description)."""
+
+    def create(self, cursor):
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5('
+            "title, description, category_name, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+
+    def drop(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+    def sync(self, cursor, where, params):
+        cursor.execute(
+            f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN (SELECT p.id FROM products p WHERE {where})',
+            params
+        )
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, title, description, category_name) '
+            + SOURCE_SQL.format(where=where),
+            params
+        )
+
+    def remove(self, cursor, ids):
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE {_in_clause("rowid", ids)}', list(ids))
+
+    def search(self, queryset, terms):
+        match = ' '.join(f'"{term}"*' for term in terms)
+        return queryset.extra(
+            tables=[SEARCH_TABLE],
+            where=[f'{SEARCH_TABLE}.rowid = products.id', f'{SEARCH_TABLE} MATCH %s'],
+            params=[match],
+        ).annotate(search_rank=RawSQL(f'-bm25({SEARCH_TABLE}, 10.0, 1.0, 5.0)', [], output_field=FloatField()))
+
+
+class PostgresSearchBackend:
+    """Weighted tsvector index ranked with ts_rank."""
+
+    document_sql = (
+        "setweight(to_tsvector('simple', p.title), 'A') || "
+        "setweight(to_tsvector('simple', c.name), 'B') || "
+        "setweight(to_tsvector('simple', p.description), 'C')"
+    )
+
+    def create(self, cursor):
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ('
+            'product_id bigint PRIMARY KEY REFERENCES products (id) ON DELETE CASCADE, '
+            'document tsvector NOT NULL)'
+        )
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_idx '
+            f'ON {SEARCH_TABLE} USING GIN (document)'
+        )
+
+    def drop(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+    def sync(self, cursor, where, params):
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (product_id, document) '
+            f'SELECT p.id, {self.document_sql} '
+            'FROM products p INNER JOIN categories c ON c.id = p.category_id '
+            f'WHERE {where} '
+            'ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document',
+            params
+        )
+
+    def remove(self, cursor, ids):
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE {_in_clause("product_id", ids)}', list(ids))
+
+    def search(self, queryset, terms):
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        return queryset.extra(
+            tables=[SEARCH_TABLE],
+            where=[
+                f'{SEARCH_TABLE}.product_id = products.id',
+                f"{SEARCH_TABLE}.document @@ to_tsquery('simple', %s)",
+            ],
+            params=[tsquery],
+        ).annotate(search_rank=RawSQL(
+            f"ts_rank({SEARCH_TABLE}.document, to_tsquery('simple', %s))", [tsquery], output_field=FloatField()
+        ))
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(connection=None):
+    """Return the search backend for ``connection``, or None if unsupported."""
+    backend_class = BACKENDS.get((connection or default_connection).vendor)
+    return backend_class() if backend_class else None
+
+
+def _sync(where, params, connection=None):
+    connection = connection or default_connection
+    backend = get_backend(connection)
+    if backend:
+        with connection.cursor() as cursor:
+            backend.sync(cursor, where, params)
+
+
+def index_products(ids):
+    """(Re)index the given product ids."""
+    if ids:
+        _sync(_in_clause('p.id', ids), list(ids))
+
+
+def index_category(category_id):
+    """Reindex every product in a category, e.g. after it was renamed."""
+    _sync('p.category_id = %s', [category_id])
+
+
+def remove_products(ids):
+    """Drop the given product ids from the index."""
+    backend = get_backend()
+    if backend and ids:
+        with default_connection.cursor() as cursor:
+            backend.remove(cursor, ids)
+
+
+def rebuild_index(connection=None):
+    """Drop, recreate and fully repopulate the search index."""
+    connection = connection or default_connection
+    backend = get_backend(connection)
+    if backend is None:
+        return False
+    with connection.cursor() as cursor:
+        backend.drop(cursor)
+        backend.create(cursor)
+        backend.sync(cursor, '1 = 1', [])
+    return True
+
+
+def search_products(queryset, text):
+    """Filter ``queryset`` to products matching ``text``, annotated with ``search_rank``."""
+    terms = tokenize(text)
+    if not terms:
+        return queryset
+    backend = get_backend(default_connection)
+    if backend:
+        return backend.search(queryset, terms)
+    lookups = [
+        Q(title__icontains=term) | Q(description__icontains=term) | Q(category__name__icontains=term)
+        for term in terms
+    ]
+    return queryset.filter(reduce(lambda a, b: a & b, lookups)).annotate(search_rank=Value(0.0))
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """
+    Full-text product search via ``?q=`` (``?search=`` is accepted as an alias).
+
+    Results are ordered by relevance unless an explicit ``ordering`` is given,
+    so this backend must run after ``OrderingFilter``.
+    """
+    search_params = ('q', api_settings.SEARCH_PARAM)
+
+    def get_search_text(self, request):
+        for param in self.search_params:
+            value = request.query_params.get(param)
+            if value:
+                return value
+        return ''
+
+    def filter_queryset(self, request, queryset, view):
+        text = self.get_search_text(request)
+        if not tokenize(text):
+            return queryset
+        queryset = search_products(queryset, text)
+        if not request.query_params.get(api_settings.ORDERING_PARAM):
+            queryset = queryset.order_by('-search_rank', '-created_at')
+        return queryset
@@ -1,20 +1,57 @@
+from django.db import transaction
 from rest_framework import serializers
+from . import counters, orders
 from .models import (
     Category, Product, ProductImage, Order, OrderItem, Cart, CartItem, Wishlist,
-    Project, ProductAlert, Kit, Flag, Dispute
+    Project, ProductAlert, AlertMatch, Kit, KitReservation, Flag, Dispute
 )
 
 
+class BufferedCountField(serializers.IntegerField):
+    """Stored counter plus increments still buffered in commerce.counters."""
+    
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+    
+    def get_attribute(self, instance):
+        stored = super().get_attribute(instance)
+        return stored + counters.pending(type(instance), instance.pk, self.source)
+
+
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'icon']
 
 
+def variant_url(image, variant='thumbnail'):
+    """URL of a resized variant of ``image`` (see commerce.images), else of the original."""
+    if image is None or not image.image:
+        return None
+    rendition = getattr(image, variant)
+    return rendition.url if rendition else image.image.url
+
+
 class ProductImageSerializer(serializers.ModelSerializer):
+    thumbnail = serializers.SerializerMethodField()
+    medium = serializers.SerializerMethodField()
+    
+    def absolute_variant_url(self, obj, variant):
+        # Absolute like the ImageField next to it
+        url = variant_url(obj, variant)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if url and request else url
+    
+    def get_thumbnail(self, obj):
+        return self.absolute_variant_url(obj, 'thumbnail')
+    
+    def get_medium(self, obj):
+        return self.absolute_variant_url(obj, 'medium')
+    
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'is_primary', 'order']
+        fields = ['id', 'image', 'thumbnail', 'medium', 'is_primary', 'order']
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -23,6 +60,8 @@ class ProductSerializer(serializers.ModelSerializer):
     seller_business_name = serializers.CharField(source='seller.business_name', read_only=True, allow_null=True)
     savings_percentage = serializers.IntegerField(read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
+    views = BufferedCountField()
+    saves = BufferedCountField()
     
     class Meta:
         model = Product
@@ -37,6 +76,12 @@ class ProductSerializer(serializers.ModelSerializer):
             'images', 'created_at', 'updated_at'
         ]
         read_only_fields = ['seller', 'views', 'saves', 'created_at', 'updated_at']
+    
+    def update(self, instance, validated_data):
+        # A market price the seller enters replaces the estimate from commerce.pricing for good
+        if 'market_price' in validated_data and validated_data['market_price'] != instance.market_price:
+            validated_data['market_price_estimated'] = False
+        return super().update(instance, validated_data)
 
 
 class ProductListSerializer(serializers.ModelSerializer):
@@ -45,13 +90,12 @@ class ProductListSerializer(serializers.ModelSerializer):
     seller_business_name = serializers.CharField(source='seller.business_name', read_only=True, allow_null=True)
     savings_percentage = serializers.IntegerField(read_only=True)
     primary_image = serializers.SerializerMethodField()
+    # Only present on ?lat=&lng= queries (see commerce.geo.NearbyFilter)
+    distance_km = serializers.FloatField(source='distance', read_only=True, allow_null=True)
     
     def get_primary_image(self, obj):
-        primary = obj.images.filter(is_primary=True).first()
-        if primary:
-            return primary.image.url if primary.image else None
-        first_image = obj.images.first()
-        return first_image.image.url if first_image and first_image.image else None
+        # Querysets should select_related('primary_image') to keep this query-free
+        return variant_url(obj.primary_image)
     
     class Meta:
         model = Product
@@ -59,7 +103,23 @@ class ProductListSerializer(serializers.ModelSerializer):
             'id', 'title', 'category_name', 'seller_business_name',
             'condition', 'quantity', 'unit_of_measure',
             'price', 'market_price', 'savings_percentage',
-            'location_name', 'status', 'primary_image', 'created_at'
+            'location_name', 'distance_km', 'status', 'primary_image', 'created_at'
+        ]
+
+
+class ProductImportSerializer(serializers.ModelSerializer):
+    """Validates one row of a bulk import manifest (see commerce.imports)."""
+    # Category name or id, resolved by the importer against a preloaded map
+    category = serializers.CharField()
+    
+    class Meta:
+        model = Product
+        fields = [
+            'title', 'description', 'category',
+            'condition', 'quantity', 'unit_of_measure',
+            'price', 'market_price',
+            'weight_per_unit', 'dimensions',
+            'location_lat', 'location_long', 'location_name',
         ]
 
 
@@ -88,6 +148,23 @@ class OrderSerializer(serializers.ModelSerializer):
         read_only_fields = ['buyer', 'created_at', 'updated_at']
 
 
+class OrderSummarySerializer(serializers.ModelSerializer):
+    """Order list rows: the order itself and its line count, without the items."""
+    buyer_name = serializers.CharField(source='buyer.username', read_only=True)
+    seller_name = serializers.CharField(source='seller.username', read_only=True)
+    project_name = serializers.CharField(source='project.name', read_only=True, allow_null=True)
+    item_count = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = Order
+        fields = [
+            'id', 'buyer', 'buyer_name', 'seller', 'seller_name', 'project', 'project_name',
+            'total_amount', 'tax_amount', 'delivery_method', 'delivery_status',
+            'escrow_status', 'item_count', 'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
+
+
 class OrderCreateSerializer(serializers.Serializer):
     """Serializer for creating orders with items."""
     seller = serializers.IntegerField()
@@ -106,58 +183,69 @@ class OrderCreateSerializer(serializers.Serializer):
         for item in value:
             if 'product_id' not in item or 'quantity' not in item:
                 raise serializers.ValidationError("Each item must have product_id and quantity.")
-        return value
+            if item['product_id'] != int(item['product_id']) or item['quantity'] <= 0:
+                raise serializers.ValidationError("Each item needs an integer product_id and a positive quantity.")
+        # Repeated products are bought as one line
+        quantities = orders.merge_lines((int(item['product_id']), item['quantity']) for item in value)
+        return [{'product_id': product_id, 'quantity': quantity} for product_id, quantity in quantities.items()]
+    
+    def validate(self, attrs):
+        """Check every product in one query: it must exist, be active, belong to the seller and be in stock."""
+        quantities = {item['product_id']: item['quantity'] for item in attrs['items']}
+        products = Product.objects.in_bulk(quantities)
+        errors = orders.line_errors(quantities, products)
+        errors += [
+            f"Product {product_id} is not sold by this seller."
+            for product_id in quantities
+            if product_id in products and products[product_id].seller_id != attrs['seller']
+        ]
+        if errors:
+            raise serializers.ValidationError({'items': errors})
+        attrs['products'] = products
+        return attrs
     
     def create(self, validated_data):
         """Create order with items."""
-        from decimal import Decimal
-        
-        items_data = validated_data.pop('items')
-        buyer = self.context['request'].user
-        seller_id = validated_data.pop('seller')
-        
-        # Calculate totals
-        total_amount = Decimal('0.00')
-        order_items = []
-        
-        for item_data in items_data:
-            product = Product.objects.get(id=item_data['product_id'])
-            quantity = Decimal(str(item_data['quantity']))
-            subtotal = product.price * quantity
-            total_amount += subtotal
-            order_items.append({
-                'product': product,
-                'quantity': quantity,
-                'price_at_purchase': product.price
-            })
-        
-        # Calculate tax (example: 21% VAT)
-        tax_amount = total_amount * Decimal('0.21')
-        
-        # Get project if provided
-        project_id = validated_data.pop('project', None)
-        project = None
-        if project_id:
-            from .models import Project
-            project = Project.objects.filter(id=project_id, buyer=buyer).first()
-        
-        # Create order
-        order = Order.objects.create(
-            buyer=buyer,
-            seller_id=seller_id,
-            project=project,
-            total_amount=total_amount,
-            tax_amount=tax_amount,
-            **validated_data
-        )
-        
-        # Create order items
-        for item_data in order_items:
-            OrderItem.objects.create(order=order, **item_data)
-        
+        quantities = {item['product_id']: item['quantity'] for item in validated_data['items']}
+        with transaction.atomic():
+            order, = orders.place_orders(
+                self.context['request'].user, quantities, validated_data['products'],
+                validated_data['delivery_method'], validated_data.get('project')
+            )
         return order
 
 
+class CheckoutSerializer(serializers.Serializer):
+    """Checks out the whole cart of the requesting user: one order per seller."""
+    project = serializers.IntegerField(required=False, allow_null=True)
+    delivery_method = serializers.ChoiceField(choices=Order.DELIVERY_CHOICES)
+    
+    def validate(self, attrs):
+        """Load the cart lines and their products in one query and check every line."""
+        cart_items = list(CartItem.objects.filter(cart__user=self.context['request'].user).select_related('product'))
+        if not cart_items:
+            raise serializers.ValidationError("Your cart is empty.")
+        quantities = orders.merge_lines((item.product_id, item.quantity) for item in cart_items)
+        errors = orders.line_errors(quantities, {item.product_id: item.product for item in cart_items})
+        if errors:
+            raise serializers.ValidationError({'items': errors})
+        attrs['cart_items'] = cart_items
+        return attrs
+    
+    def create(self, validated_data):
+        """Place every seller's order and drop the purchased cart lines, all or nothing."""
+        cart_items = validated_data['cart_items']
+        quantities = orders.merge_lines((item.product_id, item.quantity) for item in cart_items)
+        with transaction.atomic():
+            placed = orders.place_orders(
+                self.context['request'].user, quantities, {item.product_id: item.product for item in cart_items},
+                validated_data['delivery_method'], validated_data.get('project')
+            )
+            # Only the lines read above: anything added meanwhile stays in the cart
+            CartItem.objects.filter(pk__in=[item.pk for item in cart_items]).delete()
+        return placed
+
+
 class CartItemSerializer(serializers.ModelSerializer):
     product_title = serializers.CharField(source='product.title', read_only=True)
     product_price = serializers.DecimalField(source='product.price', max_digits=10, decimal_places=2, read_only=True)
@@ -165,11 +253,7 @@ class CartItemSerializer(serializers.ModelSerializer):
     subtotal = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     
     def get_product_image(self, obj):
-        primary = obj.product.images.filter(is_primary=True).first()
-        if primary and primary.image:
-            return primary.image.url
-        first_image = obj.product.images.first()
-        return first_image.image.url if first_image and first_image.image else None
+        return variant_url(obj.product.primary_image)
     
     class Meta:
         model = CartItem
@@ -199,15 +283,19 @@ class WishlistSerializer(serializers.ModelSerializer):
 
 class ProjectSerializer(serializers.ModelSerializer):
     """Serializer for buyer projects."""
-    total_spent = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    # Annotated by Project.objects.with_totals()
+    total_spent = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
     order_count = serializers.IntegerField(read_only=True)
+    budget_remaining = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True, allow_null=True)
+    budget_used_percent = serializers.IntegerField(read_only=True, allow_null=True)
     buyer_name = serializers.CharField(source='buyer.username', read_only=True)
     
     class Meta:
         model = Project
         fields = [
             'id', 'buyer', 'buyer_name', 'name', 'description', 'budget',
-            'status', 'total_spent', 'order_count', 'created_at', 'updated_at'
+            'status', 'total_spent', 'order_count', 'budget_remaining', 'budget_used_percent',
+            'created_at', 'updated_at'
         ]
         read_only_fields = ['buyer', 'created_at', 'updated_at']
 
@@ -227,11 +315,24 @@ class ProductAlertSerializer(serializers.ModelSerializer):
         read_only_fields = ['user', 'last_notified_at', 'created_at', 'updated_at']
 
 
+class AlertMatchSerializer(serializers.ModelSerializer):
+    """Serializer for products recorded against an instant alert."""
+    product_details = ProductListSerializer(source='product', read_only=True)
+    
+    class Meta:
+        model = AlertMatch
+        fields = ['id', 'alert', 'product', 'product_details', 'notified_at', 'created_at']
+        read_only_fields = fields
+
+
 class KitSerializer(serializers.ModelSerializer):
     """Serializer for limited-time kits."""
     is_available = serializers.BooleanField(read_only=True)
     savings_percentage = serializers.IntegerField(read_only=True)
     kit_type_display = serializers.CharField(source='get_kit_type_display', read_only=True)
+    distance_km = serializers.FloatField(source='distance', read_only=True, allow_null=True)
+    views = BufferedCountField()
+    saves = BufferedCountField()
     
     class Meta:
         model = Kit
@@ -239,12 +340,22 @@ class KitSerializer(serializers.ModelSerializer):
             'id', 'kit_type', 'kit_type_display', 'title', 'description',
             'start_date', 'end_date', 'quantity_available', 'quantity_sold',
             'price', 'market_price', 'savings_percentage', 'location_name',
-            'location_lat', 'location_long', 'status', 'specifications',
+            'location_lat', 'location_long', 'distance_km', 'status', 'specifications',
             'views', 'saves', 'is_available', 'created_at', 'updated_at'
         ]
         read_only_fields = ['views', 'saves', 'created_at', 'updated_at']
 
 
+class KitReservationSerializer(serializers.ModelSerializer):
+    """Kit stock held for the requesting buyer."""
+    kit_title = serializers.CharField(source='kit.title', read_only=True)
+    
+    class Meta:
+        model = KitReservation
+        fields = ['id', 'kit', 'kit_title', 'quantity', 'status', 'expires_at', 'created_at', 'updated_at']
+        read_only_fields = fields
+
+
 class FlagSerializer(serializers.ModelSerializer):
     """Serializer for flags with full details."""
     flagged_by_username = serializers.CharField(source='flagged_by.username', read_only=True)
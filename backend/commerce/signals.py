@@ -0,0 +1,98 @@
+"""Signal handlers keeping derived commerce data in sync with model writes."""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import alert_index, caching, images, sales, search
+from .models import Category, Order, Product, ProductAlert, ProductImage
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    """Refresh the search index entry of a saved product."""
+    search.index_products([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def match_instant_alerts(sender, instance, created, raw=False, **kwargs):
+    """Push-match new listings against instant alerts once they are committed."""
+    if created and not raw and instance.status == 'active':
+        transaction.on_commit(partial(alert_index.record_matches, instance))
+
+
+@receiver(post_save, sender=ProductAlert)
+def post_alert(sender, instance, **kwargs):
+    """Keep the alert's instant-match postings in step with its criteria and state."""
+    alert_index.post_alert(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    """Remove a deleted product from the search index."""
+    search.remove_products([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def reindex_category(sender, instance, created, **kwargs):
+    """Category names are indexed with their products, so renames reindex them."""
+    if not created:
+        search.index_category(instance.pk)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def refresh_primary_image(sender, instance, **kwargs):
+    """Keep Product.primary_image pointing at the image list views should show."""
+    ProductImage.refresh_primary(instance.product_id)
+
+
+@receiver(post_save, sender=ProductImage)
+def render_image_variants(sender, instance, raw=False, **kwargs):
+    """Queue thumbnail/medium rendering for new or replaced uploads."""
+    if not raw and instance.image and not images.variants_current(instance):
+        images.schedule_variants(instance.pk)
+
+
+@receiver(pre_save, sender=Order)
+def remember_escrow_status(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Note the stored escrow status, so post_save can tell a release happened."""
+    instance._stored_escrow_status = None
+    if raw or instance.pk is None or (update_fields is not None and 'escrow_status' not in update_fields):
+        return
+    stored = Order.objects.filter(pk=instance.pk).values_list('escrow_status', 'escrow_released_at').first()
+    if stored is not None:
+        instance._stored_escrow_status, instance.escrow_released_at = stored
+
+
+@receiver(post_save, sender=Order)
+def record_escrow_release(sender, instance, **kwargs):
+    """
+    Stamp ``escrow_released_at`` and count escrow moving into (or back out of)
+    released in the seller sales rollups. The stamp is written on its own, as
+    status-only saves (``update_fields=['escrow_status']``) would not store it.
+    """
+    stored = getattr(instance, '_stored_escrow_status', None)
+    if stored is None or stored == instance.escrow_status:
+        return
+    if instance.escrow_status == 'released':
+        instance.escrow_released_at = timezone.now()
+        Order.objects.filter(pk=instance.pk).update(escrow_released_at=instance.escrow_released_at)
+        sales.record_release(instance)
+    elif stored == 'released':
+        sales.record_release(instance, released=False)
+        instance.escrow_released_at = None
+        Order.objects.filter(pk=instance.pk).update(escrow_released_at=None)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_cache(sender, **kwargs):
+    """Any catalog write retires every cached catalog response."""
+    caching.invalidate_on_commit()
@@ -0,0 +1,207 @@
+"""
+Precomputed "similar products" neighbour lists.
+
+Neighbours are searched within a product's category (listings of another
+category are not shown as similar anyway), one category at a time. For a
+category, the active products are loaded into a ``matching.ProductFrame``. Their
+titles and descriptions become hashed TF-IDF vectors (``TEXT_DIMENSIONS``
+buckets, L2-normalised). For batches of ``BATCH_SIZE`` rows, a batch x
+category score matrix combines:
+
+* text cosine similarity (one matrix product),
+* same condition,
+* price closeness, ``exp(-|log price ratio|)``,
+* distance, ``exp(-km / DISTANCE_SCALE_KM)``; unknown locations score 0.
+
+The top ``TOP_K`` of each row are found with ``argpartition`` and stored in
+``SimilarProduct``.
+
+Incremental refreshes start from the *stale* products: active products
+saved after their neighbours were computed (or never computed), and inactive
+products still present in the table. Scores are symmetric, so the stale
+rows' scores also show which other products must be recomputed: those that
+would now rank a stale product above their current last neighbour, and
+those that currently list one.
+"""
+import zlib
+from collections import defaultdict
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from . import caching
+from .geo import EARTH_RADIUS_KM
+from .matching import ProductFrame
+from .models import Product, SimilarProduct
+from .search import tokenize
+
+TOP_K = 12
+TEXT_DIMENSIONS = 2 ** 10
+BATCH_SIZE = 256
+WEIGHTS = {'text': 0.6, 'condition': 0.1, 'price': 0.15, 'location': 0.15}
+DISTANCE_SCALE_KM = 50.0
+
+_buckets = {}
+
+
+def _bucket(token):
+    # crc32 rather than hash(): stable across processes and runs
+    bucket = _buckets.get(token)
+    if bucket is None:
+        bucket = _buckets[token] = zlib.crc32(token.encode()) % TEXT_DIMENSIONS
+    return bucket
+
+
+def text_vectors(texts):
+    """Row-normalised TF-IDF matrix of hashed tokens, one row per text."""
+    matrix = np.zeros((len(texts), TEXT_DIMENSIONS), dtype=np.float32)
+    for row, text in enumerate(texts):
+        buckets = [_bucket(token) for token in tokenize(text)]
+        if buckets:
+            np.add.at(matrix[row], buckets, 1.0)
+    document_frequency = np.count_nonzero(matrix, axis=0)
+    idf = np.log((1 + len(texts)) / (1 + document_frequency)) + 1
+    matrix = np.log1p(matrix) * idf.astype(np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+class CategoryScorer:
+    """Scores products of one category against each other in batches."""
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.text = text_vectors(frame.text)
+        self.log_price = np.log1p(np.nan_to_num(frame.price)).astype(np.float32)
+        # Unit vectors on the sphere turn all pairwise angles into one matrix
+        # product; products without a location are NaN and end up scoring 0
+        self.position = np.stack([
+            np.cos(frame.lat) * np.cos(frame.lng), np.cos(frame.lat) * np.sin(frame.lng), np.sin(frame.lat)
+        ], axis=1)
+
+    def scores(self, rows):
+        """``len(rows) x len(frame)`` similarity matrix; a product never matches itself."""
+        frame = self.frame
+        scores = WEIGHTS['text'] * (self.text[rows] @ self.text.T)
+        scores += WEIGHTS['condition'] * (frame.condition[rows, None] == frame.condition[None, :])
+        scores += WEIGHTS['price'] * np.exp(-np.abs(self.log_price[rows, None] - self.log_price[None, :]))
+        distance = EARTH_RADIUS_KM * np.arccos(np.clip(self.position[rows] @ self.position.T, -1, 1))
+        scores += WEIGHTS['location'] * np.nan_to_num(np.exp(-distance / DISTANCE_SCALE_KM)).astype(np.float32)
+        scores[np.arange(len(rows)), rows] = -np.inf
+        return scores
+
+    def batches(self, rows):
+        """Yield ``(rows, scores)`` for ``rows`` in chunks of ``BATCH_SIZE``."""
+        rows = np.asarray(rows, dtype=np.int64)
+        for start in range(0, len(rows), BATCH_SIZE):
+            batch = rows[start:start + BATCH_SIZE]
+            yield batch, self.scores(batch)
+
+
+def top_k(scores, k):
+    """Column indices of the ``k`` best scores of every row, best first."""
+    k = min(k, scores.shape[1] - 1)
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, best, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(best, order, axis=1)
+
+
+def _neighbour_rows(frame, rows, scores, k, now):
+    for row, row_scores, best in zip(rows, scores, top_k(scores, k)):
+        for rank, column in enumerate(best, start=1):
+            yield SimilarProduct(
+                product_id=int(frame.ids[row]), similar_id=int(frame.ids[column]),
+                score=float(row_scores[column]), rank=rank, computed_at=now
+            )
+
+
+def refresh_category(category_id, stale_ids=None, k=TOP_K):
+    """
+    Recompute neighbour lists in one category: all of them, or those affected
+    by ``stale_ids``. Returns the number of products whose list was rewritten.
+    """
+    frame = ProductFrame.load(Product.objects.filter(status='active', category_id=category_id).order_by('id'))
+    scorer = CategoryScorer(frame)
+    position = {product_id: row for row, product_id in enumerate(frame.ids.tolist())}
+    now = timezone.now()
+    neighbours = []
+
+    if stale_ids is None:
+        rows = list(range(len(frame)))
+        for batch, scores in scorer.batches(rows):
+            neighbours.extend(_neighbour_rows(frame, batch, scores, k, now))
+    else:
+        stale_rows = [position[product_id] for product_id in stale_ids if product_id in position]
+        current = dict(
+            (product_id, (kth, count)) for product_id, kth, count in
+            SimilarProduct.objects.filter(product_id__in=position)
+            .values('product_id').annotate(kth=Min('score'), count=Count('id'))
+            .values_list('product_id', 'kth', 'count')
+        )
+        kth = np.array([current.get(product_id, (-np.inf, 0))[0] for product_id in frame.ids.tolist()])
+        full = np.array([current.get(product_id, (0, 0))[1] >= min(k, len(frame) - 1) for product_id in frame.ids.tolist()])
+        affected = np.zeros(len(frame), dtype=bool)
+        for batch, scores in scorer.batches(stale_rows):
+            neighbours.extend(_neighbour_rows(frame, batch, scores, k, now))
+            affected |= ((scores > kth[None, :]) | ~full[None, :]).any(axis=0)
+        listing = SimilarProduct.objects.filter(similar_id__in=stale_ids, product_id__in=position).values_list('product_id', flat=True)
+        affected[np.array([position[product_id] for product_id in listing], dtype=np.int64)] = True
+        affected[stale_rows] = False
+        rows = stale_rows + np.flatnonzero(affected).tolist()
+        for batch, scores in scorer.batches(rows[len(stale_rows):]):
+            neighbours.extend(_neighbour_rows(frame, batch, scores, k, now))
+
+    product_ids = [int(frame.ids[row]) for row in rows]
+    with transaction.atomic():
+        if stale_ids is None:
+            SimilarProduct.objects.filter(product__category_id=category_id).delete()
+        else:
+            SimilarProduct.objects.filter(product_id__in=product_ids).delete()
+        SimilarProduct.objects.bulk_create(neighbours, batch_size=2000)
+    return len(product_ids)
+
+
+def stale_product_ids():
+    """Products whose neighbour lists, or whose appearances in other lists, are out of date."""
+    computed = (
+        SimilarProduct.objects.filter(product=OuterRef('pk'))
+        .values('product').annotate(last=Max('computed_at')).values('last')
+    )
+    stale = set(
+        Product.objects.filter(status='active')
+        .annotate(computed=Subquery(computed))
+        .filter(Q(computed__isnull=True) | Q(updated_at__gt=F('computed')))
+        .values_list('id', flat=True)
+    )
+    stale.update(SimilarProduct.objects.exclude(product__status='active').values_list('product_id', flat=True))
+    stale.update(SimilarProduct.objects.exclude(similar__status='active').values_list('similar_id', flat=True))
+    return stale
+
+
+def refresh(full=False, k=TOP_K):
+    """
+    Bring the neighbour table up to date; ``full`` recomputes every category.
+    Returns ``{'categories': ..., 'products': ...}``.
+    """
+    if full:
+        categories = {category_id: None for category_id in Product.objects.filter(status='active').values_list('category_id', flat=True).distinct()}
+        SimilarProduct.objects.exclude(product__category_id__in=categories).delete()
+    else:
+        stale = stale_product_ids()
+        # Inactive products just drop out of the table
+        SimilarProduct.objects.filter(product_id__in=stale).exclude(product__status='active').delete()
+        categories = defaultdict(set)
+        for product_id, category_id in Product.objects.filter(pk__in=stale).values_list('id', 'category_id'):
+            categories[category_id].add(product_id)
+        # Lists in other categories that show a stale product (e.g. one that changed category)
+        for category_id, product_id in SimilarProduct.objects.filter(similar_id__in=stale).values_list('product__category_id', 'similar_id'):
+            categories[category_id].add(product_id)
+
+    products = sum(refresh_category(category_id, stale_ids, k) for category_id, stale_ids in categories.items())
+    if products:
+        caching.bump_version()
+    return {'categories': len(categories), 'products': products}
@@ -0,0 +1,89 @@
+"""
+Streaming serialization for result sets too large to build in memory.
+
+Querysets are walked with ``iterator(chunk_size)`` and serialized one chunk at
+a time, so a response holds at most one chunk of model instances regardless
+of how many rows it covers. The CSV/NDJSON writers go further and take plain
+value tuples (``values_list().iterator()``), skipping model instances
+altogether.
+"""
+import csv
+import io
+import json
+from datetime import date
+from decimal import Decimal
+
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def iter_chunks(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield lists of up to ``chunk_size`` instances from ``queryset``."""
+    chunk = []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(obj)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_json_array(queryset, serializer_class, context=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the JSON array of ``serializer_class`` representations piece by piece."""
+    encoder = JSONEncoder()
+    separator = ''
+    yield '['
+    for chunk in iter_chunks(queryset, chunk_size):
+        data = serializer_class(chunk, many=True, context=context).data
+        yield separator + ','.join(encoder.encode(item) for item in data)
+        separator = ','
+    yield ']'
+
+
+def streaming_json_response(queryset, serializer_class, context=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    return StreamingHttpResponse(
+        iter_json_array(queryset, serializer_class, context, chunk_size),
+        content_type='application/json'
+    )
+
+
+def _plain(value):
+    # Decimals stay exact strings, like the API renders them
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def iter_csv(header, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield CSV text for ``header`` and value tuples ``rows``, ``chunk_size`` rows per piece."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    # Send the header right away so the download starts before the first chunk is read
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(['' if value is None else _plain(value) for value in row])
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_ndjson(header, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield one JSON object per value tuple, keyed by ``header``, ``chunk_size`` lines per piece."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(header, map(_plain, row)))))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
@@ -1,3 +1,1297 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from functools import partial
+from math import asin, cos, radians, sin, sqrt
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+import numpy as np
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, close_old_connections, connection
+from django.db.models import F, Q
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+from rest_framework.exceptions import Throttled, ValidationError
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+
+from . import alert_index, counters, digests, kits, matching, pricing, sales, search, similarity
+from .admin import ProductAdmin
+from .models import (
+    AlertMatch, AlertPosting, Cart, CartItem, Category, IdempotencyKey, Kit, KitReservation, Order, OrderItem, Product,
+    ProductAlert, ProductImage, Project, SellerCategorySales, SellerDailySales, SellerProductSales, SimilarProduct,
+    Wishlist
+)
+from .pagination import CatalogPagination, KeysetPagination
+from .serializers import OrderCreateSerializer
+
+User = get_user_model()
+
+NO_CATALOG_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'catalog': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+
+
+def create_product(seller, category, **kwargs):
+    fields = {
+        'seller': seller,
+        'category': category,
+        'title': 'Rockwool insulation slabs',
+        'description': 'Leftover slabs from a site clearance.',
+        'condition': 'new',
+        'quantity': Decimal('10'),
+        'unit_of_measure': 'sqm',
+        'price': Decimal('12.50'),
+        'location_name': 'Amsterdam',
+    }
+    fields.update(kwargs)
+    return Product.objects.create(**fields)
+
+
+@override_settings(CACHES=NO_CATALOG_CACHE)
+class SearchTests(TestCase):
+    """?q= runs against the full-text index, which follows product writes."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.category = Category.objects.create(name='Timber')
+        self.beams = create_product(self.seller, self.category, title='Oak beams', description='Reclaimed from a barn.')
+        self.planks = create_product(self.seller, self.category, title='Pine planks', description='Offcuts, some oak.')
+        create_product(self.seller, Category.objects.create(name='Insulation'))
+
+    def search(self, query):
+        response = self.client.get(f'/api/v1/products/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [row['title'] for row in response.json()['results']]
+
+    def test_match_and_rank(self):
+        self.assertEqual(self.search('q=oak'), ['Oak beams', 'Pine planks'])
+        self.assertEqual(self.search('q=reclaim'), ['Oak beams'])
+        self.assertEqual(self.search('q=timber+pine'), ['Pine planks'])
+        self.assertEqual(self.search('search=oak&ordering=created_at'), ['Oak beams', 'Pine planks'])
+
+    def test_index_follows_writes(self):
+        self.beams.title = 'Walnut beams'
+        self.beams.save()
+        self.assertEqual(self.search('q=walnut'), ['Walnut beams'])
+        self.planks.delete()
+        self.assertEqual(self.search('q=oak'), [])
+
+    def test_malformed_query(self):
+        self.assertEqual(self.search('q=%22oak%22+OR'), [])
+        self.assertEqual(self.search('q=NEAR(*'), [])
+
+
+@override_settings(CACHES=NO_CATALOG_CACHE)
+class NearbyTests(TestCase):
+    """Radius filtering over the grid cells and ordering by distance."""
+
+    def setUp(self):
+        self.client = APIClient()
+        seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        category = Category.objects.create(name='Insulation')
+        # The origin sits just inside a corner shared by four 0.1 degree cells
+        for title, lat, lng in [
+            ('Across the corner', '52.100500', '5.000500'),
+            ('West cell', '52.099500', '4.990000'),
+            ('North, outside', '52.110000', '4.999500'),
+            ('Box corner, outside', '52.107000', '5.010000'),
+            ('Unlocated', None, None),
+        ]:
+            create_product(seller, category, title=title, location_lat=lat and Decimal(lat), location_long=lng and Decimal(lng))
+
+    def results(self, query):
+        response = self.client.get(f'/api/v1/products/?lat=52.0995&lng=4.9995&{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def titles(self, query):
+        return [row['title'] for row in self.results(query)]
+
+    def test_radius_across_cells(self):
+        self.assertEqual(self.titles('radius_km=1&ordering=distance'), ['Across the corner', 'West cell'])
+        self.assertEqual(self.titles('radius_km=2&ordering=distance'),
+                         ['Across the corner', 'West cell', 'Box corner, outside', 'North, outside'])
+
+    def test_distance_km(self):
+        rows = {row['title']: row['distance_km'] for row in self.results('')}
+        self.assertEqual(len(rows), 5)
+        self.assertAlmostEqual(rows['Across the corner'], 0.13, places=2)
+        self.assertIsNone(rows['Unlocated'])
+        self.assertNotIn('Unlocated', self.titles('ordering=distance'))
+        self.assertEqual(self.titles('ordering=-distance')[0], 'North, outside')
+
+    def test_validation(self):
+        for query in ['lat=91&lng=5', 'lat=52&lng=-181', 'lat=north&lng=5', 'radius_km=5', 'lat=52&radius_km=5']:
+            response = self.client.get(f'/api/v1/products/?{query}')
+            self.assertEqual(response.status_code, 400, query)
+
+
+def legacy_alert_matches(alert):
+    """The per-alert query loop check_matches used before it was vectorized."""
+    query = Q(status='active')
+    if alert.keywords:
+        query &= Q(title__icontains=alert.keywords) | Q(description__icontains=alert.keywords)
+    if alert.category:
+        query &= Q(category=alert.category)
+    if alert.max_price:
+        query &= Q(price__lte=alert.max_price)
+    if alert.condition:
+        query &= Q(condition=alert.condition)
+    products = Product.objects.filter(query)
+    if alert.location_lat and alert.location_long:
+        lat, lng = radians(alert.location_lat), radians(alert.location_long)
+        located = []
+        for product in products.exclude(location_lat=None).exclude(location_long=None):
+            product_lat, product_lng = radians(product.location_lat), radians(product.location_long)
+            a = sin((product_lat - lat) / 2) ** 2 + cos(lat) * cos(product_lat) * sin((product_lng - lng) / 2) ** 2
+            if 2 * 6371 * asin(sqrt(a)) <= alert.radius_km:
+                located.append(product)
+        products = located
+    return {product.id for product in products}
+
+
+class CheckMatchesTests(TestCase):
+    """The vectorized check_matches finds the same alert/product pairs as the old loop."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        timber = Category.objects.create(name='Timber')
+        insulation = Category.objects.create(name='Insulation')
+        for title, category, price, condition, lat, lng in [
+            ('Oak beams', timber, '40', 'new', '52.37', '4.90'),
+            ('Oak flooring', timber, '90', 'slightly_damaged', '51.92', '4.48'),
+            ('Pine planks', timber, '15', 'new', None, None),
+            ('Rockwool slabs', insulation, '12.50', 'new', '52.09', '5.12'),
+            ('Glass wool', insulation, '30', 'cut_undamaged', '52.38', '4.91'),
+        ]:
+            create_product(seller, category, title=title, price=Decimal(price), condition=condition,
+                           location_lat=lat and Decimal(lat), location_long=lng and Decimal(lng))
+        create_product(seller, timber, title='Oak sold out', status='sold')
+        alerts = [
+            {'keywords': 'oak'},
+            {'keywords': 'Slab'},
+            {'category': timber},
+            {'category': insulation, 'condition': 'new'},
+            {'max_price': Decimal('35')},
+            {'keywords': 'oak', 'max_price': Decimal('50')},
+            {'location_lat': Decimal('52.37'), 'location_long': Decimal('4.90'), 'radius_km': 5},
+            {'location_lat': Decimal('52.37'), 'location_long': Decimal('4.90'), 'radius_km': 60, 'category': timber},
+            # No limit, as before vectorization
+            {'keywords': 'pine', 'max_price': Decimal('0')},
+            {'keywords': 'marble'},
+        ]
+        self.alerts = [ProductAlert.objects.create(user=self.buyer, **fields) for fields in alerts]
+
+    def test_same_pairs_as_per_alert_loop(self):
+        self.client.force_authenticate(self.buyer)
+        response = self.client.post('/api/v1/alerts/check_matches/')
+        self.assertEqual(response.status_code, 200)
+        found = {
+            (match['alert_id'], product['id'])
+            for match in response.json()['matches'] for product in match['products']
+        }
+        expected = {(alert.id, product_id) for alert in self.alerts for product_id in legacy_alert_matches(alert)}
+        self.assertEqual(found, expected)
+        self.assertEqual(len({alert_id for alert_id, _product_id in found}), len(self.alerts) - 1)
+
+    def test_product_deleted_while_matching(self):
+        self.client.force_authenticate(self.buyer)
+        load = matching.ProductFrame.load
+
+        def load_then_delete(queryset):
+            frame = load(queryset)
+            Product.objects.filter(title='Oak beams').delete()
+            return frame
+
+        with patch.object(matching.ProductFrame, 'load', side_effect=load_then_delete):
+            response = self.client.post('/api/v1/alerts/check_matches/')
+        self.assertEqual(response.status_code, 200)
+        titles = {product['title'] for match in response.json()['matches'] for product in match['products']}
+        self.assertIn('Oak flooring', titles)
+        self.assertNotIn('Oak beams', titles)
+
+
+class InstantAlertTests(TestCase):
+    """New listings are matched against instant alerts once committed."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.category = Category.objects.create(name='Timber')
+        self.oak = ProductAlert.objects.create(user=self.buyer, keywords='oak')
+        self.cheap = ProductAlert.objects.create(user=self.buyer, category=self.category, max_price=Decimal('20'))
+        self.nearby = ProductAlert.objects.create(
+            user=self.buyer, location_lat=Decimal('52.37'), location_long=Decimal('4.90'), radius_km=10
+        )
+        self.daily = ProductAlert.objects.create(user=self.buyer, keywords='oak', notification_frequency='daily')
+        self.paused = ProductAlert.objects.create(user=self.buyer, keywords='oak', is_active=False)
+
+    def test_records_instant_matches(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = create_product(self.seller, self.category, title='Oak beams', price=Decimal('45'),
+                                     location_lat=Decimal('52.36'), location_long=Decimal('4.91'))
+        self.assertEqual(
+            set(product.alert_matches.values_list('alert_id', flat=True)), {self.oak.id, self.nearby.id}
+        )
+
+        self.client.force_authenticate(self.buyer)
+        response = self.client.get(f'/api/v1/alerts/{self.oak.id}/matches/')
+        self.assertEqual(response.status_code, 200)
+        rows = [(row['product'], row['product_details']['title']) for row in response.json()['results']]
+        self.assertEqual(rows, [(product.id, 'Oak beams')])
+        self.assertEqual(self.client.get(f'/api/v1/alerts/{self.cheap.id}/matches/').json()['count'], 0)
+
+    def test_zero_max_price_is_no_limit(self):
+        unlimited = ProductAlert.objects.create(user=self.buyer, max_price=Decimal('0'))
+        product = create_product(self.seller, self.category, title='Pine planks', price=Decimal('45'))
+        self.assertIn(unlimited.id, {alert.id for alert in alert_index.record_matches(product)})
+
+    def test_postings_follow_alert_writes(self):
+        self.oak.keywords = 'walnut'
+        self.oak.save()
+        self.nearby.is_active = False
+        self.nearby.save()
+        self.cheap.delete()
+        self.daily.notification_frequency = 'instant'
+        self.daily.save()
+        product = create_product(self.seller, self.category, title='Oak beams', price=Decimal('15'),
+                                 location_lat=Decimal('52.36'), location_long=Decimal('4.91'))
+        self.assertEqual([alert.id for alert in alert_index.record_matches(product)], [self.daily.id])
+        self.assertFalse(AlertPosting.objects.filter(alert__in=[self.nearby, self.paused]).exists())
+
+    def test_cost_follows_relevant_alerts(self):
+        product = create_product(self.seller, self.category, title='Oak beams', price=Decimal('45'))
+        for index in range(50):
+            ProductAlert.objects.create(user=self.buyer, keywords=f'marble {index}')
+        # Posting lookup, candidate alerts, match insert
+        with self.assertNumQueries(3):
+            hits = alert_index.record_matches(product)
+        self.assertEqual({alert.id for alert in hits}, {self.oak.id})
+
+
+class DigestTests(TestCase):
+    """run_digests records matches for due digest alerts, once, and resumes from its checkpoint."""
+
+    def setUp(self):
+        buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        category = Category.objects.create(name='Timber')
+        self.oak = ProductAlert.objects.create(user=buyer, keywords='oak', notification_frequency='daily')
+        self.pine = ProductAlert.objects.create(user=buyer, keywords='pine', notification_frequency='weekly')
+        ProductAlert.objects.create(user=buyer, keywords='oak')
+        self.beams = create_product(seller, category, title='Oak beams')
+        self.planks = create_product(seller, category, title='Pine planks')
+
+    def matched(self):
+        return set(AlertMatch.objects.values_list('alert_id', 'product_id'))
+
+    def test_records_matches_once(self):
+        self.assertEqual(digests.run_digests(['daily', 'weekly'], chunk_size=1), {'alerts': 2, 'matches': 2})
+        expected = {(self.oak.id, self.beams.id), (self.pine.id, self.planks.id)}
+        self.assertEqual(self.matched(), expected)
+        self.assertEqual(digests.run_digests(['daily', 'weekly']), {'alerts': 0, 'matches': 0})
+
+        ProductAlert.objects.update(last_notified_at=None)
+        digests.run_digests(['daily', 'weekly'])
+        self.assertEqual(AlertMatch.objects.count(), 2)
+
+    def test_resumes_from_checkpoint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/digests.json'
+            digests.Checkpoint(path).save({
+                'run_started': timezone.now().isoformat(), 'frequencies': ['daily', 'weekly'], 'after_id': self.oak.id
+            })
+            self.assertEqual(digests.run_digests(['daily'], checkpoint_path=path), {'alerts': 1, 'matches': 1})
+            self.assertFalse(os.path.exists(path))
+        self.assertEqual(self.matched(), {(self.pine.id, self.planks.id)})
+
+
+@override_settings(CACHES=NO_CATALOG_CACHE)
+@patch.object(CatalogPagination, 'page_size', 3)
+class KeysetPaginationTests(TestCase):
+    """?pagination=cursor walks a list exactly once in either direction."""
+
+    def setUp(self):
+        self.client = APIClient()
+        seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        category = Category.objects.create(name='Timber')
+        for index in range(7):
+            located = index % 3 != 0
+            create_product(
+                seller, category, title=f'Plank {index}', price=Decimal(10 + index % 2),
+                market_price=Decimal(20 + index) if index % 2 else None,
+                location_lat=Decimal(f'52.{index}') if located else None,
+                location_long=Decimal('4.9') if located else None,
+            )
+
+    def walk(self, url, link='next'):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([row['title'] for row in response.json()['results']])
+            url = response.json()[link]
+        return pages
+
+    def test_round_trip(self):
+        forward = self.walk('/api/v1/products/?pagination=cursor&ordering=-price')
+        self.assertEqual([len(page) for page in forward], [3, 3, 1])
+        titles = [title for page in forward for title in page]
+        self.assertEqual(titles, list(Product.objects.order_by('-price', '-id').values_list('title', flat=True)))
+
+        last = self.client.get('/api/v1/products/?pagination=cursor&ordering=-price')
+        for _page in forward[1:]:
+            last = self.client.get(last.json()['next'])
+        backward = self.walk(last.json()['previous'], link='previous')
+        self.assertEqual(backward, forward[-2::-1])
+
+    def test_distance_ordering_reaches_the_end(self):
+        pages = self.walk('/api/v1/products/?lat=52&lng=4.9&ordering=distance&pagination=cursor')
+        titles = [title for page in pages for title in page]
+        self.assertEqual(titles, ['Plank 1', 'Plank 2', 'Plank 4', 'Plank 5'])
+
+    def test_nullable_ordering(self):
+        paginator = KeysetPagination()
+        paginator.page_size = 3
+        for ordering in ['market_price', '-market_price']:
+            queryset = Product.objects.order_by(ordering)
+            seen, params = [], {}
+            while True:
+                page = paginator.paginate_queryset(queryset, Request(RequestFactory().get('/', params)))
+                seen += [product.id for product in page]
+                link = paginator.get_next_link()
+                if link is None:
+                    break
+                params = {'cursor': parse_qs(urlsplit(link).query)['cursor'][0]}
+            self.assertEqual(sorted(seen), sorted(Product.objects.values_list('id', flat=True)), ordering)
+
+    def test_search_rank_ordering(self):
+        for product in Product.objects.filter(title__in=['Plank 2', 'Plank 5']):
+            product.description = 'Plank offcuts, planks of every length.'
+            product.save()
+        pages = self.walk('/api/v1/products/?q=plank&pagination=cursor')
+        expected = search.search_products(Product.objects.all(), 'plank').order_by('-search_rank', '-created_at', '-id')
+        self.assertEqual([title for page in pages for title in page], [product.title for product in expected])
+        self.assertEqual(pages[0][:2], ['Plank 5', 'Plank 2'])
+
+    def test_bad_cursor(self):
+        self.assertEqual(self.client.get('/api/v1/products/?cursor=not-a-cursor').status_code, 404)
+
+
+class PrimaryImageTests(TestCase):
+    """Product.primary_image tracks ProductImage writes."""
+
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.product = create_product(self.seller, Category.objects.create(name='Insulation'))
+
+    def primary_image_id(self):
+        self.product.refresh_from_db()
+        return self.product.primary_image_id
+
+    def test_flagged_image_wins_over_order(self):
+        first = ProductImage.objects.create(product=self.product, image='products/a.jpg', order=0)
+        self.assertEqual(self.primary_image_id(), first.id)
+        flagged = ProductImage.objects.create(product=self.product, image='products/b.jpg', order=1, is_primary=True)
+        self.assertEqual(self.primary_image_id(), flagged.id)
+        flagged.delete()
+        self.assertEqual(self.primary_image_id(), first.id)
+        first.delete()
+        self.assertIsNone(self.primary_image_id())
+
+
+@override_settings(CACHES=NO_CATALOG_CACHE)
+class BufferedCounterTests(TestCase):
+    """View and save counts are buffered, read back with pending deltas and flushed in batches."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        self.product = create_product(self.user, Category.objects.create(name='Insulation'))
+        Product.objects.filter(pk=self.product.pk).update(views=5)
+        self.buffer = counters.CounterBuffer(interval=60, background=False)
+        patcher = patch.object(counters, 'buffer', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def stored(self):
+        return Product.objects.values_list('views', 'saves').get(pk=self.product.pk)
+
+    def test_views(self):
+        url = f'/api/v1/products/{self.product.id}/increment_views/'
+        self.client.force_authenticate(self.user)
+        self.assertEqual([self.client.post(url).json()['views'] for _ in range(2)], [6, 7])
+        self.assertEqual(self.client.get(f'/api/v1/products/{self.product.id}/').json()['views'], 7)
+        self.assertEqual(self.stored(), (5, 0))
+        self.assertEqual(self.client.post('/api/v1/products/0/increment_views/').status_code, 404)
+
+        self.assertEqual(counters.flush(), 1)
+        self.assertEqual(self.stored(), (7, 0))
+        self.assertEqual(counters.pending(Product, self.product.pk, 'views'), 0)
+        self.assertIsNone(self.buffer.thread)
+
+    def test_wishlist_saves(self):
+        self.client.force_authenticate(self.user)
+        self.client.post('/api/v1/wishlist/toggle/', {'product_id': self.product.id}, format='json')
+        self.assertEqual(counters.pending(Product, self.product.pk, 'saves'), 1)
+        counters.flush()
+        self.assertEqual(self.stored(), (5, 1))
+        self.client.post('/api/v1/wishlist/toggle/', {'product_id': self.product.id}, format='json')
+        counters.flush()
+        self.assertEqual(self.stored(), (5, 0))
+
+
+@override_settings(CACHES=NO_CATALOG_CACHE)
+class ListQueryCountTests(TestCase):
+    """List endpoints must issue a constant number of queries, whatever the page holds."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        self.category = Category.objects.create(name='Insulation')
+        self.cart = Cart.objects.create(user=self.user)
+
+    def add_products(self, count):
+        for index in range(count):
+            product = create_product(self.user, self.category, title=f'Slab {index}')
+            ProductImage.objects.create(product=product, image=f'products/{index}.jpg', is_primary=True)
+            CartItem.objects.create(cart=self.cart, product=product)
+            Wishlist.objects.create(user=self.user, product=product)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assert_constant_queries(self, url):
+        self.add_products(2)
+        small = self.count_queries(url)
+        self.add_products(10)
+        self.assertEqual(self.count_queries(url), small)
+
+    def test_product_list(self):
+        self.assert_constant_queries('/api/v1/products/')
+
+    def test_product_list_images(self):
+        self.add_products(1)
+        response = self.client.get('/api/v1/products/')
+        self.assertTrue(response.json()['results'][0]['primary_image'].endswith('products/0.jpg'))
+
+    def test_cart(self):
+        self.client.force_authenticate(self.user)
+        self.assert_constant_queries('/api/v1/cart/')
+
+    def test_wishlist(self):
+        self.client.force_authenticate(self.user)
+        self.assert_constant_queries('/api/v1/wishlist/')
+
+
+class CatalogCacheTests(TestCase):
+    """Anonymous catalog reads are cached until a catalog write commits."""
+
+    def setUp(self):
+        caches['catalog'].clear()
+        self.client = APIClient()
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.category = Category.objects.create(name='Insulation')
+
+    def test_hit_until_write(self):
+        create_product(self.seller, self.category)
+        self.assertEqual(self.client.get('/api/v1/products/?b=1&a=2')['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/v1/products/?a=2&b=1')
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_product(self.seller, self.category, title='Oak planks')
+        response = self.client.get('/api/v1/products/?a=2&b=1')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['count'], 2)
+
+    def test_admin_status_actions_invalidate(self):
+        product = create_product(self.seller, self.category)
+        self.assertEqual(self.client.get('/api/v1/products/')['X-Cache'], 'MISS')
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductAdmin(Product, admin.site).mark_as_sold(None, Product.objects.filter(pk=product.pk))
+        response = self.client.get('/api/v1/products/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['count'], 0)
+
+    def test_authenticated_requests_bypass_cache(self):
+        self.client.force_authenticate(self.seller)
+        self.assertNotIn('X-Cache', self.client.get('/api/v1/products/'))
+
+
+def create_kit(**kwargs):
+    now = timezone.now()
+    fields = {
+        'kit_type': 'herringbone_deck',
+        'title': 'Herringbone Deck Pack',
+        'description': 'Reclaimed oak offcuts for a 6 sqm deck.',
+        'start_date': now - timedelta(minutes=1),
+        'end_date': now + timedelta(days=1),
+        'quantity_available': 5,
+        'price': Decimal('199.00'),
+        'location_name': 'Amsterdam',
+        'status': 'active',
+    }
+    fields.update(kwargs)
+    return Kit.objects.create(**fields)
+
+
+@override_settings(CACHES=NO_CATALOG_CACHE)
+class ConditionalGetTests(TestCase):
+    """Product and kit reads carry validators and answer 304 while they still match."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.product = create_product(self.seller, Category.objects.create(name='Insulation'))
+
+    def test_detail_etag(self):
+        url = f'/api/v1/products/{self.product.id}/'
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        ProductImage.objects.create(product=self.product, image='products/a.jpg')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_etag_tracks_filtered_set(self):
+        url = '/api/v1/products/?condition=new'
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertNotIn('Last-Modified', response)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        create_product(self.seller, self.product.category, condition='slightly_damaged')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        planks = create_product(self.seller, self.product.category, title='Oak planks')
+        etag = self.client.get(url)['ETag']
+        self.assertNotEqual(etag, response['ETag'])
+        # Filtering out the newest row leaves max(updated_at) where it was
+        Product.objects.filter(pk=planks.pk).update(condition='slightly_damaged')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_missing_product(self):
+        self.assertEqual(self.client.get('/api/v1/products/0/').status_code, 404)
+
+    def test_counters_and_sale_window(self):
+        kit = create_kit(start_date=timezone.now() + timedelta(hours=1))
+        # Only the detail view carries Last-Modified
+        started = http_date(kit.start_date.timestamp())
+        for url, last_modified in [(f'/api/v1/kits/{kit.id}/', started), ('/api/v1/kits/', None)]:
+            etag = self.client.get(url)['ETag']
+            Kit.objects.filter(pk=kit.pk).update(views=F('views') + 1)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+            etag = self.client.get(url)['ETag']
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            with patch('django.utils.timezone.now', return_value=kit.start_date + timedelta(seconds=1)):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.get('Last-Modified'), last_modified)
+
+
+@override_settings(CACHES=NO_CATALOG_CACHE)
+class ByCategoryTests(TestCase):
+    """by_category pages or streams the lightweight list representation."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.category = Category.objects.create(name='Insulation')
+        for index in range(3):
+            create_product(self.seller, self.category, title=f'Slab {index}')
+        create_product(self.seller, Category.objects.create(name='Timber'))
+
+    def test_paginated(self):
+        response = self.client.get(f'/api/v1/products/by_category/?category_id={self.category.id}')
+        self.assertEqual(response.json()['count'], 3)
+        self.assertNotIn('images', response.json()['results'][0])
+
+    def test_streamed(self):
+        response = self.client.get(f'/api/v1/products/by_category/?category_id={self.category.id}&stream=true')
+        self.assertTrue(response.streaming)
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([row['title'] for row in rows], ['Slab 2', 'Slab 1', 'Slab 0'])
+
+
+class FacetTests(TestCase):
+    """/products/facets/ counts the filtered catalog in one query."""
+
+    def setUp(self):
+        caches['catalog'].clear()
+        self.client = APIClient()
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        insulation = Category.objects.create(name='Insulation')
+        timber = Category.objects.create(name='Timber')
+        create_product(self.seller, insulation, price=Decimal('5'), location_lat=Decimal('52.37'), location_long=Decimal('4.90'))
+        create_product(self.seller, insulation, condition='cut_undamaged', price=Decimal('75'))
+        create_product(self.seller, timber, title='Oak planks', unit_of_measure='linear_meter', price=Decimal('2000'))
+        create_product(self.seller, timber, title='Sold planks', status='sold')
+
+    def test_counts(self):
+        with self.assertNumQueries(1):
+            facets = self.client.get('/api/v1/products/facets/').json()
+        self.assertEqual(facets['count'], 3)
+        self.assertEqual([(row['name'], row['count']) for row in facets['category']], [('Insulation', 2), ('Timber', 1)])
+        self.assertEqual({row['value']: row['count'] for row in facets['condition']}, {'new': 2, 'cut_undamaged': 1})
+        self.assertEqual({row['value']: row['count'] for row in facets['unit_of_measure']}, {'sqm': 2, 'linear_meter': 1})
+        self.assertEqual([(row['min'], row['max']) for row in facets['price']], [('0', '10'), ('50', '100'), ('1000', None)])
+
+        with self.assertNumQueries(0):
+            self.client.get('/api/v1/products/facets/')
+
+    def test_follows_filters(self):
+        self.assertEqual(self.client.get('/api/v1/products/facets/?condition=new').json()['count'], 2)
+        self.assertEqual(self.client.get('/api/v1/products/facets/?q=oak').json()['count'], 1)
+        nearby = self.client.get('/api/v1/products/facets/?lat=52.37&lng=4.90&radius_km=5').json()
+        self.assertEqual(nearby['count'], 1)
+
+
+class BulkImportTests(TestCase):
+    """POST /products/import/ creates valid rows in bulk and reports the rest."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.client.force_authenticate(self.seller)
+        self.category = Category.objects.create(name='Insulation')
+
+    def upload(self, name, content):
+        return self.client.post('/api/v1/products/import/', {'file': SimpleUploadedFile(name, content.encode())})
+
+    def test_csv(self):
+        response = self.upload('site.csv', (
+            'title,description,category,condition,quantity,unit_of_measure,price,location_name,location_lat,location_long\n'
+            'Rockwool slabs,Leftovers,insulation,new,10,sqm,12.50,Amsterdam,52.37,4.90\n'
+            'Glass wool,Leftovers,Insulation,new,5,sqm,,Utrecht,,\n'
+            'Oak planks,Offcuts,Timber,new,3,linear_meter,4,Utrecht,,\n'
+        ))
+        self.assertEqual(response.status_code, 201)
+        report = response.json()
+        self.assertEqual((report['created'], report['failed']), (1, 2))
+        self.assertEqual([(error['row'], list(error['errors'])) for error in report['errors']], [(2, ['price']), (3, ['category'])])
+
+        product = Product.objects.get(title='Rockwool slabs')
+        self.assertEqual((product.seller, product.category), (self.seller, self.category))
+        self.assertIsNotNone(product.geo_cell)
+        self.assertEqual(self.client.get('/api/v1/products/?q=rockwool').json()['count'], 1)
+
+    def test_ndjson(self):
+        row = {
+            'title': 'Rockwool slabs', 'description': 'Leftovers', 'category': self.category.id,
+            'condition': 'new', 'quantity': '10', 'unit_of_measure': 'sqm', 'price': '12.50', 'location_name': 'Amsterdam'
+        }
+        response = self.upload('site.ndjson', json.dumps(row) + '\n\nnot json\n')
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual(response.json()['errors'][0]['row'], 2)
+
+
+class ExportTests(TestCase):
+    """Exports stream the caller's own rows."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        category = Category.objects.create(name='Insulation')
+        self.product = create_product(self.seller, category, status='sold')
+        create_product(self.buyer, category, title='Not mine')
+        order = Order.objects.create(
+            buyer=self.buyer, seller=self.seller, total_amount=Decimal('25.00'),
+            tax_amount=Decimal('5.25'), delivery_method='pickup'
+        )
+        OrderItem.objects.create(order=order, product=self.product, quantity=Decimal('2'), price_at_purchase=Decimal('12.50'))
+
+    def read(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_product_csv(self):
+        self.client.force_authenticate(self.seller)
+        rows = list(csv.DictReader(io.StringIO(self.read('/api/v1/products/export/'))))
+        self.assertEqual([(row['title'], row['category'], row['price'], row['market_price']) for row in rows],
+                         [('Rockwool insulation slabs', 'Insulation', '12.50', '')])
+
+    def test_order_items_ndjson(self):
+        self.client.force_authenticate(self.buyer)
+        lines = self.read('/api/v1/orders/export_items/?output=ndjson').splitlines()
+        self.assertEqual(len(lines), 1)
+        item = json.loads(lines[0])
+        self.assertEqual((item['seller'], item['product_title'], item['quantity']), ('seller', self.product.title, '2.00'))
+        self.assertEqual(self.client.get('/api/v1/orders/export/?output=xml').status_code, 400)
+
+
+@override_settings(IMAGE_PROCESSING_WORKERS=0, CACHES=NO_CATALOG_CACHE)
+class ImageVariantTests(TestCase):
+    """Uploads get WebP variants after commit, and lists serve the thumbnail."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.product = create_product(seller, Category.objects.create(name='Insulation'))
+
+    def upload(self, name='photo.jpg', size=(2000, 1500)):
+        content = io.BytesIO()
+        Image.new('RGB', size, 'orange').save(content, 'JPEG')
+        return SimpleUploadedFile(name, content.getvalue(), content_type='image/jpeg')
+
+    def test_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(product=self.product, image=self.upload())
+        image.refresh_from_db()
+        with Image.open(image.thumbnail.path) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size), ('WEBP', (320, 240)))
+        with Image.open(image.medium.path) as medium:
+            self.assertEqual(medium.size, (1024, 768))
+
+        listed = APIClient().get('/api/v1/products/').json()['results'][0]['primary_image']
+        self.assertEqual(listed, image.thumbnail.url)
+
+        # A replaced upload gets fresh variants
+        with self.captureOnCommitCallbacks(execute=True):
+            image.image = self.upload('other.png', (100, 100))
+            image.save()
+        image.refresh_from_db()
+        self.assertIn('other_png-thumbnail', image.thumbnail.name)
+
+    def test_original_until_rendered(self):
+        image = ProductImage.objects.create(product=self.product, image=self.upload())
+        listed = APIClient().get('/api/v1/products/').json()['results'][0]['primary_image']
+        self.assertEqual(listed, image.image.url)
+
+
+@override_settings(CACHES=NO_CATALOG_CACHE)
+class SimilarProductTests(TestCase):
+    """Neighbour lists are precomputed per category and refreshed incrementally."""
+
+    def setUp(self):
+        seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.category = Category.objects.create(name='Insulation')
+        make = partial(create_product, seller, self.category)
+        self.rockwool = make(title='Rockwool slabs 100mm', description='Stone wool insulation slabs')
+        self.rockwool_offcuts = make(title='Rockwool slabs offcuts', description='Stone wool insulation')
+        self.glass_wool = make(title='Glass wool roll', description='Loft roll', condition='opened_unused', price=Decimal('90'))
+        self.other = create_product(seller, Category.objects.create(name='Timber'), title='Rockwool slabs 100mm')
+
+    def similar_titles(self, product):
+        response = APIClient().get(f'/api/v1/products/{product.id}/similar/')
+        return [row['title'] for row in response.json()]
+
+    def test_refresh(self):
+        self.assertEqual(similarity.refresh(), {'categories': 2, 'products': 4})
+        self.assertEqual(self.similar_titles(self.rockwool), ['Rockwool slabs offcuts', 'Glass wool roll'])
+        self.assertEqual(self.similar_titles(self.other), [])
+        self.assertEqual(similarity.refresh()['products'], 1)  # only the lone Timber product
+
+        # A new close match displaces the old ranking without a full rebuild
+        new = create_product(self.rockwool.seller, self.category, title='Rockwool slabs 100mm', description='Stone wool insulation slabs')
+        similarity.refresh()
+        self.assertEqual(self.similar_titles(self.rockwool)[0], new.title)
+
+        new.status = 'sold'
+        new.save()
+        similarity.refresh()
+        self.assertEqual(self.similar_titles(self.rockwool), ['Rockwool slabs offcuts', 'Glass wool roll'])
+        self.assertFalse(SimilarProduct.objects.filter(product=new).exists())
+
+
+class MarketPriceTests(TestCase):
+    """Market prices are estimated per category, condition and unit."""
+
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.category = Category.objects.create(name='Insulation')
+
+    def make(self, price, **kwargs):
+        return create_product(self.seller, self.category, price=Decimal(price), **kwargs)
+
+    def test_refresh(self):
+        products = [self.make(price) for price in ('10', '20', '30', '40')]
+        # Too few observations of its own: falls back to the sqm median of the category
+        damaged = self.make('5', condition='slightly_damaged')
+        manual = self.make('50', market_price=Decimal('99'))
+        tons = self.make('100', unit_of_measure='ton')
+
+        self.assertEqual(pricing.refresh_market_prices(), 5)
+        products[0].refresh_from_db()
+        self.assertEqual((products[0].market_price, products[0].market_price_estimated), (Decimal('30.00'), True))
+        self.assertEqual(products[0].savings_percentage, 67)
+        damaged.refresh_from_db()
+        self.assertEqual(damaged.market_price, Decimal('25.00'))
+        manual.refresh_from_db()
+        self.assertEqual(manual.market_price, Decimal('99'))
+        tons.refresh_from_db()
+        self.assertIsNone(tons.market_price)
+
+        # Nothing changed, nothing written
+        self.assertEqual(pricing.refresh_market_prices(), 0)
+
+    def test_price_list_skips_non_finite_prices(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as stream:
+            stream.write('category,condition,unit_of_measure,price\n')
+            for price in ('NaN', 'sNaN', 'Infinity', '-5', 'cheap', '20', '40'):
+                stream.write(f'insulation,new,sqm,{price}\n')
+        self.addCleanup(os.remove, stream.name)
+        estimates = pricing.estimate_prices([pricing.PriceListSource(stream.name)], quantile=0.5, min_observations=1)
+        self.assertEqual(estimates[(self.category.id, 'new', 'sqm')], Decimal('30.00'))
+
+    def test_group_quantiles(self):
+        keys, estimates, counts = pricing.group_quantiles(
+            np.array([2, 1, 2, 1, 1]), np.array([8.0, 3.0, 4.0, 1.0, 2.0]), 0.5
+        )
+        self.assertEqual((keys.tolist(), estimates.tolist(), counts.tolist()), ([1, 2], [2.0, 6.0], [3, 2]))
+
+
+@override_settings(CACHES=NO_CATALOG_CACHE)
+class SavingsTests(TestCase):
+    """savings_percentage is a database column usable for filtering and ordering."""
+
+    def setUp(self):
+        self.client = APIClient()
+        seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        category = Category.objects.create(name='Insulation')
+        for title, market_price in [('Half off', '25'), ('Two thirds off', '37.50'), ('No reference', None), ('Small', '13')]:
+            create_product(seller, category, title=title, market_price=market_price and Decimal(market_price))
+
+    def titles(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [(row['title'], row['savings_percentage']) for row in response.json()['results']]
+
+    def test_filter_and_order(self):
+        self.assertEqual(self.titles('/api/v1/products/?min_savings=10&ordering=-savings_percentage'),
+                         [('Two thirds off', 67), ('Half off', 50)])
+        self.assertEqual(self.titles('/api/v1/products/?ordering=-savings_percentage&pagination=cursor&page_size=2')[:1],
+                         [('Two thirds off', 67)])
+        self.assertEqual(self.client.get('/api/v1/products/?min_savings=lots').status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/kits/?min_savings=10').status_code, 200)
+
+    def test_update_response_is_current(self):
+        product = Product.objects.get(title='Half off')
+        self.client.force_authenticate(product.seller)
+        response = self.client.patch(f'/api/v1/products/{product.id}/', {'market_price': '50'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['savings_percentage'], 75)
+        product.price = Decimal('50')
+        product.save(update_fields=['price'])
+        self.assertEqual(product.savings_percentage, 0)
+
+    def test_halves_round_away_from_zero(self):
+        product = Product.objects.get(title='Half off')
+        # Python's round() would give 0 and 2 (half to even)
+        for price, market_price, savings in [('199', '200', 1), ('39', '40', 3)]:
+            product.price, product.market_price = Decimal(price), Decimal(market_price)
+            product.save()
+            self.assertEqual(product.savings_percentage, savings)
+
+
+class OrderCreateTests(TestCase):
+    """Orders are written set-based, atomically and never oversell stock."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        self.client.force_authenticate(self.buyer)
+        category = Category.objects.create(name='Insulation')
+        self.products = [create_product(self.seller, category, title=f'Pallet {index}', quantity=Decimal('5')) for index in range(10)]
+
+    def order(self, lines):
+        return self.client.post('/api/v1/orders/', {
+            'seller': self.seller.id, 'delivery_method': 'pickup',
+            'items': [{'product_id': product.id, 'quantity': quantity} for product, quantity in lines],
+        }, format='json')
+
+    def test_constant_queries(self):
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.order([(self.products[0], 1)]).status_code, 201)
+        with CaptureQueriesContext(connection) as large:
+            response = self.order([(product, 2) for product in self.products])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+        self.assertEqual(len(response.json()['items']), 10)
+        self.assertEqual(response.json()['total_amount'], '250.00')
+
+    def test_stock(self):
+        self.assertEqual(self.order([(self.products[0], 3), (self.products[0], 2), (self.products[1], 1)]).status_code, 201)
+        self.products[0].refresh_from_db()
+        self.assertEqual((self.products[0].quantity, self.products[0].status), (Decimal('0'), 'sold'))
+
+        response = self.order([(self.products[1], 1), (self.products[2], 6)])
+        self.assertEqual(response.status_code, 400)
+        self.products[1].refresh_from_db()
+        self.assertEqual(self.products[1].quantity, Decimal('4'))
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_sold_out_during_checkout(self):
+        serializer = OrderCreateSerializer(data={
+            'seller': self.seller.id, 'delivery_method': 'pickup',
+            'items': [{'product_id': self.products[0].id, 'quantity': 4}, {'product_id': self.products[1].id, 'quantity': 1}],
+        }, context={'request': RequestFactory().post('/')})
+        serializer.context['request'].user = self.buyer
+        self.assertTrue(serializer.is_valid())
+        # Another buyer takes most of the pallet after validation
+        Product.objects.filter(pk=self.products[0].pk).update(quantity=Decimal('3'))
+        with self.assertRaises(ValidationError):
+            serializer.save()
+        self.assertFalse(Order.objects.exists())
+        self.products[1].refresh_from_db()
+        self.assertEqual(self.products[1].quantity, Decimal('5'))
+
+
+class CheckoutTests(TestCase):
+    """A cart spanning several sellers is checked out in one request."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        self.client.force_authenticate(self.buyer)
+        category = Category.objects.create(name='Timber')
+        self.sellers = [User.objects.create_user(f'seller{index}', f'seller{index}@example.com', 'pw') for index in range(3)]
+        self.products = [create_product(seller, category, quantity=Decimal('4')) for seller in self.sellers]
+        self.cart = Cart.objects.create(user=self.buyer)
+        for product in self.products:
+            CartItem.objects.create(cart=self.cart, product=product, quantity=Decimal('2'))
+
+    def test_one_order_per_seller(self):
+        response = self.client.post('/api/v1/cart/checkout/', {'delivery_method': 'carrier'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([order['seller'] for order in response.json()], [seller.id for seller in self.sellers])
+        self.assertEqual([order['total_amount'] for order in response.json()], ['25.00'] * 3)
+        self.assertFalse(self.cart.items.exists())
+        self.assertEqual(set(Product.objects.values_list('quantity', flat=True)), {Decimal('2')})
+
+    def test_out_of_stock_line_fails_everything(self):
+        Product.objects.filter(pk=self.products[2].pk).update(quantity=Decimal('1'))
+        response = self.client.post('/api/v1/cart/checkout/', {'delivery_method': 'carrier'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.cart.items.count(), 3)
+
+    def test_single_order_keeps_other_lines(self):
+        response = self.client.post('/api/v1/orders/', {
+            'seller': self.sellers[0].id, 'delivery_method': 'pickup',
+            'items': [{'product_id': self.products[0].id, 'quantity': 2}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            set(self.cart.items.values_list('product_id', flat=True)), {self.products[1].id, self.products[2].id}
+        )
+
+
+@override_settings(CACHES=NO_CATALOG_CACHE)
+class KitPurchaseTests(TestCase):
+    """Kit stock is held by reservations, sold by purchases and returned on release or expiry."""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client = APIClient()
+        self.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        self.client.force_authenticate(self.buyer)
+        self.kit = create_kit(quantity_available=3)
+
+    def post(self, action, data):
+        return self.client.post(f'/api/v1/kits/{self.kit.id}/{action}/', data, format='json')
+
+    def test_reserve_purchase_release(self):
+        first = self.post('reserve', {'quantity': 2})
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(self.post('reserve', {'quantity': 2}).status_code, 409)
+        second = self.post('reserve', {'quantity': 1})
+        self.kit.refresh_from_db()
+        self.assertEqual((self.kit.quantity_available, self.kit.status), (0, 'sold_out'))
+
+        self.assertEqual(self.post('purchase', {'reservation': first.json()['id']}).json()['status'], 'purchased')
+        self.assertEqual(self.post('purchase', {'reservation': first.json()['id']}).status_code, 409)
+        self.assertEqual(self.post('release', {'reservation': second.json()['id']}).json()['status'], 'released')
+        self.kit.refresh_from_db()
+        self.assertEqual((self.kit.quantity_available, self.kit.quantity_sold, self.kit.status), (1, 2, 'active'))
+
+    def test_expired_holds_return_to_stock(self):
+        held = self.post('reserve', {'quantity': 3}).json()
+        KitReservation.objects.filter(pk=held['id']).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.post('purchase', {'reservation': held['id']}).status_code, 409)
+        # The sold-out marker is bypassed once it lapses; the claim then sweeps the expired hold
+        caches['default'].clear()
+        self.assertEqual(self.post('reserve', {'quantity': 3}).status_code, 201)
+        self.assertEqual(KitReservation.objects.get(pk=held['id']).status, 'expired')
+
+    def test_release_after_sale_ends(self):
+        held = self.post('reserve', {'quantity': 3}).json()
+        Kit.objects.filter(pk=self.kit.pk).update(end_date=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.post('release', {'reservation': held['id']}).json()['status'], 'released')
+        self.kit.refresh_from_db()
+        self.assertEqual((self.kit.quantity_available, self.kit.status), (3, 'sold_out'))
+
+    def test_not_on_sale(self):
+        upcoming = create_kit(start_date=timezone.now() + timedelta(hours=1), status='upcoming')
+        self.assertEqual(self.client.post(f'/api/v1/kits/{upcoming.id}/reserve/', {}, format='json').status_code, 409)
+        self.assertEqual(self.client.post('/api/v1/kits/0/reserve/', {}, format='json').status_code, 404)
+        self.assertEqual(self.post('reserve', {'quantity': 0}).status_code, 400)
+
+    @override_settings(KIT_ADMISSION_LIMIT=1)
+    def test_admission_gate(self):
+        with kits.AdmissionGate(self.kit.id):
+            response = self.post('reserve', {'quantity': 1})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(self.post('reserve', {'quantity': 1}).status_code, 201)
+
+
+@override_settings(CACHES=NO_CATALOG_CACHE, KIT_ADMISSION_LIMIT=8)
+class KitFlashSaleLoadTests(TransactionTestCase):
+    """A rush of concurrent buyers gets exactly the units the kit had, never more."""
+
+    BUYERS = 200
+    UNITS = 50
+
+    def test_no_oversell(self):
+        caches['default'].clear()
+        kit = create_kit(quantity_available=self.UNITS)
+        buyers = User.objects.bulk_create([User(username=f'buyer{index}') for index in range(self.BUYERS)])
+        start = threading.Barrier(self.BUYERS)
+        outcomes = []
+
+        def rush(buyer):
+            start.wait()
+            try:
+                # Retry like a client honouring Retry-After, until served or sold out
+                while True:
+                    try:
+                        kits.claim(kit.id, buyer, 1)
+                        outcomes.append('held')
+                        return
+                    except kits.KitUnavailable:
+                        outcomes.append('sold out')
+                        return
+                    except (Throttled, OperationalError):
+                        # SQLite's shared in-memory test database rejects concurrent writers outright
+                        time.sleep(0.005)
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=rush, args=(buyer,)) for buyer in buyers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        kit.refresh_from_db()
+        self.assertEqual(outcomes.count('held'), self.UNITS)
+        self.assertEqual(outcomes.count('sold out'), self.BUYERS - self.UNITS)
+        self.assertEqual(KitReservation.objects.filter(kit=kit, status='held').count(), self.UNITS)
+        self.assertEqual((kit.quantity_available, kit.status), (0, 'sold_out'))
+
+
+class IdempotencyTests(TestCase):
+    """Retries carrying the same Idempotency-Key replay the first response instead of running again."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        self.client.force_authenticate(self.buyer)
+        self.product = create_product(self.seller, Category.objects.create(name='Bricks'))
+
+    def post(self, url, data, key):
+        return self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_order_retry(self):
+        order = {
+            'seller': self.seller.id, 'delivery_method': 'pickup',
+            'items': [{'product_id': self.product.id, 'quantity': 2}],
+        }
+        first = self.post('/api/v1/orders/', order, 'order-1')
+        retry = self.post('/api/v1/orders/', order, 'order-1')
+        self.assertEqual((first.status_code, retry.status_code), (201, 201))
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, Decimal('8'))
+
+        order['items'][0]['quantity'] = 3
+        self.assertEqual(self.post('/api/v1/orders/', order, 'order-1').status_code, 422)
+
+    def test_cart_retry(self):
+        for _ in range(3):
+            self.assertEqual(self.post('/api/v1/cart/add_item/', {'product_id': self.product.id, 'quantity': 2}, 'add-1').status_code, 200)
+        self.assertEqual(CartItem.objects.get().quantity, Decimal('2'))
+        self.post('/api/v1/cart/add_item/', {'product_id': self.product.id, 'quantity': 2}, 'add-2')
+        self.assertEqual(CartItem.objects.get().quantity, Decimal('4'))
+
+    def test_in_flight_and_failed_requests(self):
+        data = {'product_id': self.product.id}
+        self.post('/api/v1/cart/add_item/', data, 'busy')
+        # As if the first request were still running
+        IdempotencyKey.objects.filter(key='busy').update(status_code=None, response_body=None)
+        self.assertEqual(self.post('/api/v1/cart/add_item/', data, 'busy').status_code, 409)
+
+        # A request that raised keeps no record, so fixing it and retrying runs for real
+        self.assertEqual(self.post('/api/v1/orders/', {'delivery_method': 'pickup'}, 'fix-me').status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.filter(key='fix-me').exists())
+
+
+class OrderListTests(TestCase):
+    """Order lists are split by role and return slim summaries."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user('trader', 'trader@example.com', 'pw')
+        other = User.objects.create_user('other', 'other@example.com', 'pw')
+        self.client.force_authenticate(self.user)
+        product = create_product(other, Category.objects.create(name='Tiles'))
+        for buyer, seller in [(self.user, other), (other, self.user), (other, self.user), (other, other)]:
+            order = Order.objects.create(buyer=buyer, seller=seller, total_amount=Decimal('10'), tax_amount=Decimal('2.10'), delivery_method='pickup')
+            OrderItem.objects.create(order=order, product=product, quantity=Decimal('1'), price_at_purchase=Decimal('10'))
+
+    def rows(self, query=''):
+        response = self.client.get(f'/api/v1/orders/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_roles(self):
+        self.assertEqual(len(self.rows()), 3)
+        self.assertEqual([row['buyer'] for row in self.rows('?role=buyer')], [self.user.id])
+        self.assertEqual({row['seller'] for row in self.rows('?role=seller')}, {self.user.id})
+        self.assertEqual(len(self.rows('?pagination=cursor')), 3)
+        self.assertEqual(self.client.get('/api/v1/orders/?role=admin').status_code, 400)
+
+    def test_summary_rows(self):
+        row = self.rows('?role=buyer')[0]
+        self.assertNotIn('items', row)
+        self.assertEqual(row['item_count'], 1)
+        detail = self.client.get(f"/api/v1/orders/{row['id']}/").json()
+        self.assertEqual(len(detail['items']), 1)
+
+
+class SalesRollupTests(TestCase):
+    """Seller dashboards read daily rollups kept up to date as orders are placed and released."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        self.bricks = create_product(self.seller, Category.objects.create(name='Bricks'), price=Decimal('2.00'))
+        self.tiles = create_product(self.seller, Category.objects.create(name='Tiles'), price=Decimal('5.00'))
+        self.client.force_authenticate(buyer)
+        for lines in [[(self.bricks, 3), (self.tiles, 1)], [(self.tiles, 2)]]:
+            response = self.client.post('/api/v1/orders/', {
+                'seller': self.seller.id, 'delivery_method': 'pickup',
+                'items': [{'product_id': product.id, 'quantity': quantity} for product, quantity in lines],
+            }, format='json')
+            self.assertEqual(response.status_code, 201)
+        self.client.force_authenticate(self.seller)
+
+    def rollups(self):
+        return [
+            sorted(model.objects.values_list(*fields))
+            for model, fields in [
+                (SellerDailySales, ('day', 'orders', 'units', 'revenue', 'released_orders', 'released_revenue')),
+                (SellerCategorySales, ('day', 'category_id', 'orders', 'units', 'revenue')),
+                (SellerProductSales, ('day', 'product_id', 'orders', 'units', 'revenue')),
+            ]
+        ]
+
+    def test_summary(self):
+        order = Order.objects.order_by('pk').first()
+        order.escrow_status = 'released'
+        order.save(update_fields=['escrow_status'])
+
+        summary = self.client.get('/api/v1/sales/summary/').json()
+        self.assertEqual(len(summary['days']), 30)
+        self.assertEqual(summary['totals'], {
+            'orders': 2, 'units': '6.00', 'revenue': '21.00', 'released_orders': 1, 'released_revenue': '11.00',
+        })
+        self.assertEqual([(row['name'], row['orders'], row['revenue']) for row in summary['categories']],
+                         [('Tiles', 2, '15.00'), ('Bricks', 1, '6.00')])
+        self.assertEqual(summary['products'][0]['id'], self.tiles.id)
+        self.assertEqual(self.client.get('/api/v1/sales/summary/?start=2024-02-30').status_code, 400)
+
+    def test_backfill_matches_incremental_rollups(self):
+        incremental = self.rollups()
+        sales.backfill()
+        self.assertEqual(self.rollups(), incremental)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/v1/sales/summary/?start=2020-01-01')
+        self.assertLessEqual(len(queries.captured_queries), 3)
+
+    def test_backfill_dates_releases_by_release_time(self):
+        order = Order.objects.order_by('pk').first()
+        order.escrow_status = 'released'
+        order.save(update_fields=['escrow_status'])
+        released_at = Order.objects.get(pk=order.pk).escrow_released_at
+        self.assertIsNotNone(released_at)
+
+        # A later edit must not move the release to another day
+        Order.objects.filter(pk=order.pk).update(updated_at=released_at + timedelta(days=3))
+        incremental = self.rollups()
+        sales.backfill()
+        self.assertEqual(self.rollups(), incremental)
+        self.assertEqual(
+            list(SellerDailySales.objects.filter(released_orders=1).values_list('day', flat=True)),
+            [timezone.localdate(released_at)]
+        )
+
+        order.escrow_status = 'disputed'
+        order.save(update_fields=['escrow_status'])
+        self.assertIsNone(Order.objects.get(pk=order.pk).escrow_released_at)
+        self.assertFalse(SellerDailySales.objects.filter(released_orders__gt=0).exists())
+
+
+class ProjectTotalsTests(TestCase):
+    """Project totals and budget use come from one aggregate query."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        seller = User.objects.create_user('seller', 'seller@example.com', 'pw')
+        self.client.force_authenticate(self.buyer)
+        for index in range(5):
+            project = Project.objects.create(buyer=self.buyer, name=f'Loft {index}', budget=Decimal('200') if index else None)
+            for amount in ('50.00', '25.50'):
+                Order.objects.create(buyer=self.buyer, seller=seller, project=project, total_amount=Decimal(amount),
+                                     tax_amount=Decimal('0'), delivery_method='pickup')
+
+    def test_list_in_constant_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/projects/')
+        rows = {row['name']: row for row in response.json()['results']}
+        self.assertLessEqual(len(queries.captured_queries), 2)
+        self.assertEqual(
+            [rows['Loft 1'][field] for field in ('total_spent', 'order_count', 'budget_remaining', 'budget_used_percent')],
+            ['75.50', 2, '124.50', 38]
+        )
+        self.assertEqual((rows['Loft 0']['budget_remaining'], rows['Loft 0']['budget_used_percent']), (None, None))
+
+    def test_new_project(self):
+        response = self.client.post('/api/v1/projects/', {'name': 'Barn', 'budget': '1000'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.json()['total_spent'], response.json()['order_count']), ('0.00', 0))
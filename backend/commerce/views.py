@@ -1,40 +1,95 @@
+from datetime import timedelta
+
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
+from django.db.models import Count, OuterRef, Prefetch, Q, Subquery, prefetch_related_objects
+from django.db.models.functions import Coalesce
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from .models import Category, Product, Order, Cart, CartItem, Wishlist, Project, ProductAlert, Kit, Flag, Dispute
+from django.utils.dateparse import parse_date
+from .models import Category, Product, Order, OrderItem, Cart, CartItem, Wishlist, Project, ProductAlert, Kit, KitReservation, Flag, Dispute
 from .serializers import (
     CategorySerializer, ProductSerializer, ProductListSerializer, 
-    OrderSerializer, OrderCreateSerializer, CartSerializer, 
-    CartItemSerializer, WishlistSerializer, ProjectSerializer,
-    ProductAlertSerializer, KitSerializer,
+    OrderSerializer, OrderSummarySerializer, OrderCreateSerializer, CartSerializer, 
+    CheckoutSerializer, WishlistSerializer, ProjectSerializer,
+    ProductAlertSerializer, AlertMatchSerializer, KitSerializer, KitReservationSerializer,
     FlagSerializer, FlagCreateSerializer, FlagUpdateSerializer,
     DisputeSerializer, DisputeCreateSerializer, DisputeEvidenceSerializer, DisputeResolveSerializer
 )
+from . import counters, exports, imports, kits, matching, sales
+from .caching import CachedResponseMixin
+from .conditional import ConditionalGetMixin
+from .facets import product_facets
+from .filters import MinSavingsFilter
+from .geo import NearbyFilter
+from .idempotency import IdempotencyMixin
+from .pagination import CatalogPagination
+from .search import FullTextSearchFilter
+from .streaming import streaming_json_response
+
+
+def buffered_increment(queryset, pk, field):
+    """Buffer a counter increment and respond with the stored value plus unflushed deltas."""
+    try:
+        pk = int(pk)
+    except (TypeError, ValueError):
+        raise Http404
+    stored = queryset.filter(pk=pk).values_list(field, flat=True).first()
+    if stored is None:
+        raise Http404
+    counters.incr(queryset.model, pk, field)
+    return Response({field: stored + counters.pending(queryset.model, pk, field)})
+
 
+def export_or_error(request, queryset, columns, name):
+    """Stream an export in the ``?output=`` format (csv by default)."""
+    fmt = request.query_params.get('output', 'csv')
+    if fmt not in exports.FORMATS:
+        return Response({'error': f"output must be one of: {', '.join(exports.FORMATS)}"}, status=400)
+    return exports.export_response(queryset, columns, fmt, name)
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+
+class CategoryViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     """API endpoint for categories."""
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     """API endpoint for products with filtering and search."""
-    queryset = Product.objects.filter(status='active').select_related('category', 'seller').prefetch_related('images')
+    queryset = Product.objects.filter(status='active').select_related('category', 'seller', 'primary_image')
     serializer_class = ProductSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = CatalogPagination
+    # NearbyFilter and FullTextSearchFilter must follow OrderingFilter so their orderings win
+    filter_backends = [DjangoFilterBackend, MinSavingsFilter, filters.OrderingFilter, NearbyFilter, FullTextSearchFilter]
     filterset_fields = ['category', 'condition', 'status', 'seller']
-    search_fields = ['title', 'description', 'category__name']
-    ordering_fields = ['created_at', 'price', 'views']
+    ordering_fields = ['created_at', 'price', 'views', 'savings_percentage']
     ordering = ['-created_at']
+    validator_counters = ('views', 'saves')
+    
+    cache_actions = ('list', 'retrieve', 'facets', 'similar')
+    
+    def is_cacheable(self, request):
+        # Only logged-out browsing is cached; facet counts are the same for everyone
+        return super().is_cacheable(request) and (self.action == 'facets' or not request.user.is_authenticated)
+    
+    list_actions = ('list', 'by_category', 'similar')
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # Lists only show primary_image; the full image set is for ProductSerializer
+        if self.action not in self.list_actions:
+            queryset = queryset.prefetch_related('images')
+        return queryset
     
     def get_serializer_class(self):
-        if self.action == 'list':
+        if self.action in self.list_actions:
             return ProductListSerializer
         return ProductSerializer
     
@@ -44,66 +99,155 @@ class ProductViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def increment_views(self, request, pk=None):
         """Increment product view count."""
+        return buffered_increment(self.get_queryset(), pk, 'views')
+    
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """Precomputed similar listings (see commerce.similarity), most similar first."""
+        return self.cached_response(self._similar, request, pk=pk)
+    
+    def _similar(self, request, pk=None):
         product = self.get_object()
-        product.views += 1
-        product.save(update_fields=['views'])
-        return Response({'views': product.views})
+        similar = self.get_queryset().filter(similar_to__product=product).order_by('similar_to__rank')
+        serializer = self.get_serializer(similar, many=True)
+        return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Counts per category, condition, unit and price bucket for the current filters."""
+        return self.cached_response(self._facets, request)
+    
+    def _facets(self, request):
+        return Response(product_facets(self.filter_queryset(self.get_queryset())))
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def export(self, request):
+        """Stream all of the current user's listings as CSV or NDJSON (?output=)."""
+        return export_or_error(request, Product.objects.filter(seller=request.user), exports.PRODUCT_COLUMNS, 'products')
+    
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        """Create products for the current user from an uploaded CSV or NDJSON manifest."""
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response({'error': 'file required'}, status=400)
+        fmt = request.data.get('format') or imports.detect_format(upload.name)
+        if fmt not in imports.FORMATS:
+            return Response({'error': f"format must be one of: {', '.join(imports.FORMATS)}"}, status=400)
+        
+        importer = imports.ProductImporter(request.user)
+        try:
+            report = importer.run(imports.iter_records(imports.text_stream(upload), fmt))
+        except imports.ImportFileError as exc:
+            return Response({**importer.report(), 'error': str(exc)}, status=400)
+        return Response(report, status=201 if report['created'] else 400)
     
     @action(detail=False, methods=['get'])
     def by_category(self, request):
-        """Get products grouped by category."""
+        """Get products of a category, paginated or streamed with ?stream=true."""
         category_id = request.query_params.get('category_id')
-        if category_id:
-            products = self.get_queryset().filter(category_id=category_id)
-            serializer = self.get_serializer(products, many=True)
-            return Response(serializer.data)
-        return Response({'error': 'category_id required'}, status=400)
+        if not category_id:
+            return Response({'error': 'category_id required'}, status=400)
+        if not category_id.isdigit():
+            return Response({'error': 'category_id must be an integer'}, status=400)
+        products = self.filter_queryset(self.get_queryset().filter(category_id=category_id))
+        
+        if request.query_params.get('stream') in ('1', 'true'):
+            return streaming_json_response(products, self.get_serializer_class(), self.get_serializer_context())
+        
+        page = self.paginate_queryset(products)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(IdempotencyMixin, viewsets.ModelViewSet):
     """API endpoint for orders."""
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CatalogPagination
+    
+    roles = ('buyer', 'seller')
     
     def get_queryset(self):
         user = self.request.user
+        role = self.request.query_params.get('role')
         # Users can see orders where they are buyer or seller
-        return Order.objects.filter(
-            Q(buyer=user) | Q(seller=user)
-        ).select_related('buyer', 'seller').prefetch_related('items__product')
+        if role in self.roles:
+            orders = Order.objects.filter(**{role: user})
+        elif role:
+            raise ValidationError({'role': f"Must be one of: {', '.join(self.roles)}."})
+        else:
+            # Both roles: each index narrows its side, but the merged rows need a sort
+            orders = Order.objects.filter(Q(buyer=user) | Q(seller=user))
+        orders = orders.select_related('buyer', 'seller', 'project')
+        if self.action == 'list':
+            item_count = OrderItem.objects.filter(order=OuterRef('pk')).values('order').annotate(
+                count=Count('pk')
+            ).values('count')
+            return orders.annotate(item_count=Coalesce(Subquery(item_count), 0))
+        return orders.prefetch_related('items__product')
     
     def get_serializer_class(self):
         if self.action == 'create':
             return OrderCreateSerializer
+        if self.action == 'list':
+            return OrderSummarySerializer
         return OrderSerializer
     
     def create(self, request, *args, **kwargs):
-        """Create order with items."""
+        """Create order with items; retries with the same Idempotency-Key replay the first response."""
+        return self.idempotent_response(self._create, request, *args, **kwargs)
+    
+    def _create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
         order = serializer.save()
         
-        # Clear cart after successful order
-        cart = Cart.objects.filter(user=request.user).first()
-        if cart:
-            cart.items.all().delete()
+        # Drop the purchased products from the cart; lines for other sellers stay
+        CartItem.objects.filter(
+            cart__user=request.user, product_id__in=[item['product_id'] for item in serializer.validated_data['items']]
+        ).delete()
         
+        order = self.get_queryset().get(pk=order.pk)
         return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
+    
+    def export_queryset(self, model, prefix=''):
+        user = self.request.user
+        return model.objects.filter(Q(**{f'{prefix}buyer': user}) | Q(**{f'{prefix}seller': user}))
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream the current user's orders as CSV or NDJSON (?output=)."""
+        return export_or_error(request, self.export_queryset(Order), exports.ORDER_COLUMNS, 'orders')
+    
+    @action(detail=False, methods=['get'])
+    def export_items(self, request):
+        """Stream the line items of the current user's orders as CSV or NDJSON (?output=)."""
+        return export_or_error(request, self.export_queryset(OrderItem, 'order__'), exports.ORDER_ITEM_COLUMNS, 'order-items')
 
 
-class CartViewSet(viewsets.ViewSet):
+class CartViewSet(IdempotencyMixin, viewsets.ViewSet):
     """API endpoint for shopping cart."""
     permission_classes = [IsAuthenticated]
     
+    def serialize(self, cart):
+        """Serialize a cart, loading its items, products and images in one query."""
+        items = CartItem.objects.select_related('product__primary_image')
+        prefetch_related_objects([cart], Prefetch('items', queryset=items))
+        return CartSerializer(cart)
+    
     def list(self, request):
         """Get current user's cart."""
         cart, created = Cart.objects.get_or_create(user=request.user)
-        serializer = CartSerializer(cart)
+        serializer = self.serialize(cart)
         return Response(serializer.data)
     
     @action(detail=False, methods=['post'])
     def add_item(self, request):
-        """Add item to cart."""
+        """Add item to cart; retries with the same Idempotency-Key replay the first response."""
+        return self.idempotent_response(self._add_item, request)
+    
+    def _add_item(self, request):
         cart, created = Cart.objects.get_or_create(user=request.user)
         product_id = request.data.get('product_id')
         quantity = request.data.get('quantity', 1)
@@ -125,7 +269,7 @@ class CartViewSet(viewsets.ViewSet):
             cart_item.quantity += quantity
             cart_item.save()
         
-        serializer = CartSerializer(cart)
+        serializer = self.serialize(cart)
         return Response(serializer.data)
     
     @action(detail=False, methods=['post'])
@@ -149,7 +293,7 @@ class CartViewSet(viewsets.ViewSet):
             cart_item.quantity = quantity
             cart_item.save()
         
-        serializer = CartSerializer(cart)
+        serializer = self.serialize(cart)
         return Response(serializer.data)
     
     @action(detail=False, methods=['post'])
@@ -164,7 +308,7 @@ class CartViewSet(viewsets.ViewSet):
         cart_item = get_object_or_404(CartItem, cart=cart, product_id=product_id)
         cart_item.delete()
         
-        serializer = CartSerializer(cart)
+        serializer = self.serialize(cart)
         return Response(serializer.data)
     
     @action(detail=False, methods=['post'])
@@ -173,8 +317,53 @@ class CartViewSet(viewsets.ViewSet):
         cart = get_object_or_404(Cart, user=request.user)
         cart.items.all().delete()
         
-        serializer = CartSerializer(cart)
+        serializer = self.serialize(cart)
         return Response(serializer.data)
+    
+    @action(detail=False, methods=['post'])
+    def checkout(self, request):
+        """Order the whole cart in one request: one order per seller, created together."""
+        return self.idempotent_response(self._checkout, request)
+    
+    def _checkout(self, request):
+        serializer = CheckoutSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        placed = serializer.save()
+        
+        placed = Order.objects.filter(pk__in=[order.pk for order in placed]).select_related(
+            'buyer', 'seller', 'project'
+        ).prefetch_related('items__product').order_by('seller_id')
+        return Response(OrderSerializer(placed, many=True).data, status=status.HTTP_201_CREATED)
+
+
+class SalesViewSet(viewsets.ViewSet):
+    """API endpoint for the current seller's sales analytics."""
+    permission_classes = [IsAuthenticated]
+    max_days = 731
+    
+    def parse_day(self, request, name, default):
+        value = request.query_params.get(name)
+        if not value:
+            return default
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise ValidationError({name: 'Must be a date (YYYY-MM-DD).'})
+        return day
+    
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """Revenue, units and orders by day, category and product (?start=&end=, last 30 days by default)."""
+        end = self.parse_day(request, 'end', timezone.localdate())
+        start = self.parse_day(request, 'start', end - timedelta(days=29))
+        if start > end or (end - start).days >= self.max_days:
+            return Response(
+                {'error': f'start must not be after end, and the range at most {self.max_days} days'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(sales.summary(request.user, start, end))
 
 
 class WishlistViewSet(viewsets.ModelViewSet):
@@ -183,10 +372,18 @@ class WishlistViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return Wishlist.objects.filter(user=self.request.user).select_related('product')
+        return Wishlist.objects.filter(user=self.request.user).select_related(
+            'product__category', 'product__seller', 'product__primary_image'
+        )
     
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        wishlist_item = serializer.save(user=self.request.user)
+        # Product.saves counts the wishlists holding the product
+        counters.incr(Product, wishlist_item.product_id, 'saves')
+    
+    def perform_destroy(self, instance):
+        counters.incr(Product, instance.product_id, 'saves', -1)
+        instance.delete()
     
     @action(detail=False, methods=['post'])
     def toggle(self, request):
@@ -200,10 +397,11 @@ class WishlistViewSet(viewsets.ModelViewSet):
         wishlist_item = Wishlist.objects.filter(user=request.user, product=product).first()
         
         if wishlist_item:
-            wishlist_item.delete()
+            self.perform_destroy(wishlist_item)
             return Response({'saved': False, 'message': 'Product removed from wishlist'})
         else:
             Wishlist.objects.create(user=request.user, product=product)
+            counters.incr(Product, product.id, 'saves')
             return Response({'saved': True, 'message': 'Product added to wishlist'})
 
 
@@ -213,10 +411,13 @@ class ProjectViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return Project.objects.filter(buyer=self.request.user).prefetch_related('orders')
+        # Aggregating queries drop Meta.ordering, so order explicitly
+        return Project.objects.filter(buyer=self.request.user).select_related('buyer').with_totals().order_by('-created_at')
     
     def perform_create(self, serializer):
         serializer.save(buyer=self.request.user)
+        # Reload with the totals annotated
+        serializer.instance = self.get_queryset().get(pk=serializer.instance.pk)
     
     @action(detail=True, methods=['get'])
     def orders(self, request, pk=None):
@@ -241,76 +442,56 @@ class ProductAlertViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def check_matches(self, request):
         """Check for products matching active alerts."""
-        from math import radians, cos, sin, asin, sqrt
-        
-        alerts = ProductAlert.objects.filter(user=request.user, is_active=True)
-        matches = []
-        
-        for alert in alerts:
-            # Build query
-            query = Q(status='active')
-            
-            if alert.keywords:
-                query &= (Q(title__icontains=alert.keywords) | Q(description__icontains=alert.keywords))
-            
-            if alert.category:
-                query &= Q(category=alert.category)
-            
-            if alert.max_price:
-                query &= Q(price__lte=alert.max_price)
-            
-            if alert.condition:
-                query &= Q(condition=alert.condition)
-            
-            # Location filter (if provided)
-            products = Product.objects.filter(query)
-            
-            if alert.location_lat and alert.location_long:
-                # Filter by radius
-                def haversine(lon1, lat1, lon2, lat2):
-                    """Calculate distance between two points."""
-                    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-                    dlon = lon2 - lon1
-                    dlat = lat2 - lat1
-                    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-                    c = 2 * asin(sqrt(a))
-                    km = 6371 * c
-                    return km
-                
-                filtered_products = []
-                for product in products:
-                    if product.location_lat and product.location_long:
-                        distance = haversine(
-                            float(alert.location_long),
-                            float(alert.location_lat),
-                            float(product.location_long),
-                            float(product.location_lat)
-                        )
-                        if distance <= alert.radius_km:
-                            filtered_products.append(product)
-                products = filtered_products
-            else:
-                products = list(products)
-            
-            if products:
-                matches.append({
-                    'alert_id': alert.id,
-                    'alert_name': str(alert),
-                    'products': ProductListSerializer(products, many=True).data
-                })
+        alerts = list(
+            ProductAlert.objects.filter(user=request.user, is_active=True).select_related('category', 'user')
+        )
+        frame = matching.ProductFrame.load(matching.candidate_queryset(alerts))
+        matched = matching.match_alerts(alerts, frame)
+        
+        # Serialize every matched product once, however many alerts it matched
+        product_ids = set().union(*(ids.tolist() for ids in matched.values()))
+        products = Product.objects.filter(id__in=product_ids).select_related(
+            'category', 'seller', 'primary_image'
+        )
+        serialized = {item['id']: item for item in ProductListSerializer(products, many=True).data}
         
+        matches = [
+            {
+                'alert_id': alert.id,
+                'alert_name': str(alert),
+                # Skips products deleted since the frame was loaded
+                'products': [
+                    serialized[product_id] for product_id in matched[alert.id].tolist() if product_id in serialized
+                ]
+            }
+            for alert in alerts if len(matched[alert.id])
+        ]
         return Response({'matches': matches})
+    
+    @action(detail=True, methods=['get'])
+    def matches(self, request, pk=None):
+        """Get products recorded against this alert by instant matching."""
+        alert = self.get_object()
+        matches = alert.matches.select_related('product__category', 'product__seller', 'product__primary_image')
+        page = self.paginate_queryset(matches)
+        if page is not None:
+            return self.get_paginated_response(AlertMatchSerializer(page, many=True).data)
+        return Response(AlertMatchSerializer(matches, many=True).data)
 
 
-class KitViewSet(viewsets.ModelViewSet):
+class KitViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """API endpoint for limited-time kits."""
     queryset = Kit.objects.all()
     serializer_class = KitSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = CatalogPagination
+    filter_backends = [DjangoFilterBackend, MinSavingsFilter, filters.SearchFilter, filters.OrderingFilter, NearbyFilter]
     filterset_fields = ['kit_type', 'status']
     search_fields = ['title', 'description']
-    ordering_fields = ['start_date', 'end_date', 'price', 'created_at']
+    ordering_fields = ['start_date', 'end_date', 'price', 'created_at', 'savings_percentage']
     ordering = ['-created_at']
+    validator_counters = ('views', 'saves')
+    # is_available depends on the clock
+    validator_window = ('start_date', 'end_date')
     
     @action(detail=False, methods=['get'])
     def active(self, request):
@@ -339,10 +520,57 @@ class KitViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def increment_views(self, request, pk=None):
         """Increment kit view count."""
-        kit = self.get_object()
-        kit.views += 1
-        kit.save(update_fields=['views'])
-        return Response({'views': kit.views})
+        return buffered_increment(self.get_queryset(), pk, 'views')
+    
+    def reservation_response(self, reservation, status_code=status.HTTP_200_OK):
+        reservation = KitReservation.objects.select_related('kit').get(pk=reservation.pk)
+        return Response(KitReservationSerializer(reservation).data, status=status_code)
+    
+    def get_reservation(self, request, pk):
+        reservation_id = request.data.get('reservation')
+        if not str(reservation_id or '').isdigit():
+            return None
+        return get_object_or_404(KitReservation, pk=reservation_id, kit_id=pk, buyer=request.user)
+    
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def reserve(self, request, pk=None):
+        """Hold units of the kit for a few minutes; answers 429 with Retry-After during a rush."""
+        if not str(pk).isdigit():
+            raise Http404
+        quantity = request.data.get('quantity', 1)
+        if not str(quantity).isdigit() or int(quantity) <= 0:
+            return Response({'error': 'quantity must be a positive integer'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            reservation = kits.claim(int(pk), request.user, int(quantity))
+        except Kit.DoesNotExist:
+            raise Http404
+        except kits.KitUnavailable as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
+        return self.reservation_response(reservation, status.HTTP_201_CREATED)
+    
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def purchase(self, request, pk=None):
+        """Buy a held reservation of this kit."""
+        reservation = self.get_reservation(request, pk)
+        if reservation is None:
+            return Response({'error': 'reservation is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            reservation = kits.purchase(reservation)
+        except kits.KitUnavailable as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
+        return self.reservation_response(reservation)
+    
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def release(self, request, pk=None):
+        """Give up a held reservation of this kit."""
+        reservation = self.get_reservation(request, pk)
+        if reservation is None:
+            return Response({'error': 'reservation is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            reservation = kits.release(reservation)
+        except kits.KitUnavailable as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
+        return self.reservation_response(reservation)
 
 
 class FlagViewSet(viewsets.ModelViewSet):
@@ -107,6 +107,36 @@ DATABASES = {
 }
 
 
+# Caches
+# The catalog cache backs commerce.caching and must be shared by all worker
+# processes, or an invalidation only reaches the worker that handled the write.
+# Point CATALOG_CACHE_URL at Redis; otherwise production falls back to the
+# database cache (``manage.py createcachetable``) and development to local memory.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+    },
+}
+
+if os.environ.get('CATALOG_CACHE_URL'):
+    CACHES['catalog'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['CATALOG_CACHE_URL'],
+    }
+elif IS_PRODUCTION:
+    CACHES['catalog'] = {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'catalog_cache',
+    }
+
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', 300))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -182,11 +212,15 @@ CORS_ALLOW_HEADERS = [
     'authorization',
     'content-type',
     'dnt',
+    'idempotency-key',
     'origin',
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
 ]
+CORS_EXPOSE_HEADERS = [
+    'idempotent-replayed',
+]
 
 # Security settings for production
 if IS_PRODUCTION:
@@ -242,3 +276,23 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 }
 
+
+# Write-behind view/save counters (commerce.counters), in seconds; 0 writes through
+COUNTER_FLUSH_INTERVAL = int(os.environ.get('COUNTER_FLUSH_INTERVAL', 5))
+
+# Threads rendering ProductImage thumbnail/medium variants (commerce.images); 0 renders inline
+IMAGE_PROCESSING_WORKERS = int(os.environ.get('IMAGE_PROCESSING_WORKERS', 2))
+
+# Market price estimation (commerce.pricing): quantile of observed prices, and an
+# optional CSV price list standing in for an external price feed
+MARKET_PRICE_QUANTILE = float(os.environ.get('MARKET_PRICE_QUANTILE', 0.5))
+MARKET_PRICE_LIST = os.environ.get('MARKET_PRICE_LIST') or None
+
+# Kit flash sales (commerce.kits): minutes a reservation holds stock, and claims
+# admitted per kit at once (0 disables the gate; needs a shared default cache
+# to hold across worker processes)
+KIT_RESERVATION_MINUTES = int(os.environ.get('KIT_RESERVATION_MINUTES', 10))
+KIT_ADMISSION_LIMIT = int(os.environ.get('KIT_ADMISSION_LIMIT', 16))
+
+# Hours a stored Idempotency-Key response is replayed for (commerce.idempotency)
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24))
@@ -11,7 +11,7 @@ from rest_framework_simplejwt.views import (
 from commerce.views import (
     CategoryViewSet, ProductViewSet, OrderViewSet, CartViewSet,
     WishlistViewSet, ProjectViewSet, ProductAlertViewSet, KitViewSet,
-    FlagViewSet, DisputeViewSet
+    FlagViewSet, DisputeViewSet, SalesViewSet
 )
 from users.views import UserViewSet
 
@@ -27,6 +27,7 @@ router.register(r'alerts', ProductAlertViewSet, basename='alert')
 router.register(r'kits', KitViewSet, basename='kit')
 router.register(r'flags', FlagViewSet, basename='flag')
 router.register(r'disputes', DisputeViewSet, basename='dispute')
+router.register(r'sales', SalesViewSet, basename='sales')
 router.register(r'users', UserViewSet)
 
 urlpatterns = [